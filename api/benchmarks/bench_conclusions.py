@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Conclusions extraction benchmark
+
+Generates a synthetic corpus of transcripts and times a full (forced) run of
+process_conversations() at several worker counts. The outputs of every run
+are hashed and compared against the single-process run to check the batch
+mode produces identical results.
+
+    python benchmarks/bench_conclusions.py --files 10000 --workers 1 2 4 8
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import hashlib
+import json
+import random
+import tempfile
+import time
+
+from envelope.conclusions import ConclusionsManifest, process_conversations
+
+
+def make_corpus(directory: str, files: int, turns: int, seed: int = 0):
+    rng = random.Random(seed)
+    names = []
+    for i in range(files):
+        history = []
+        for t in range(rng.randint(turns // 2, turns)):
+            history.append({"role": "user", "content": "I grew up near the harbour. " * rng.randint(2, 20)})
+            reply = "Thank you for sharing. " * rng.randint(2, 10)
+            if rng.random() < 0.5:
+                reply += f"<response>Fact {t} about session {i}: " + "details " * rng.randint(1, 30) + "</response>"
+            history.append({"role": "assistant", "content": reply + " What happened next?"})
+        name = f"conversation_bench_{i:06}.json"
+        with open(os.path.join(directory, name), 'w', encoding='utf-8') as f:
+            json.dump(history, f, indent=2, ensure_ascii=False)
+        names.append(name)
+    return names
+
+
+def outputs_digest(results) -> str:
+    digest = hashlib.sha256()
+    for source, output, count in results:
+        digest.update(f"{source}|{output}|{count}\n".encode())
+        with open(output, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark conclusions extraction across worker counts')
+    parser.add_argument('--files', type=int, default=10000, help='Number of synthetic transcripts')
+    parser.add_argument('--turns', type=int, default=30, help='Maximum turns per transcript')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, os.cpu_count()])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        start = time.perf_counter()
+        files = make_corpus(tmp, args.files, args.turns)
+        corpus_mb = sum(os.path.getsize(f) for f in files) / 1e6
+        print(f"Generated {len(files)} transcripts ({corpus_mb:.1f} MB) in {time.perf_counter() - start:.1f}s")
+        print(f"{'workers':>7} {'seconds':>8} {'files/s':>9} {'speedup':>8}  output")
+
+        baseline = reference = None
+        for workers in sorted(set(args.workers)):
+            start = time.perf_counter()
+            run = process_conversations(files, manifest=ConclusionsManifest('bench_manifest.json'),
+                                        force=True, workers=workers)
+            elapsed = time.perf_counter() - start
+            digest = outputs_digest(run['results'])
+            baseline = baseline or elapsed
+            reference = reference or digest
+            print(f"{workers:>7} {elapsed:>8.2f} {len(files) / elapsed:>9.0f} {baseline / elapsed:>7.2f}x  "
+                  f"{'identical' if digest == reference else 'DIFFERENT'}")
+
+        start = time.perf_counter()
+        run = process_conversations(files, manifest=ConclusionsManifest('bench_manifest.json'))
+        print(f"Incremental re-run: {run['skipped']} skipped, {run['processed']} processed "
+              f"in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+System prompt size with and without question-bank slicing
+
+Simulates an interview in which every assistant turn records one answer in
+<response> tags and reports, per turn, the system prompt input tokens sent
+with the full question bank and with the sliced bank, plus the total saved
+over the interview. Tokens are estimated at 4 characters per token, or
+counted by the API with --count-tokens (needs ANTHROPIC_API_KEY).
+
+    python benchmarks/bench_question_slicing.py --variant cli --turns 200
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import functools
+
+from envelope.prompts import SlicedPrompt, VARIANTS
+from envelope.retrieval import estimate_tokens
+
+
+def token_counter(exact: bool):
+    if not exact:
+        return estimate_tokens
+    import anthropic
+    client = anthropic.Anthropic()
+
+    @functools.lru_cache(maxsize=None)
+    def count(system: str) -> int:
+        result = client.messages.count_tokens(model="claude-3-7-sonnet-20250219", system=system,
+                                              messages=[{"role": "user", "content": "Hello"}])
+        return result.input_tokens
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure system prompt tokens saved by question-bank slicing')
+    parser.add_argument('--variant', default='cli', choices=sorted(VARIANTS))
+    parser.add_argument('--turns', type=int, default=200, help='Interview turns to simulate')
+    parser.add_argument('--lookahead', type=int, default=1)
+    parser.add_argument('--coverage', type=float, default=0.5)
+    parser.add_argument('--group-by', default='Category', choices=['Category', 'Field'])
+    parser.add_argument('--count-tokens', action='store_true', help='Count tokens with the API instead of estimating')
+    args = parser.parse_args()
+
+    prompts = SlicedPrompt(args.variant, lookahead=args.lookahead, coverage=args.coverage, group_by=args.group_by)
+    count = token_counter(args.count_tokens)
+    full_tokens = count(prompts.full)
+
+    print(f"{args.variant}: {len(prompts.bank.questions)} questions in {len(prompts.bank)} groups "
+          f"({args.group_by}), full prompt {full_tokens} tokens")
+    print(f"{'turn':>5} {'group':<28} {'sliced':>7} {'saved':>7}")
+
+    history = []
+    full_total = sliced_total = 0
+    last_position = None
+    for turn in range(1, args.turns + 1):
+        history.append({"role": "user", "content": f"Answer {turn}"})
+        position = prompts.position(history)
+        sliced_tokens = count(prompts.for_history(history))
+        full_total += full_tokens
+        sliced_total += sliced_tokens
+        if position != last_position:
+            group = prompts.bank.groups[position][0] if prompts.slicing else '(not sliced)'
+            print(f"{turn:>5} {group[:28]:<28} {sliced_tokens:>7} {full_tokens - sliced_tokens:>7}")
+            last_position = position
+        history.append({"role": "assistant", "content": f"Noted. <response>Answer {turn}</response> Next question?"})
+
+    saved = full_total - sliced_total
+    print(f"\nOver {args.turns} turns: {full_total} system prompt tokens with the full bank, {sliced_total} sliced, "
+          f"{saved} saved ({saved / full_total:.0%}, {saved / args.turns:.0f} per turn)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Input tokens per turn with and without the rolling context
+
+Simulates a long interview (answers of 40-200 words, replies recording one
+<response> note each) and reports, every --every turns, the estimated input
+tokens of the full history and of the messages RollingContext sends in its
+place, plus the totals over the interview. The system prompt is the same in
+both and left out. The summary is stood in for by the recorded notes of the
+folded turns, or written by Claude with --llm (needs ANTHROPIC_API_KEY).
+
+    python benchmarks/bench_rolling_context.py --turns 200
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import random
+import re
+
+from envelope.context import AnthropicSummarizer, RollingContext
+
+WORDS = "we lived near the river and my father worked at the mill every summer my sister and I".split()
+
+
+def notes_summary(summary, messages):
+    """Stand-in summary: the notes the interviewer recorded in the folded turns."""
+    notes = [note for m in messages if m['role'] == 'assistant'
+             for note in re.findall(r'<response>(.*?)</response>', m['content'], re.DOTALL)]
+    return "\n".join(filter(None, [summary] + notes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure input tokens saved by the rolling context')
+    parser.add_argument('--turns', type=int, default=200, help='Interview turns to simulate')
+    parser.add_argument('--keep-turns', type=int, default=10)
+    parser.add_argument('--batch-turns', type=int, default=6)
+    parser.add_argument('--every', type=int, default=20, help='Print a row every this many turns')
+    parser.add_argument('--llm', action='store_true', help='Summarise with Claude instead of the recorded notes')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.llm:
+        import anthropic
+        summarize = AnthropicSummarizer(anthropic.Anthropic())
+    else:
+        summarize = notes_summary
+    context = RollingContext(summarize, keep_turns=args.keep_turns, batch_turns=args.batch_turns)
+    rng = random.Random(args.seed)
+    conversation = {'history': []}
+
+    print(f"{'turn':>5} {'full':>8} {'sent':>8} {'saved':>6}")
+    full_total = sent_total = 0
+    for turn in range(1, args.turns + 1):
+        answer = " ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 200)))
+        conversation['history'].append({"role": "user", "content": f"{answer}."})
+        context.messages('bench', conversation)
+        full, sent = conversation['context']['history_tokens'], conversation['context']['sent_tokens']
+        full_total += full
+        sent_total += sent
+        if turn % args.every == 0 or turn == args.turns:
+            print(f"{turn:>5} {full:>8} {sent:>8} {1 - sent / full:>6.0%}")
+
+        note = " ".join(answer.split()[:15])
+        conversation['history'].append({"role": "assistant", "content": (
+            f"Thank you, that paints a vivid picture. <response>Turn {turn}: {note}.</response> "
+            "Could you tell me more about what happened next, and how it felt at the time?")})
+        # Let the background summary finish so each run is deterministic
+        pending = context.pending('bench')
+        if pending is not None:
+            pending.exception()
+
+    saved = full_total - sent_total
+    print(f"\nOver {args.turns} turns: {full_total} history tokens sent in full, {sent_total} with the rolling "
+          f"context, {saved} saved ({saved / full_total:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Session store latency benchmark
+
+Measures get/put latency of each session store backend for conversations of a
+realistic size (a few dozen turns of a biographer interview).
+
+    python benchmarks/bench_sessions.py --sessions 500 --turns 40
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import random
+import statistics
+import tempfile
+import time
+
+from envelope.sessions import MemorySessionStore, SQLiteSessionStore
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def make_conversation(turns: int):
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"Answer {i}: " + "I remember the house by the sea. " * 8})
+        history.append({"role": "assistant", "content": f"Question {i}: " + "Tell me more about that time. " * 6})
+    return {'history': history, 'started_at': '2024-01-01T00:00:00'}
+
+
+def bench(store, sessions: int, turns: int, operations: int):
+    conversation = make_conversation(turns)
+    ids = [f"bench_{i}" for i in range(sessions)]
+    put_times, get_times = [], []
+
+    for session_id in ids:
+        start = time.perf_counter()
+        store[session_id] = conversation
+        put_times.append(time.perf_counter() - start)
+
+    for _ in range(operations):
+        session_id = random.choice(ids)
+        start = time.perf_counter()
+        store.get(session_id)
+        get_times.append(time.perf_counter() - start)
+
+    return {
+        'put_p50_ms': statistics.median(put_times) * 1000,
+        'put_p95_ms': percentile(put_times, 95) * 1000,
+        'get_p50_ms': statistics.median(get_times) * 1000,
+        'get_p95_ms': percentile(get_times, 95) * 1000,
+        'entries': len(store),
+        'bytes': store.nbytes()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark session store backends')
+    parser.add_argument('--sessions', type=int, default=500, help='Number of sessions to store')
+    parser.add_argument('--turns', type=int, default=40, help='Turns per conversation')
+    parser.add_argument('--operations', type=int, default=2000, help='Number of random gets')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backends = {
+            'memory': MemorySessionStore(),
+            'sqlite': SQLiteSessionStore(path=os.path.join(tmp, 'sessions.sqlite3')),
+        }
+        print(f"{args.sessions} sessions x {args.turns} turns, {args.operations} gets")
+        print(f"{'backend':<8} {'put p50':>9} {'put p95':>9} {'get p50':>9} {'get p95':>9} {'MB':>7}")
+        for name, store in backends.items():
+            r = bench(store, args.sessions, args.turns, args.operations)
+            print(f"{name:<8} {r['put_p50_ms']:>7.3f}ms {r['put_p95_ms']:>7.3f}ms "
+                  f"{r['get_p50_ms']:>7.3f}ms {r['get_p95_ms']:>7.3f}ms {r['bytes'] / 1e6:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Cold-start import profile of a serverless entry point
+
+Imports the module in a fresh interpreter under `python -X importtime`, several
+times, and reports the fastest run: total import time, the slowest top-level
+imports and whether any of the modules the entry point is meant to load
+lazily were pulled in, and lists the repo's own modules it imports. Commit the
+--output report alongside changes to the entry point to keep track of
+cold-start regressions; tests/test_cold_start.py fails when the module list
+in the committed report no longer matches what the entry point imports.
+
+    python benchmarks/import_profile.py index --output benchmarks/import_profile_index.md
+    python benchmarks/import_profile.py index --budget-ms 500   # exits 1 when over budget
+"""
+
+import argparse
+import ast
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from typing import List, Tuple
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules index.py only imports inside the routes that need them
+LAZY_MODULES = ['anthropic', 'pandas', 'langchain', 'langchain_anthropic', 'envelope.assessment',
+                'envelope.conclusions']
+
+LOCAL_HEADING = "## Modules of this repo imported"
+
+LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+PROBE = """
+import sys, time
+sys.path.insert(0, {api_dir!r})
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(repr((elapsed, [m for m in {lazy!r} if m in sys.modules])))
+"""
+
+
+def profile(module: str) -> Tuple[float, List[str], List[Tuple[int, int, int, str]]]:
+    """Import module once in a fresh interpreter; returns (seconds, lazy modules loaded, importtime rows)."""
+    env = dict(os.environ)
+    env.setdefault('ANTHROPIC_API_KEY', 'import-profile')
+    with tempfile.TemporaryDirectory() as tmp:
+        env['JOURNAL_DIR'] = os.path.join(tmp, 'journals')
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', PROBE.format(api_dir=API_DIR, module=module, lazy=LAZY_MODULES)],
+            cwd=tmp, env=env, capture_output=True, text=True, check=True)
+    elapsed, loaded = ast.literal_eval(result.stdout.strip().splitlines()[-1])
+    rows = []
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            rows.append((int(match.group(1)), int(match.group(2)), len(match.group(3)) // 2, match.group(4)))
+    return elapsed, loaded, rows
+
+
+def module_rows(rows, module: str):
+    """The rows of the import tree rooted at module (children are listed before their parent)."""
+    end = max(i for i, row in enumerate(rows) if row[2] == 0 and row[3] == module)
+    start = end
+    while start > 0 and rows[start - 1][2] > 0:
+        start -= 1
+    return rows[start:end + 1]
+
+
+def local_modules(rows) -> List[str]:
+    """The modules of this repo (rather than the standard library or site-packages) among the rows."""
+    return sorted({name for _, _, _, name in rows
+                   if any(os.path.exists(os.path.join(API_DIR, name.split('.')[0] + suffix)) for suffix in ('', '.py'))})
+
+
+def reported_modules(path: str) -> List[str]:
+    """The module list of a report written by render()."""
+    with open(path, encoding='utf-8') as f:
+        section = f.read().split(LOCAL_HEADING, 1)[1]
+    return [line[3:-1] for line in section.splitlines() if line.startswith('- `')]
+
+
+def render(module: str, elapsed: float, loaded: List[str], rows, top: int) -> str:
+    # Leave out what the interpreter imported at start-up (site, encodings, .pth hooks)
+    rows = module_rows(rows, module)
+    direct = sorted((row for row in rows if row[2] == 1), key=lambda row: row[1], reverse=True)
+    own = sorted(rows, key=lambda row: row[0], reverse=True)
+    lines = [
+        f"# Import profile: `{module}`",
+        "",
+        f"Python {sys.version.split()[0]}, fastest of the runs.",
+        "",
+        f"- Total import time: **{elapsed * 1000:.0f} ms**",
+        f"- Modules imported: {len(rows)}",
+        f"- Lazily loaded modules imported at start-up: {', '.join(loaded) if loaded else 'none'}",
+        "",
+        f"## Slowest direct imports of `{module}` (cumulative)",
+        "",
+        "| module | cumulative ms | self ms |",
+        "|---|---:|---:|",
+    ]
+    lines += [f"| {name} | {cumulative / 1000:.1f} | {own_us / 1000:.1f} |" for own_us, cumulative, _, name in direct[:top]]
+    lines += [
+        "",
+        "## Slowest modules (self time)",
+        "",
+        "| module | self ms |",
+        "|---|---:|",
+    ]
+    lines += [f"| {name} | {own_us / 1000:.1f} |" for own_us, _, _, name in own[:top]]
+    lines += ["", LOCAL_HEADING, ""]
+    lines += [f"- `{name}`" for name in local_modules(rows)]
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Profile the import (cold-start) time of an entry point')
+    parser.add_argument('module', nargs='?', default='index', help='Module to import from api/ (default: index)')
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters to try; the fastest is reported')
+    parser.add_argument('--top', type=int, default=15, help='Rows per table')
+    parser.add_argument('--output', help='Write the markdown report here as well')
+    parser.add_argument('--budget-ms', type=float, help='Exit with status 1 if the import takes longer')
+    args = parser.parse_args()
+
+    elapsed, loaded, rows = min((profile(args.module) for _ in range(args.runs)), key=lambda run: run[0])
+    report = render(args.module, elapsed, loaded, rows, args.top)
+    print(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report)
+
+    if args.budget_ms is not None and elapsed * 1000 > args.budget_ms:
+        print(f"Import took {elapsed * 1000:.0f} ms, over the {args.budget_ms:.0f} ms budget")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Concurrent chat load test: async (ASGI) mode vs. the threaded Flask app
+
+Runs many simulated biographer chats at once against a local fake Anthropic
+API that takes --delay seconds per reply. The ASGI app serves them all from
+one event loop; the Flask app is driven by a pool of --threads workers, which
+is how many chats it can have waiting on Claude at any moment.
+
+    python benchmarks/load_async_chat.py --chats 300 --turns 2 --delay 1.0 --threads 4
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from envelope.fake_anthropic import FakeAnthropicServer
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
+
+
+def report(mode, workers, chats, turns, elapsed, latencies, errors):
+    print(f"{mode:>6} {workers:>8} {chats:>6} {elapsed:>8.2f} {chats * turns / elapsed:>8.1f} "
+          f"{statistics.median(latencies) * 1000 if latencies else 0:>8.0f} "
+          f"{percentile(latencies, 0.95) * 1000:>8.0f} {errors:>6}")
+
+
+def new_sessions(module, mode, chats):
+    # /start derives session ids from the clock, so hundreds of starts in one second would collide
+    session_ids = [f"load_{mode}_{i}" for i in range(chats)]
+    for session_id in session_ids:
+        module.active_conversations[session_id] = {'history': [], 'type': 'biographer'}
+    return session_ids
+
+
+async def run_async(asgi_app, session_ids, turns):
+    latencies = []
+    errors = 0
+
+    async def one_chat(http, session_id):
+        nonlocal errors
+        for turn in range(turns):
+            started = time.perf_counter()
+            response = await http.post('/api/biographer/chat', json={'session_id': session_id,
+                                                                     'message': f"Turn {turn}: I grew up by the sea."})
+            latencies.append(time.perf_counter() - started)
+            errors += response.status_code != 200
+        response = await http.post('/api/biographer/end', json={'session_id': session_id})
+        errors += response.status_code != 200
+
+    transport = httpx.ASGITransport(app=asgi_app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://load', timeout=600) as http:
+        started = time.perf_counter()
+        await asyncio.gather(*[one_chat(http, session_id) for session_id in session_ids])
+    return time.perf_counter() - started, latencies, errors
+
+
+def run_threaded(flask_app, session_ids, turns, threads):
+    latencies = []
+    errors = 0
+
+    def one_chat(session_id):
+        nonlocal errors
+        client = flask_app.test_client()
+        for turn in range(turns):
+            started = time.perf_counter()
+            response = client.post('/api/biographer/chat', json={'session_id': session_id,
+                                                                  'message': f"Turn {turn}: I grew up by the sea."})
+            latencies.append(time.perf_counter() - started)
+            errors += response.status_code != 200
+        errors += client.post('/api/biographer/end', json={'session_id': session_id}).status_code != 200
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(one_chat, session_ids))
+    return time.perf_counter() - started, latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the async chat mode against a fake LLM')
+    parser.add_argument('--chats', type=int, default=300, help='Concurrent simulated chats')
+    parser.add_argument('--turns', type=int, default=2, help='Messages per chat')
+    parser.add_argument('--delay', type=float, default=1.0, help='Seconds the fake LLM takes per reply')
+    parser.add_argument('--threads', type=int, default=4, help='Worker threads for the Flask run')
+    parser.add_argument('--skip-threaded', action='store_true', help='Only run the async mode')
+    args = parser.parse_args()
+
+    server = FakeAnthropicServer(first_token_delay=args.delay).start()
+    os.environ['ANTHROPIC_API_KEY'] = 'load-test'
+    os.environ['ANTHROPIC_BASE_URL'] = server.base_url
+    os.chdir(tempfile.mkdtemp(prefix='load_async_chat_'))
+
+    import biographer
+    import biographer_asgi
+
+    print(f"{args.chats} chats x {args.turns} turns, fake LLM reply time {args.delay:.2f}s")
+    print(f"{'mode':>6} {'workers':>8} {'chats':>6} {'seconds':>8} {'turns/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>6}")
+
+    session_ids = new_sessions(biographer, 'async', args.chats)
+    elapsed, latencies, errors = asyncio.run(run_async(biographer_asgi.app, session_ids, args.turns))
+    report('async', 1, args.chats, args.turns, elapsed, latencies, errors)
+
+    if not args.skip_threaded:
+        session_ids = new_sessions(biographer, 'flask', args.chats)
+        elapsed, latencies, errors = run_threaded(biographer.app, session_ids, args.turns, args.threads)
+        report('flask', args.threads, args.chats, args.turns, elapsed, latencies, errors)
+
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
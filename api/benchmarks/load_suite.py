@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+"""
+Offline load test and benchmark suite
+
+Drives one of the apps against a local fake Anthropic API (envelope/fake_anthropic.py,
+run in its own process so it does not compete with the app for the GIL) with
+configurable latency, token rate, reply length and error injection:
+
+- chat: --sessions flows of /start, --turns x /chat (or /chat/stream with
+  --stream) and /end, --concurrency of them at a time;
+- assess: --assess-runs /assess_quality requests on a generated questions and
+  answers file, --assess-concurrency at a time.
+
+It reports throughput, p50/p95/p99 latency per endpoint, errors and the peak
+memory of the process, and saves everything as JSON (by default under
+benchmarks/results/, named after the time and the commit) so runs can be
+compared between commits:
+
+    python benchmarks/load_suite.py --app biographer --sessions 50 --turns 4 --concurrency 8 --latency 0.5
+    python benchmarks/load_suite.py --app index --stream --tokens-per-second 80 --reply-tokens 120 --error-rate 0.05
+    python benchmarks/load_suite.py --mode asgi --compare benchmarks/results/<earlier run>.json
+
+No API key or network access is needed; server/test_flask_app.py remains the
+smoke test against a live server and the real API. To load test with real
+replies, record a run against the API once through the cassette proxy
+(envelope/cassette.py) and replay it offline as often as needed:
+
+    python benchmarks/load_suite.py --sessions 5 --turns 3 --record benchmarks/results/real.jsonl
+    python benchmarks/load_suite.py --sessions 50 --turns 3 --replay benchmarks/results/real.jsonl
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import json
+import platform
+import resource
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from envelope.accounting import percentile
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(API_DIR, 'benchmarks', 'results')
+
+PREFIXES = {'index': '', 'biographer': '/api/biographer'}
+CHAT_PREFIXES = {'index': '/interviewer', 'biographer': '/api/biographer'}
+
+MESSAGES = [
+    "I grew up in a small town by the sea, the youngest of four.",
+    "My father was a fisherman and my mother ran the bakery on the main street.",
+    "We moved to the city when I was twelve, which was hard at first.",
+    "I met my wife at university; we were both studying history.",
+]
+
+
+def latency_summary(seconds):
+    ms = [value * 1000 for value in seconds]
+    return {
+        'count': len(ms),
+        'mean': round(statistics.fmean(ms), 2) if ms else None,
+        'p50': round(percentile(ms, 0.5), 2) if ms else None,
+        'p95': round(percentile(ms, 0.95), 2) if ms else None,
+        'p99': round(percentile(ms, 0.99), 2) if ms else None,
+        'max': round(max(ms), 2) if ms else None,
+    }
+
+
+def rss_mb():
+    """Resident memory of this process in MB (the peak so far where /proc is missing)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == 'darwin' else peak / 1024
+
+
+class MemorySampler:
+    """Polls the resident memory of the process while a scenario runs."""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.start_mb = self.peak_mb = rss_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_mb = max(self.peak_mb, rss_mb())
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        end_mb = rss_mb()
+        return {'rss_start_mb': round(self.start_mb, 1), 'rss_peak_mb': round(max(self.peak_mb, end_mb), 1),
+                'rss_end_mb': round(end_mb, 1)}
+
+
+class Results:
+    """Latencies and errors of the requests of a scenario, from any number of threads or tasks."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, error=None, first_byte=None):
+        with self._lock:
+            self.requests += 1
+            self.latencies[name].append(seconds)
+            if first_byte is not None:
+                self.latencies[f"{name}_first_byte"].append(first_byte)
+            if error:
+                self.errors[f"{name}: {error}"] += 1
+
+    def summary(self, elapsed, flows, completed):
+        return {
+            'flows': flows,
+            'completed_flows': completed,
+            'elapsed_s': round(elapsed, 3),
+            'flows_per_s': round(completed / elapsed, 2) if elapsed else None,
+            'requests_per_s': round(self.requests / elapsed, 2) if elapsed else None,
+            'requests': self.requests,
+            'errors': dict(self.errors),
+            'error_count': sum(self.errors.values()),
+            'latency_ms': {name: latency_summary(values) for name, values in sorted(self.latencies.items())},
+        }
+
+
+def chat_flow(app_name, turns, stream):
+    """One interview: /start, `turns` messages and /end. Yields (name, path, payload) and is sent the reply JSON."""
+    prefix = CHAT_PREFIXES[app_name]
+    started = yield 'start', f"{prefix}/start", None
+    session_id = started['session_id']
+    for turn in range(turns):
+        message = MESSAGES[turn % len(MESSAGES)]
+        if stream:
+            yield 'chat_stream', f"{prefix}/chat/stream", {'session_id': session_id, 'message': message}
+        else:
+            yield 'chat', f"{prefix}/chat", {'session_id': session_id, 'message': message}
+    yield 'end', f"{prefix}/end", {'session_id': session_id}
+
+
+def assess_flow(app_name, payload):
+    yield 'assess_quality', f"{PREFIXES[app_name]}/assess_quality", payload
+
+
+def response_error(status, body: bytes):
+    if status != 200:
+        return f"HTTP {status}"
+    if body.startswith(b'event:') and b'event: error' in body:
+        return 'stream error event'
+    return None
+
+
+def run_flow(client, flow, results):
+    """Run a flow with a Flask test client; returns whether every request succeeded."""
+    reply = None
+    while True:
+        try:
+            name, path, payload = flow.send(reply)
+        except StopIteration:
+            return True
+        started = time.perf_counter()
+        response = client.post(path, json=payload, buffered=False)
+        first_byte, chunks = None, []
+        for chunk in response.response:
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+            chunks.append(chunk if isinstance(chunk, bytes) else chunk.encode('utf-8'))
+        response.close()
+        body = b''.join(chunks)
+        error = response_error(response.status_code, body)
+        results.record(name, time.perf_counter() - started, error, first_byte if name == 'chat_stream' else None)
+        if error:
+            flow.close()
+            return False
+        reply = json.loads(body) if not body.startswith(b'event:') else None
+
+
+async def run_flow_async(http, flow, results):
+    """run_flow() against an ASGI app through httpx."""
+    reply = None
+    while True:
+        try:
+            name, path, payload = flow.send(reply)
+        except StopIteration:
+            return True
+        started = time.perf_counter()
+        first_byte, chunks = None, []
+        async with http.stream('POST', path, json=payload) as response:
+            async for chunk in response.aiter_raw():
+                if first_byte is None:
+                    first_byte = time.perf_counter() - started
+                chunks.append(chunk)
+        body = b''.join(chunks)
+        error = response_error(response.status_code, body)
+        results.record(name, time.perf_counter() - started, error, first_byte if name == 'chat_stream' else None)
+        if error:
+            flow.close()
+            return False
+        reply = json.loads(body) if not body.startswith(b'event:') else None
+
+
+def run_scenario(args, module, asgi_module, flows, concurrency):
+    """Run flows with at most `concurrency` in flight; returns the scenario summary."""
+    results = Results()
+    memory = MemorySampler()
+    started = time.perf_counter()
+    if args.mode == 'asgi':
+        import httpx
+
+        async def run_all():
+            semaphore = asyncio.Semaphore(concurrency)
+            transport = httpx.ASGITransport(app=asgi_module.app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://load', timeout=600) as http:
+                async def one(flow):
+                    async with semaphore:
+                        return await run_flow_async(http, flow, results)
+                return await asyncio.gather(*[one(flow) for flow in flows])
+        completed = asyncio.run(run_all())
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            completed = list(pool.map(lambda flow: run_flow(module.app.test_client(), flow, results), flows))
+    elapsed = time.perf_counter() - started
+    return {**results.summary(elapsed, len(flows), sum(completed)), 'memory': memory.stop()}
+
+
+def write_assessment_inputs(directory, questions, answers):
+    questions_file = os.path.join(directory, 'load_questions.csv')
+    with open(questions_file, 'w', encoding='utf-8') as f:
+        f.write("Category,Question\n")
+        for i in range(questions):
+            f.write(f"Childhood,\"Question {i}: {MESSAGES[i % len(MESSAGES)].replace('I ', 'Did you ')}\"\n")
+    answers_file = os.path.join(directory, 'load_answers.txt')
+    with open(answers_file, 'w', encoding='utf-8') as f:
+        for i in range(answers):
+            f.write(f"{i + 1}. {MESSAGES[i % len(MESSAGES)]}\n")
+    return questions_file, answers_file
+
+
+def start_fake_llm(args):
+    """Run the fake Anthropic API in a subprocess; returns (process, base_url)."""
+    command = [sys.executable, '-m', 'envelope.fake_anthropic', '--port', '0',
+               '--first-token-delay', str(args.latency),
+               '--token-delay', str(1 / args.tokens_per_second if args.tokens_per_second else 0),
+               '--reply-tokens', str(args.reply_tokens), '--jitter', str(args.jitter),
+               '--error-rate', str(args.error_rate), '--error-status', str(args.error_status),
+               '--seed', str(args.seed)]
+    return start_server(command)
+
+
+def start_cassette(args):
+    """Run a recording or replaying cassette proxy in a subprocess; returns (process, base_url)."""
+    if args.record:
+        command = ['--mode', 'record', '--cassette', args.record, '--upstream', args.upstream]
+    else:
+        command = ['--mode', 'replay', '--cassette', args.replay, '--speed', str(args.replay_speed)]
+    return start_server([sys.executable, '-m', 'envelope.cassette', 'serve', '--port', '0',
+                         '--match', args.match] + command)
+
+
+def start_server(command):
+    process = subprocess.Popen(command, cwd=API_DIR, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    while line and 'listening on' not in line:
+        line = process.stdout.readline()
+    if not line:
+        process.kill()
+        raise RuntimeError(f"{' '.join(command[1:4])} did not start")
+    return process, line.rsplit(' ', 1)[-1].strip()
+
+
+def fake_llm_stats(base_url):
+    with urllib.request.urlopen(f"{base_url}/stats", timeout=10) as response:
+        return json.load(response)
+
+
+def git_commit():
+    def git(*args):
+        return subprocess.run(['git', *args], cwd=API_DIR, capture_output=True, text=True).stdout.strip()
+    return {'commit': git('rev-parse', '--short', 'HEAD') or None, 'dirty': bool(git('status', '--porcelain', '--', '.'))}
+
+
+# Scenario-wide figures in the comparison table, ahead of the per-endpoint latencies
+COMPARED = ('flows_per_s', 'requests_per_s', 'error_count')
+
+
+def compare(current, baseline):
+    """Print the headline figures of two runs side by side."""
+    print(f"\nCompared with {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')})")
+    old_args, new_args = baseline['meta'].get('args', {}), current['meta']['args']
+    changed = sorted(name for name in new_args if old_args.get(name) != new_args[name])
+    if changed:
+        print("Note: the runs differ in " + ", ".join(f"{name} ({old_args.get(name)} -> {new_args[name]})"
+                                                      for name in changed))
+    print(f"{'scenario / figure':<44} {'before':>10} {'after':>10} {'change':>8}")
+
+    def row(label, before, after):
+        if before is None or after is None:
+            return
+        change = f"{(after - before) / before:+.0%}" if before else "-"
+        print(f"{label:<44} {before:>10.2f} {after:>10.2f} {change:>8}")
+
+    for scenario, figures in current['scenarios'].items():
+        old = baseline.get('scenarios', {}).get(scenario)
+        if not old:
+            continue
+        for figure in COMPARED:
+            row(f"{scenario} {figure}", old.get(figure), figures.get(figure))
+        for endpoint, stats in figures['latency_ms'].items():
+            for stat in ('p50', 'p95', 'p99'):
+                row(f"{scenario} {endpoint} {stat} ms", old['latency_ms'].get(endpoint, {}).get(stat), stats[stat])
+        row(f"{scenario} peak rss MB", old['memory']['rss_peak_mb'], figures['memory']['rss_peak_mb'])
+
+
+def print_report(run):
+    for scenario, figures in run['scenarios'].items():
+        print(f"\n{scenario}: {figures['completed_flows']}/{figures['flows']} flows in {figures['elapsed_s']:.2f}s, "
+              f"{figures['flows_per_s']} flows/s, {figures['requests_per_s']} requests/s, "
+              f"{figures['error_count']} errors, peak RSS {figures['memory']['rss_peak_mb']} MB")
+        print(f"  {'endpoint':<26} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+        for endpoint, stats in figures['latency_ms'].items():
+            print(f"  {endpoint:<26} {stats['count']:>6} {stats['p50']:>9.1f} {stats['p95']:>9.1f} "
+                  f"{stats['p99']:>9.1f} {stats['max']:>9.1f}")
+        for error, count in figures['errors'].items():
+            print(f"  error {error}: {count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline load test of the chat and assessment endpoints')
+    parser.add_argument('--app', choices=sorted(PREFIXES), default='biographer', help='App to load (default: biographer)')
+    parser.add_argument('--mode', choices=('flask', 'asgi'), default='flask',
+                        help='Drive the Flask app from a thread pool or the ASGI app from an event loop')
+    parser.add_argument('--sessions', type=int, default=40, help='Chat flows to run (0 skips the chat scenario)')
+    parser.add_argument('--turns', type=int, default=3, help='Messages per chat flow')
+    parser.add_argument('--concurrency', type=int, default=8, help='Chat flows in flight at once')
+    parser.add_argument('--stream', action='store_true', help='Use /chat/stream instead of /chat')
+    parser.add_argument('--assess-runs', type=int, default=4, help='/assess_quality requests (0 skips the scenario)')
+    parser.add_argument('--assess-concurrency', type=int, default=2, help='/assess_quality requests in flight at once')
+    parser.add_argument('--questions', type=int, default=20, help='Questions per assessment')
+    parser.add_argument('--answers', type=int, default=12, help='Answers per assessment')
+    parser.add_argument('--latency', type=float, default=0.2, help='Seconds the fake LLM takes to the first token')
+    parser.add_argument('--tokens-per-second', type=float, default=0, help='Output rate of the fake LLM (0: instant)')
+    parser.add_argument('--reply-tokens', type=int, default=40, help='Length of the fake replies in tokens')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Scale fake LLM delays by a random factor in [1-j, 1+j]')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of LLM calls failed with an API error')
+    parser.add_argument('--error-status', type=int, default=529, help='HTTP status of the injected errors')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the jitter and error injection')
+    parser.add_argument('--record', metavar='CASSETTE',
+                        help='Call the real API and record the calls to CASSETTE instead of using the fake LLM')
+    parser.add_argument('--replay', metavar='CASSETTE', help='Replay the LLM calls recorded in CASSETTE')
+    parser.add_argument('--replay-speed', type=float, default=1.0,
+                        help='Timing factor of the replayed calls (0: no latency)')
+    parser.add_argument('--match', choices=('exact', 'sequence'), default='sequence',
+                        help='How replayed calls are matched to the recordings')
+    parser.add_argument('--upstream', default=os.getenv('LLM_UPSTREAM') or 'https://api.anthropic.com',
+                        help='API recorded with --record')
+    parser.add_argument('--output', help='Results file (default: benchmarks/results/load_<time>_<commit>.json)')
+    parser.add_argument('--compare', help='Results file of an earlier run to compare with')
+    args = parser.parse_args()
+    if args.record and args.replay:
+        parser.error('--record and --replay are exclusive')
+    if args.record and not os.getenv('ANTHROPIC_API_KEY'):
+        parser.error('--record calls the real API and needs ANTHROPIC_API_KEY')
+    if args.replay and not os.path.exists(args.replay):
+        parser.error(f"No cassette at {args.replay}")
+    cassette = args.record or args.replay
+    if cassette:
+        cassette = os.path.abspath(cassette)
+        args.record, args.replay = (cassette, None) if args.record else (None, cassette)
+    # Both are read or written after moving into the working directory
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.compare) if args.compare else None
+
+    fake, base_url = start_cassette(args) if cassette else start_fake_llm(args)
+    if not args.record:
+        os.environ['ANTHROPIC_API_KEY'] = 'load-test'
+    os.environ['ANTHROPIC_BASE_URL'] = base_url
+    os.environ['ANTHROPIC_API_URL'] = base_url  # read by langchain_anthropic
+    workdir = tempfile.mkdtemp(prefix='load_suite_')
+    os.chdir(workdir)
+
+    import importlib
+    module = importlib.import_module(args.app)
+    asgi_module = importlib.import_module(f"{args.app}_asgi") if args.mode == 'asgi' else None
+
+    commit = git_commit()
+    run = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            **commit,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'args': {name: value for name, value in vars(args).items() if name not in ('output', 'compare')},
+        },
+        'scenarios': {},
+    }
+    if cassette:
+        print(f"{args.app} ({args.mode}), {'recording' if args.record else 'replaying'} {cassette} "
+              f"through {base_url}; working in {workdir}")
+    else:
+        print(f"{args.app} ({args.mode}), fake LLM at {base_url}: {args.latency}s to first token, "
+              f"{args.tokens_per_second or 'instant'} tokens/s, {args.reply_tokens}-token replies, "
+              f"{args.error_rate:.0%} errors; working in {workdir}")
+
+    try:
+        if args.sessions:
+            flows = [chat_flow(args.app, args.turns, args.stream) for _ in range(args.sessions)]
+            run['scenarios']['chat'] = run_scenario(args, module, asgi_module, flows, args.concurrency)
+
+        if args.assess_runs:
+            questions_file, answers_file = write_assessment_inputs(workdir, args.questions, args.answers)
+            flows = [assess_flow(args.app, {'questions_file': questions_file, 'answers_file': answers_file,
+                                            'output_file': os.path.join(workdir, f"assessed_{i}.csv"),
+                                            'use_cache': False})
+                     for i in range(args.assess_runs)]
+            run['scenarios']['assess'] = run_scenario(args, module, asgi_module, flows, args.assess_concurrency)
+
+        run['fake_llm'] = fake_llm_stats(base_url)
+    finally:
+        fake.terminate()
+        fake.wait()
+
+    print_report(run)
+    if cassette:
+        print("\nCassette proxy: " + ", ".join(f"{value} {name}" for name, value in run['fake_llm'].items()))
+    else:
+        print(f"\nFake LLM served {run['fake_llm']['requests']} calls, {run['fake_llm']['errors']} injected errors")
+
+    output = output or os.path.join(
+        RESULTS_DIR, f"load_{datetime.now().strftime('%Y%m%d-%H%M%S')}_{commit['commit'] or 'nogit'}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(run, f, indent=2)
+    print(f"Results saved to {output}")
+
+    if baseline:
+        with open(baseline, 'r', encoding='utf-8') as f:
+            compare(run, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Accuracy against LLM calls of the local assessment tier
+
+Runs the LocalClassifier (envelope/triage.py) over the questions of an
+assessed CSV for a grid of confidence thresholds and reports, per setting,
+how many questions it settles locally, how many still need an LLM call, and
+how often the local verdicts agree with the Answer_Quality column. Escalated
+questions get the LLM's verdict, so the overall accuracy is the share of all
+questions whose final verdict matches. No LLM calls are made; the answers
+file must be the one the ground truth was scored against.
+
+    python benchmarks/tier_report.py conversation_1234_conclusions.txt
+    python benchmarks/tier_report.py answers.txt --truth biographer/assessment_results.csv --full 0.8 0.9 1.0
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+from collections import Counter
+
+import pandas as pd
+
+from envelope.assessment import load_answers
+from envelope.triage import DEFAULT_FULL_WORDS, LocalClassifier
+
+DEFAULT_TRUTH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             "biographer", "assessment_results.csv")
+
+
+def evaluate(classifier, questions, truth, answers):
+    verdicts = [verdict for verdict, _ in classifier.classify(questions, answers)]
+    settled = [(verdict, expected) for verdict, expected in zip(verdicts, truth) if verdict]
+    correct = sum(verdict == expected for verdict, expected in settled)
+    mistakes = Counter(f"{verdict}<-{expected}" for verdict, expected in settled if verdict != expected)
+    return {
+        'settled': len(settled),
+        'llm_calls': len(questions) - len(settled),
+        'local_accuracy': correct / len(settled) if settled else None,
+        'accuracy': (len(questions) - len(settled) + correct) / len(questions) if questions else 1.0,
+        'mistakes': mistakes
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the accuracy and LLM calls of the local assessment tier')
+    parser.add_argument('answers_file', help='Answers file the ground truth was scored against')
+    parser.add_argument('--truth', default=DEFAULT_TRUTH, help='Assessed CSV with Question and Answer_Quality columns')
+    parser.add_argument('--zero', type=float, nargs='+', default=[0.0, 0.6, 0.8, 1.0],
+                        help='zero_confidence values to try (0 never settles "0")')
+    parser.add_argument('--full', type=float, nargs='+', default=[0.0, 0.6, 0.8, 0.9, 1.0],
+                        help='full_confidence values to try (0 never settles "full answer")')
+    parser.add_argument('--full-words', type=int, default=DEFAULT_FULL_WORDS,
+                        help=f'Answer length that counts as complete (default: {DEFAULT_FULL_WORDS})')
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.truth, keep_default_na=False, dtype=str)
+    questions = list(df['Question'])
+    truth = [quality.strip().lower() for quality in df['Answer_Quality']]
+    answers = load_answers(args.answers_file)
+
+    print(f"{len(questions)} questions ({dict(Counter(truth))}) against {len(answers)} answers")
+    print(f"{'zero':>5} {'full':>5} {'settled':>8} {'llm calls':>10} {'local acc':>10} {'accuracy':>9}  mistakes")
+    for zero in args.zero:
+        for full in args.full:
+            result = evaluate(LocalClassifier(zero, full, args.full_words), questions, truth, answers)
+            local = f"{result['local_accuracy']:.1%}" if result['local_accuracy'] is not None else "-"
+            mistakes = ", ".join(f"{kind}: {count}" for kind, count in sorted(result['mistakes'].items()))
+            print(f"{zero:>5.2f} {full:>5.2f} {result['settled']:>8} {result['llm_calls']:>10} {local:>10} "
+                  f"{result['accuracy']:>9.1%}  {mistakes}")
+
+
+if __name__ == "__main__":
+    main()
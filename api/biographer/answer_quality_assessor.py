@@ -12,8 +12,6 @@ import pandas as pd
 import argparse
 from typing import List, Dict, Tuple
 from dotenv import load_dotenv
-from langchain_anthropic import ChatAnthropic
-from langchain.schema import HumanMessage
 
 # Import API key from variables.py
 try:
@@ -24,27 +22,20 @@ try:
 except ImportError:
     pass  # Fall back to environment variable or parameter
 
+from envelope.assessment import AnswerQualityAssessor as BaseAssessor
+from envelope.triage import DEFAULT_FULL_CONFIDENCE, DEFAULT_ZERO_CONFIDENCE, LocalClassifier
+from envelope.verdict_cache import VerdictCache, create_verdict_cache
+
 # Load environment variables
 load_dotenv()
 
-class AnswerQualityAssessor:
-    def __init__(self, anthropic_api_key: str = None):
-        """Initialize the assessor with Anthropic API key."""
-        self.api_key = anthropic_api_key or os.getenv('ANTHROPIC_API_KEY')
-        if not self.api_key:
-            raise ValueError("ANTHROPIC_API_KEY must be provided either as parameter or environment variable")
-        
-        # Initialize the LLM with Anthropic Claude
-        self.llm = ChatAnthropic(
-            model="claude-3-sonnet-20240229",
-            anthropic_api_key=self.api_key,
-            temperature=0.1
-        )
+class AnswerQualityAssessor(BaseAssessor):
+    """Command line assessor: the shared assessor plus progress output."""
 
     def load_questions(self, questions_file: str) -> pd.DataFrame:
         """Load questions from CSV file."""
         try:
-            df = pd.read_csv(questions_file)
+            df = super().load_questions(questions_file)
             print(f"Loaded {len(df)} questions from {questions_file}")
             return df
         except Exception as e:
@@ -53,117 +44,46 @@ class AnswerQualityAssessor:
     def load_answers(self, answers_file: str) -> List[str]:
         """Load answers from text file."""
         try:
-            with open(answers_file, 'r', encoding='utf-8') as f:
-                content = f.read().strip()
-            
-            # Split by numbered lines (1., 2., etc.) or by double newlines
-            answers = []
-            if content:
-                # Try to split by numbered items first
-                lines = content.split('\n')
-                current_answer = ""
-                
-                for line in lines:
-                    line = line.strip()
-                    if line and (line[0].isdigit() and '. ' in line):
-                        if current_answer:
-                            answers.append(current_answer.strip())
-                        current_answer = line
-                    elif line:
-                        current_answer += " " + line
-                
-                if current_answer:
-                    answers.append(current_answer.strip())
-            
+            answers = super().load_answers(answers_file)
             print(f"Loaded {len(answers)} answers from {answers_file}")
             return answers
         except Exception as e:
             raise Exception(f"Error loading answers file: {e}")
 
-    def assess_answer_quality(self, question: str, answers: List[str]) -> str:
-        """Assess the quality of answers for a specific question."""
-        
-        # Combine all answers into a single text
-        all_answers = "\n".join(answers) if answers else "No answers provided"
-        
-        prompt = f"""
-        Evaluate how well the provided answers respond to this specific question:
-        
-        QUESTION: {question}
-        
-        AVAILABLE ANSWERS:
-        {all_answers}
-        
-        Your task is to determine the answer quality based on these criteria:
-        
-        1. "full answer" - The answers completely and thoroughly address the question with specific details
-        2. "partial answer" - The answers partially address the question but lack some important details or completeness
-        3. "0" - The answers do not address the question at all, or no relevant answer is found
-        
-        Consider:
-        - Does any answer directly respond to what the question is asking?
-        - Is the response specific and detailed enough to be considered complete?
-        - Are there multiple aspects to the question that need to be addressed?
-        
-        Respond with ONLY one of these three options: "full answer", "partial answer", or "0"
-        """
-        
-        try:
-            message = HumanMessage(content=prompt)
-            result = self.llm.invoke([message])
-            
-            # Clean up the result to ensure it's one of the expected values
-            result_str = result.content.strip().lower()
-            
-            if "full answer" in result_str:
-                return "full answer"
-            elif "partial answer" in result_str:
-                return "partial answer"
-            else:
-                return "0"
-                
-        except Exception as e:
-            print(f"Error assessing question '{question}': {e}")
-            return "0"
+    def on_error(self, question: str, error: Exception):
+        print(f"Error assessing question '{question}': {error}")
+
+    def on_verdict(self, position: int, total: int, question: str, quality: str):
+        progress = self.progress
+        print(f"\nAssessed question {position}/{total}: {question[:50]}...")
+        print(f"Assessment: {quality}" + (f" ({progress.source})" if progress.source != 'llm' else ""))
+        totals = ", ".join(f"{verdict}: {count}" for verdict, count in progress.counts.items())
+        eta = progress.eta()
+        print(f"Totals: {totals}" + (f" | ETA {int(eta // 60)}m {int(eta % 60):02d}s" if eta else ""))
 
-    def process_assessment(self, questions_file: str, answers_file: str, output_file: str = None):
+    def process_assessment(self, questions_file: str, answers_file: str, output_file: str = None,
+                           batch_size: int = None, concurrency: int = None, use_cache: bool = True,
+                           resume: bool = False):
         """Process the complete assessment and generate output file."""
-        
-        # Load data
-        questions_df = self.load_questions(questions_file)
-        answers = self.load_answers(answers_file)
-        
-        # Create output dataframe
-        output_df = questions_df.copy()
-        output_df['Answer_Quality'] = ""
-        
-        print(f"\nStarting assessment of {len(questions_df)} questions...")
-        
-        # Process each question
-        for idx, row in questions_df.iterrows():
-            question = row['Question']
-            print(f"\nAssessing question {idx + 1}/{len(questions_df)}: {question[:50]}...")
-            
-            quality = self.assess_answer_quality(question, answers)
-            output_df.at[idx, 'Answer_Quality'] = quality
-            
-            print(f"Assessment: {quality}")
-        
-        # Generate output filename if not provided
-        if not output_file:
-            base_name = os.path.splitext(questions_file)[0]
-            output_file = f"{base_name}_assessed.csv"
-        
-        # Save results
-        output_df.to_csv(output_file, index=False)
+        print(f"\nStarting assessment...")
+        output_file, summary = super().process_assessment(questions_file, answers_file, output_file,
+                                                          batch_size, concurrency, use_cache, resume)
+        if self.tier_stats:
+            print(f"Local tier: {self.tier_stats['settled']} settled, {self.tier_stats['escalated']} sent to the LLM")
+        if self.resumed_rows:
+            print(f"Resumed: {self.resumed_rows} verdicts kept from the interrupted run")
         print(f"\nAssessment complete! Results saved to: {output_file}")
-        
+        if self.cache is not None:
+            print(f"Cache: {self.cache_stats['hits']} hits, {self.cache_stats['misses']} misses")
+        if self.retrieval_stats:
+            print(f"Retrieval: {self.retrieval_stats['questions_without_match']} questions without a matching answer, "
+                  f"~{self.retrieval_stats['input_tokens_saved']} input tokens saved")
+
         # Print summary
-        quality_counts = output_df['Answer_Quality'].value_counts()
         print(f"\nSummary:")
-        for quality, count in quality_counts.items():
+        for quality, count in summary.items():
             print(f"  {quality}: {count} questions")
-        
+
         return output_file
 
 def main():
@@ -173,18 +93,52 @@ def main():
     parser.add_argument('answers_file', help='Path to text file containing answers')
     parser.add_argument('--output', '-o', help='Output CSV file path (optional)')
     parser.add_argument('--api-key', help='Anthropic API key (optional, can use ANTHROPIC_API_KEY env var)')
+    parser.add_argument('--batch-size', type=int, default=1,
+                        help='Number of questions scored per LLM call (default: 1)')
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='Number of LLM calls in flight at once (default: 1)')
+    parser.add_argument('--rate-limit', type=float, default=None,
+                        help='Maximum LLM calls per second (default: no limit)')
+    parser.add_argument('--top-k', type=int, default=None,
+                        help='Send only the k best-matching answers with each question (default: all answers)')
+    parser.add_argument('--min-score', type=float, default=0.0,
+                        help='Minimum BM25 score for an answer to count as a match (default: 0)')
+    parser.add_argument('--cache', help='Verdict cache database (default: ASSESS_CACHE_PATH or '
+                                        'assessment_cache.sqlite3)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Re-score every question instead of reusing cached verdicts')
+    parser.add_argument('--local-tier', action='store_true',
+                        help='Settle the obvious "0" and "full answer" cases locally and only ask the LLM about the rest')
+    parser.add_argument('--zero-confidence', type=float, default=DEFAULT_ZERO_CONFIDENCE,
+                        help=f'Confidence a local "0" needs, 0 to never settle it (default: {DEFAULT_ZERO_CONFIDENCE})')
+    parser.add_argument('--full-confidence', type=float, default=DEFAULT_FULL_CONFIDENCE,
+                        help=f'Confidence a local "full answer" needs, 0 to never settle it '
+                             f'(default: {DEFAULT_FULL_CONFIDENCE})')
+    parser.add_argument('--resume', action='store_true',
+                        help='Keep the verdicts checkpointed by an interrupted run with the same output file')
     
     args = parser.parse_args()
     
     try:
         # Initialize assessor
-        assessor = AnswerQualityAssessor(anthropic_api_key=args.api_key)
+        assessor = AnswerQualityAssessor(
+            anthropic_api_key=args.api_key,
+            batch_size=args.batch_size,
+            concurrency=args.concurrency,
+            requests_per_second=args.rate_limit,
+            cache=VerdictCache(args.cache) if args.cache else create_verdict_cache(),
+            top_k=args.top_k,
+            min_score=args.min_score,
+            local_tier=LocalClassifier(args.zero_confidence, args.full_confidence) if args.local_tier else None
+        )
         
         # Run assessment
         output_file = assessor.process_assessment(
             questions_file=args.questions_file,
             answers_file=args.answers_file,
-            output_file=args.output
+            output_file=args.output,
+            use_cache=not args.no_cache,
+            resume=args.resume
         )
         
         print(f"\n✅ Assessment completed successfully!")
@@ -1,46 +1,42 @@
-import json
+import sys
 import os
-import re
-from datetime import datetime
-
-def extract_conclusions(filename):
-    with open(filename, 'r', encoding='utf-8') as f:
-        conversation = json.load(f)
-    
-    conclusions = []
-    
-    for message in conversation:
-        if message['role'] == 'assistant' and '<response>' in message['content']:
-            # Extract text between <response> and </response> tags
-            matches = re.findall(r'<response>(.*?)</response>', message['content'], re.DOTALL)
-            if matches:
-                for match in matches:
-                    conclusions.append(match.strip())
-    
-    return conclusions
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+
+from envelope.conclusions import ConclusionsManifest, output_filename, process_conversations
+from envelope.conclusions import save_conclusions as write_conclusions
+from envelope.journal import compact_journals
 
 def save_conclusions(conclusions, original_filename):
     # Create filename based on original conversation file
-    base_name = os.path.splitext(original_filename)[0]
-    conclusion_filename = f"{base_name}_conclusions.txt"
-    
-    with open(conclusion_filename, 'w', encoding='utf-8') as f:
-        for i, conclusion in enumerate(conclusions, 1):
-            f.write(f"{i}. {conclusion}\n\n")
-    
+    conclusion_filename = output_filename(original_filename, '_conclusions.txt')
+    write_conclusions(conclusions, conclusion_filename)
     return conclusion_filename
 
-def process_all_conversations():
+def process_all_conversations(force=False, workers=1):
+    # Write out the journals of sessions that ended without being compacted (e.g. evicted ones)
+    compact_journals(os.getenv('JOURNAL_DIR', 'journals'))
+
     # Find all conversation JSON files in the current directory
-    conversation_files = [f for f in os.listdir('.') if f.startswith('conversation_') and f.endswith('.json')]
-    
-    for file in conversation_files:
-        conclusions = extract_conclusions(file)
-        if conclusions:
-            conclusion_file = save_conclusions(conclusions, file)
-            print(f"Extracted {len(conclusions)} conclusions to {conclusion_file}")
+    conversation_files = sorted(f for f in os.listdir('.') if f.startswith('conversation_') and f.endswith('.json'))
+
+    def report(done, total, source, output, count):
+        if count:
+            print(f"Extracted {count} conclusions to {output}")
         else:
-            print(f"No conclusions found in {file}")
+            print(f"No conclusions found in {source}")
+
+    # Files unchanged since the last run are skipped unless force is set
+    run = process_conversations(conversation_files, manifest=ConclusionsManifest(), force=force, workers=workers,
+                                progress=report)
+    print(f"Processed {run['processed']} files ({run['processed'] - len(run['results'])} without conclusions), "
+          f"skipped {run['skipped']} unchanged files")
 
 if __name__ == "__main__":
-    process_all_conversations() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Extract conclusions from conversation files')
+    parser.add_argument('--force', action='store_true', help='Reprocess every file, ignoring the manifest')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='Number of processes to spread the files over (default: one per CPU)')
+    args = parser.parse_args()
+    process_all_conversations(force=args.force, workers=args.workers)
@@ -3,37 +3,41 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import anthropic
-import pandas as pd
 import json
+import time
 from datetime import datetime
 
 from variables import ANTHROPIC_API_KEY
+from envelope.prompts import create_sliced_prompt
+from envelope.prompt_cache import create_prompt_cache
+from envelope.context import AnthropicSummarizer, create_rolling_context
+from envelope.accounting import TURNS_SUFFIX, record_turn, write_turns
+from envelope.cassette import llm_base_url
 
 
-# Read the system prompt from file
-with open("biographer/system prompt.txt", "r") as f:
-    system_prompt = f.read()
+# System prompts for the 400-question bank; each turn only carries the categories the interview
+# is on plus the next one (QUESTION_SLICING=0 sends the whole bank, see envelope/prompts.py)
+prompts = create_sliced_prompt('cli')
 
-# Read the questions from CSV file
-import pandas as pd
-questions_df = pd.read_csv("biographer/interview-questions.csv")
-questions_list = questions_df.to_dict('records')
-questions_str = "\n".join([f"Category: {q['Category']}, Field: {q['Field']}, Question: {q['Question']}" for q in questions_list])
-
-# Replace placeholder in system prompt with actual questions
-system_prompt = system_prompt.replace("{{QUESTIONS_LIST}}", questions_str)
+# Mark the system prompt and the history so far as cacheable (see envelope/prompt_cache.py)
+prompt_cache = create_prompt_cache()
 
 # Setup the interviewer name and create a unique conversation ID
 
 conversation_id = datetime.now().strftime("%M%S")
 
-# Initialize Anthropic client with just the API key
+# Initialize Anthropic client with just the API key (recorded or replayed when LLM_CASSETTE is set)
 client = anthropic.Anthropic(
     api_key=ANTHROPIC_API_KEY,
+    base_url=llm_base_url(),
 )
 
+# Older turns of long interviews are folded into a running summary (see envelope/context.py)
+context = create_rolling_context(AnthropicSummarizer(client))
+
 # Initialize conversation history
 conversation_history = []
+conversation = {'history': conversation_history}
 
 # Print welcome message
 print("\nEnvelope started. Type 'exit' or 'quit' to end the conversation.")
@@ -53,12 +57,13 @@ while True:
     conversation_history.append({"role": "user", "content": user_input})
     
     # Get response from Claude
+    system = prompts.for_history(conversation_history)
+    llm_started = time.perf_counter()
     message = client.messages.create(
         model="claude-3-7-sonnet-20250219",
         max_tokens=20000,
         temperature=1,
-        system=system_prompt,
-        messages=conversation_history
+        **prompt_cache.request(system, context.messages(conversation_id, conversation, system))
     )
     
     # Extract and print Claude's response
@@ -67,6 +72,7 @@ while True:
     
     # Add assistant response to history
     conversation_history.append({"role": "assistant", "content": assistant_response})
+    record_turn(conversation, message, llm_started)
     
 # Save conversation history to JSON file with timestamp ID
 timestamp = datetime.now().strftime("%d%m_%H%M")
@@ -75,4 +81,6 @@ filename = f"conversation_{timestamp}_{conversation_id}.json"
 with open(filename, 'w', encoding='utf-8') as f:
     json.dump(conversation_history, f, indent=2, ensure_ascii=False)
 
-
+# Token and latency accounting of every turn, next to the transcript (see envelope/accounting.py)
+if conversation.get('usage'):
+    write_turns(filename[:-len('.json')] + TURNS_SUFFIX, conversation['usage'])
@@ -0,0 +1,37 @@
+"""
+Async (ASGI) entry point for the biographer API
+
+Serves the same routes as biographer.py, with /api/biographer/chat and
+/api/biographer/chat/stream awaiting Claude through AsyncAnthropic instead of
+holding a worker thread (see envelope/asgi.py).
+
+    uvicorn biographer_asgi:app --port 4002
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import anthropic
+
+import biographer
+from envelope.asgi import AsyncChatApp
+from envelope.cassette import llm_base_url
+from envelope.metrics import instrument_client
+
+app = AsyncChatApp(
+    biographer.app,
+    '/api/biographer',
+    sessions=biographer.active_conversations,
+    journal=biographer.journal,
+    journal_prefix='biographer_story_',
+    client=instrument_client(anthropic.AsyncAnthropic(api_key=biographer.ANTHROPIC_API_KEY, base_url=llm_base_url())),
+    max_threads=int(os.getenv('ASGI_THREADS', 0)) or None,
+    prompt_cache=biographer.prompt_cache,
+    context=biographer.context,
+    jobs=biographer.jobs,
+    model="claude-3-7-sonnet-20250219",
+    max_tokens=20000,
+    temperature=0.8,
+    system=biographer.prompts.for_history
+)
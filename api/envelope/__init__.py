@@ -0,0 +1,6 @@
+"""
+Envelope shared helpers
+
+Code used by more than one of the Flask entry points (index.py, biographer.py,
+server/app.py) and the command line scripts in biographer/.
+"""
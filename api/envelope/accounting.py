@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Per-turn token and latency accounting
+
+record_turn() appends a record for every reply to conversation['usage']: the
+model, stop reason, input/output/cache tokens, the LLM latency (plus the time
+to first token when streamed) and the server latency from the request
+arriving to the reply being ready. The record is journaled with the reply,
+and compaction writes the records of a session to a `<stem>.turns.jsonl`
+sidecar next to its transcript, which keeps its plain role/content schema
+(see envelope/journal.py).
+
+The stats command reports per-session and fleet-wide p50/p95 latency, tokens
+and cost from the sidecars:
+
+    python -m envelope.accounting stats --dir .
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List
+
+TURNS_SUFFIX = '.turns.jsonl'
+
+USAGE_FIELDS = ('input_tokens', 'output_tokens', 'cache_creation_input_tokens', 'cache_read_input_tokens')
+
+# USD per million (input, output) tokens; cache writes cost 1.25x the input price and reads 0.1x
+PRICES = {
+    'claude-3-7-sonnet-20250219': (3.0, 15.0),
+    'claude-3-5-sonnet-20241022': (3.0, 15.0),
+    'claude-3-sonnet-20240229': (3.0, 15.0),
+    'claude-3-5-haiku-20241022': (0.8, 4.0),
+    'claude-3-haiku-20240307': (0.25, 1.25),
+    'claude-3-opus-20240229': (15.0, 75.0),
+}
+DEFAULT_PRICE = PRICES['claude-3-7-sonnet-20250219']
+
+
+def usage_counts(usage) -> Dict[str, int]:
+    """The token counts of a Messages API `usage` object (fields the API left out count as 0)."""
+    return {field: getattr(usage, field, None) or 0 for field in USAGE_FIELDS}
+
+
+def elapsed_ms(since: float):
+    return round((time.perf_counter() - since) * 1000, 1) if since is not None else None
+
+
+def record_turn(conversation: Dict, message, llm_started: float, request_started: float = None, **extra) -> Dict:
+    """Append the accounting record of a reply to conversation['usage'] and return it.
+
+    message is the Messages API response, and llm_started / request_started
+    time.perf_counter() readings taken when the call was made and when the
+    request arrived. When a RollingContext built the request (see
+    envelope/context.py) the estimated tokens of the full history and of what
+    was sent are recorded as well.
+    """
+    record = {
+        'at': datetime.now().isoformat(timespec='seconds'),
+        'model': getattr(message, 'model', None),
+        'stop_reason': getattr(message, 'stop_reason', None),
+        **usage_counts(getattr(message, 'usage', None)),
+        'llm_ms': elapsed_ms(llm_started),
+        'server_ms': elapsed_ms(request_started),
+        **extra
+    }
+    context = conversation.get('context')
+    if context and 'history_tokens' in context:
+        record['history_tokens'] = context['history_tokens']
+        record['sent_tokens'] = context['sent_tokens']
+    conversation.setdefault('usage', []).append(record)
+    return record
+
+
+def journal_entry(conversation: Dict) -> Dict:
+    """The last message of a conversation as it is journaled: replies carry their turn record."""
+    message = conversation['history'][-1]
+    if message['role'] == 'assistant' and conversation.get('usage'):
+        return {**message, 'turn': conversation['usage'][-1]}
+    return message
+
+
+def write_turns(path: str, records: List[Dict]):
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    os.replace(tmp, path)
+
+
+def read_turns(path: str) -> List[Dict]:
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+
+def turn_cost(record: Dict) -> float:
+    """Cost of a turn in USD."""
+    input_price, output_price = PRICES.get(record.get('model'), DEFAULT_PRICE)
+    input_tokens = (record.get('input_tokens', 0) + 1.25 * record.get('cache_creation_input_tokens', 0)
+                    + 0.1 * record.get('cache_read_input_tokens', 0))
+    return (input_tokens * input_price + record.get('output_tokens', 0) * output_price) / 1e6
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else None
+
+
+def summarize_turns(records: List[Dict]) -> Dict:
+    """p50/p95 latencies and token and cost totals of a set of turn records."""
+    llm = [r['llm_ms'] for r in records if r.get('llm_ms') is not None]
+    server = [r['server_ms'] for r in records if r.get('server_ms') is not None]
+    prompt = [r.get('input_tokens', 0) + r.get('cache_creation_input_tokens', 0) + r.get('cache_read_input_tokens', 0)
+              for r in records]
+    cached = sum(r.get('cache_read_input_tokens', 0) for r in records)
+    return {
+        'turns': len(records),
+        'llm_p50_ms': percentile(llm, 0.5),
+        'llm_p95_ms': percentile(llm, 0.95),
+        'server_p50_ms': percentile(server, 0.5),
+        'server_p95_ms': percentile(server, 0.95),
+        'input_tokens': sum(prompt),
+        'output_tokens': sum(r.get('output_tokens', 0) for r in records),
+        'cache_read_share': cached / sum(prompt) if sum(prompt) else 0.0,
+        'cost_usd': sum(turn_cost(r) for r in records),
+    }
+
+
+def collect_sessions(directory: str) -> Dict[str, List[Dict]]:
+    """The turn records of every transcript in a directory, keyed by transcript stem."""
+    return {name[:-len(TURNS_SUFFIX)]: read_turns(os.path.join(directory, name))
+            for name in sorted(os.listdir(directory)) if name.endswith(TURNS_SUFFIX)}
+
+
+def format_ms(value) -> str:
+    return f"{value:.0f}" if value is not None else "-"
+
+
+def print_stats(sessions: Dict[str, List[Dict]]):
+    header = (f"{'session':<40} {'turns':>5} {'llm p50':>8} {'llm p95':>8} {'srv p50':>8} {'srv p95':>8} "
+              f"{'in tok':>9} {'out tok':>8} {'cached':>7} {'cost $':>8}")
+
+    def row(name, s):
+        return (f"{name[:40]:<40} {s['turns']:>5} {format_ms(s['llm_p50_ms']):>8} {format_ms(s['llm_p95_ms']):>8} "
+                f"{format_ms(s['server_p50_ms']):>8} {format_ms(s['server_p95_ms']):>8} {s['input_tokens']:>9} "
+                f"{s['output_tokens']:>8} {s['cache_read_share']:>7.0%} {s['cost_usd']:>8.4f}")
+
+    print(header)
+    for name, records in sessions.items():
+        print(row(name, summarize_turns(records)))
+    fleet = summarize_turns([r for records in sessions.values() for r in records])
+    print(row(f"all ({len(sessions)} sessions)", fleet))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Token and latency accounting of chat turns')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    stats = subcommands.add_parser('stats', help='Per-session and fleet-wide latency, tokens and cost')
+    stats.add_argument('--dir', default='.', help='Directory holding the transcripts (default: .)')
+    stats.add_argument('--json', action='store_true', help='Print the figures as JSON')
+    args = parser.parse_args()
+
+    sessions = collect_sessions(args.dir)
+    if not sessions:
+        print(f"No {TURNS_SUFFIX} files in {args.dir}")
+        return 1
+    if args.json:
+        print(json.dumps({
+            'sessions': {name: summarize_turns(records) for name, records in sessions.items()},
+            'fleet': summarize_turns([r for records in sessions.values() for r in records]),
+        }, indent=2))
+    else:
+        print_stats(sessions)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,293 @@
+"""
+Async serving mode for the chat endpoints
+
+AsyncChatApp is an ASGI application wrapping one of the Flask apps. The routes
+that wait on Claude (`chat` and `chat/stream`) are served on the event loop with
+an AsyncAnthropic client, so a reply being generated holds a coroutine instead
+of a worker thread and hundreds of chats can be in flight on a few workers.
+Every other route is handed to the Flask app unchanged on a thread pool, so
+URLs and JSON contracts stay those of the Flask app and both halves share its
+session store and journal; streamed Flask responses (such as assessment
+progress) are relayed chunk by chunk.
+
+Journal appends (which wait for fsync) run on the thread pool as well. The
+chat routes served here are traced like the Flask routes (see
+envelope/tracing.py), but not profiled, since a profile of the event loop
+would mix every request in flight. Run the entry points with any ASGI server,
+e.g. `uvicorn biographer_asgi:app`.
+"""
+
+import asyncio
+import io
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+from envelope.accounting import journal_entry, record_turn
+from envelope.metrics import observe_request
+from envelope.streaming import SSE_HEADERS, astream_chat
+from envelope.tracing import span
+
+
+async def read_body(receive) -> bytes:
+    body = b''
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            break
+    return body
+
+
+async def send_json(send, data: Dict, status: int = 200):
+    body = json.dumps(data, sort_keys=True).encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def wsgi_environ(scope: Dict, body: bytes) -> Dict:
+    """Build the WSGI environ for an ASGI HTTP request whose body has been read."""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = name if name == 'CONTENT_TYPE' else f'HTTP_{name}'
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def run_wsgi(wsgi_app, environ: Dict, emit: Callable[[Dict], None], disconnected: threading.Event):
+    """Call a WSGI app and hand its response to emit as ASGI messages, one per body chunk.
+
+    Everything runs on the calling thread, as streamed Flask responses keep
+    their request context on the thread that started them. Iteration stops
+    early once the client has disconnected.
+    """
+    started = False
+
+    def start_response(status, headers, exc_info=None):
+        nonlocal started
+        started = True
+        emit({'type': 'http.response.start', 'status': int(status.split(' ', 1)[0]),
+              'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]})
+        return lambda chunk: emit({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+
+    try:
+        result = wsgi_app(environ, start_response)
+        try:
+            for chunk in result:
+                if disconnected.is_set():
+                    break
+                if chunk:
+                    emit({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+    finally:
+        if not started:
+            emit({'type': 'http.response.start', 'status': 500, 'headers': []})
+        emit({'type': 'http.response.body', 'body': b''})
+
+
+class AsyncChatApp:
+    def __init__(self, flask_app, prefix: str, sessions, journal, journal_prefix: str, client,
+                 max_threads: int = None, prompt_cache=None, context=None, jobs=None, **create_kwargs):
+        """prefix is the route prefix of the chat endpoints (e.g. '/api/biographer'),
+        sessions and journal the Flask app's session store and journal, and
+        create_kwargs the messages.create() arguments other than the history.
+        `system` may be a function of the history returning the system prompt.
+        prompt_cache (a PromptCache) adds cache breakpoints to every request and
+        context (a RollingContext) replaces the older turns of long sessions with a summary.
+        jobs (a JobQueue) is shut down with the server."""
+        self.flask_app = flask_app
+        self.sessions = sessions
+        self.journal = journal
+        self.journal_prefix = journal_prefix
+        self.client = client
+        self.create_kwargs = create_kwargs
+        self.prompt_cache = prompt_cache
+        self.context = context
+        self.jobs = jobs
+        self.executor = ThreadPoolExecutor(max_threads) if max_threads else None
+        self.routes = {
+            f"{prefix}/chat": self.chat,
+            f"{prefix}/chat/stream": self.chat_stream,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        started = time.perf_counter()
+        body = await read_body(receive)
+        handler = self.routes.get(scope['path']) if scope['method'] == 'POST' else None
+        if handler is None:
+            await self.call_flask(scope, body, receive, send)
+            return
+
+        async def send_and_record(message):
+            # Same measure as the Flask routes: time to the response headers
+            if message['type'] == 'http.response.start':
+                observe_request(scope['path'], scope['method'], message['status'], started)
+            await send(message)
+
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            await send_json(send_and_record, {'error': 'Request body must be a JSON object'}, 400)
+            return
+        with span('request', route=scope['path'], method=scope['method']):
+            await handler(data, send_and_record, started)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.run_in_thread(self.journal.flush)
+                if self.jobs is not None:
+                    await self.run_in_thread(self.jobs.shutdown)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def call_flask(self, scope, body: bytes, receive, send):
+        """Serve a request with the Flask app on the thread pool, relaying streamed responses as they are produced."""
+        loop = asyncio.get_running_loop()
+        messages = asyncio.Queue()
+        disconnected = threading.Event()
+
+        async def watch():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            disconnected.set()
+
+        watcher = asyncio.ensure_future(watch())
+        done = self.run_in_thread(run_wsgi, self.flask_app.wsgi_app, wsgi_environ(scope, body),
+                                  lambda message: loop.call_soon_threadsafe(messages.put_nowait, message),
+                                  disconnected)
+        try:
+            while True:
+                message = await messages.get()
+                await send(message)
+                if message['type'] == 'http.response.body' and not message.get('more_body'):
+                    break
+            await done
+        finally:
+            watcher.cancel()
+
+    def run_in_thread(self, fn, *args):
+        return asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    def turn_kwargs(self, session_id: str, conversation: Dict) -> Dict:
+        """The messages.create() arguments for the next turn of a conversation."""
+        kwargs = dict(self.create_kwargs)
+        if callable(kwargs.get('system')):
+            kwargs['system'] = kwargs['system'](conversation['history'])
+        messages = conversation['history']
+        if self.context is not None:
+            messages = self.context.messages(session_id, conversation, kwargs.get('system'))
+        if self.prompt_cache is not None:
+            kwargs.update(self.prompt_cache.request(kwargs.get('system'), messages))
+        else:
+            kwargs['messages'] = messages
+        return kwargs
+
+    async def begin_turn(self, data: Dict):
+        """Validate a chat request and add the user's message; returns (session_id, conversation, error)."""
+        session_id = data.get('session_id')
+        user_message = data.get('message')
+
+        # The session store and the journal block (SQLite, file writes), so they run off the event loop
+        conversation = await self.run_in_thread(self.sessions.get, session_id) if session_id else None
+        if conversation is None:
+            return session_id, None, 'Invalid session'
+        if not user_message:
+            return session_id, None, 'Message is required'
+
+        conversation['history'].append({"role": "user", "content": user_message})
+        await self.run_in_thread(self.journal.append, f"{self.journal_prefix}{session_id}",
+                                 conversation['history'][-1], False)
+        return session_id, conversation, None
+
+    def end_turn(self, session_id: str, conversation: Dict):
+        """Write the history back and journal the reply, unless /end removed the session in the meantime."""
+        still_active = self.sessions.replace_if_present(session_id, conversation)
+        if still_active and conversation['history'][-1]['role'] == 'assistant':
+            self.journal.append(f"{self.journal_prefix}{session_id}", journal_entry(conversation))
+
+    async def chat(self, data: Dict, send, started: float = None):
+        session_id, conversation, error = await self.begin_turn(data)
+        if error:
+            await send_json(send, {'error': error}, 400)
+            return
+
+        try:
+            with span('build_request', messages=len(conversation['history'])):
+                kwargs = self.turn_kwargs(session_id, conversation)
+            llm_started = time.perf_counter()
+            with span('llm'):
+                message = await self.client.messages.create(**kwargs)
+            assistant_response = message.content[0].text
+
+            conversation['history'].append({"role": "assistant", "content": assistant_response})
+            usage = record_turn(conversation, message, llm_started, started)
+            with span('session_save'):
+                await self.run_in_thread(self.end_turn, session_id, conversation)
+            status, payload = 200, {'response': assistant_response, 'session_id': session_id, 'usage': usage}
+        except Exception as e:
+            # Keep the user's message of the failed turn
+            await self.run_in_thread(self.sessions.replace_if_present, session_id, conversation)
+            status, payload = 500, {'error': f'Error getting response: {str(e)}'}
+
+        await send_json(send, payload, status)
+
+    async def chat_stream(self, data: Dict, send, started: float = None):
+        session_id, conversation, error = await self.begin_turn(data)
+        if error:
+            await send_json(send, {'error': error}, 400)
+            return
+
+        headers = [(b'content-type', b'text/event-stream; charset=utf-8')]
+        headers += [(name.lower().encode(), value.encode()) for name, value in SSE_HEADERS.items()]
+        await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+        try:
+            async for event in astream_chat(self.client, conversation, session_id, started,
+                                            **self.turn_kwargs(session_id, conversation)):
+                await send({'type': 'http.response.body', 'body': event.encode('utf-8'), 'more_body': True})
+        finally:
+            # Write the updated history back and journal the reply once the stream has finished
+            await self.run_in_thread(self.end_turn, session_id, conversation)
+        await send({'type': 'http.response.body', 'body': b''})
@@ -0,0 +1,496 @@
+"""
+Answer quality assessment shared by the /assess_quality endpoints and
+biographer/answer_quality_assessor.py
+
+Each question in a questions CSV is scored against the answers in a text file
+as "full answer", "partial answer" or "0", and the verdicts are written to an
+Answer_Quality column. With batch_size > 1 several questions are scored in one
+call that returns JSON keyed by question id; questions whose verdict is
+missing or malformed in that reply are re-asked one at a time.
+
+Calls run on a thread pool of `concurrency` workers, paced by an optional
+token-bucket rate limit and retried with jittered backoff on 429/5xx errors.
+Output rows always keep the order of the questions file.
+
+With top_k set, only the answers a local BM25 index ranks highest for a
+question are sent with it, and questions no answer matches are scored "0"
+without an LLM call.
+
+With a LocalClassifier, questions whose verdict is obvious from lexical
+overlap and answer length are settled locally and only the uncertain ones
+are escalated to the LLM (see envelope/triage.py).
+
+With a VerdictCache, verdicts already known for the same model, prompt
+version, question and answers are reused instead of re-asking the LLM.
+
+on_verdict() is called as each verdict comes in; the assessor's `progress`
+(an AssessmentProgress) then holds the row and source of that verdict, the
+running totals and an estimate of the time left, for progress output and the
+streaming endpoint.
+"""
+
+import json
+import math
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+from langchain_anthropic import ChatAnthropic
+from langchain.schema import HumanMessage
+
+from envelope.cassette import llm_base_url
+from envelope.checkpoint import AssessmentCheckpoint, assessment_fingerprint, checkpoint_path
+from envelope.metrics import ASSESSMENT_DURATION, ASSESSMENT_QUESTIONS, llm_call
+from envelope.ratelimit import TokenBucket, call_with_retries
+from envelope.retrieval import BM25Index, estimate_tokens
+from envelope.tracing import span
+from envelope.triage import LocalClassifier
+from envelope.verdict_cache import VerdictCache, verdict_key
+
+DEFAULT_MODEL = "claude-3-sonnet-20240229"
+
+# Part of every cache key: bump it whenever the scoring prompts change
+PROMPT_VERSION = "1"
+
+VERDICTS = ("full answer", "partial answer", "0")
+
+CRITERIA = """
+        1. "full answer" - The answers completely and thoroughly address the question with specific details
+        2. "partial answer" - The answers partially address the question but lack some important details or completeness
+        3. "0" - The answers do not address the question at all, or no relevant answer is found
+
+        Consider:
+        - Does any answer directly respond to what the question is asking?
+        - Is the response specific and detailed enough to be considered complete?
+        - Are there multiple aspects to the question that need to be addressed?
+"""
+
+JSON_FENCE = re.compile(r'^```(?:json)?\s*(.*?)\s*```$', re.DOTALL)
+
+
+def normalize_verdict(text: str) -> str:
+    """Map a free-text reply onto one of the three verdicts."""
+    result_str = text.strip().lower()
+    if "full answer" in result_str:
+        return "full answer"
+    elif "partial answer" in result_str:
+        return "partial answer"
+    else:
+        return "0"
+
+
+def parse_batch_verdicts(text: str, question_ids: List[str]) -> Dict[str, str]:
+    """Strictly parse a batched reply.
+
+    The reply must be a single JSON object (optionally inside a ```json fence).
+    Only entries for the requested ids whose value is exactly one of the
+    verdicts are returned; anything else is left out so it can be retried.
+    """
+    text = text.strip()
+    fenced = JSON_FENCE.match(text)
+    if fenced:
+        text = fenced.group(1)
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+
+    verdicts = {}
+    for question_id in question_ids:
+        value = data.get(question_id)
+        if value == 0 and not isinstance(value, bool):
+            value = "0"
+        if isinstance(value, str) and value.strip().lower() in VERDICTS:
+            verdicts[question_id] = value.strip().lower()
+    return verdicts
+
+
+def load_answers(answers_file: str) -> List[str]:
+    """Read an answers file, one answer per numbered item with its continuation lines joined."""
+    with open(answers_file, 'r', encoding='utf-8') as f:
+        content = f.read().strip()
+
+    answers = []
+    if content:
+        lines = content.split('\n')
+        current_answer = ""
+
+        for line in lines:
+            line = line.strip()
+            if line and (line[0].isdigit() and '. ' in line):
+                if current_answer:
+                    answers.append(current_answer.strip())
+                current_answer = line
+            elif line:
+                current_answer += " " + line
+
+        if current_answer:
+            answers.append(current_answer.strip())
+    return answers
+
+
+class AssessmentProgress:
+    """Running totals of an assessment run, updated before each on_verdict() call."""
+
+    def __init__(self, total: int = 0):
+        self.total = total
+        self.done = 0
+        self.counts = {}   # verdict -> questions
+        self.sources = {}  # llm, cache, no_match, local or checkpoint -> questions
+        self.row = None
+        self.source = None
+        self.started = time.perf_counter()
+        self.scoring_started = None
+        self.to_score = 0
+
+    def start_scoring(self, questions: int):
+        """Mark the start of the LLM calls, which the time left is estimated from."""
+        self.scoring_started = time.perf_counter()
+        self.to_score = questions
+
+    def record(self, row: int, quality: str, source: str):
+        self.done += 1
+        self.row = row
+        self.source = source
+        self.counts[quality] = self.counts.get(quality, 0) + 1
+        self.sources[source] = self.sources.get(source, 0) + 1
+
+    def eta(self) -> Optional[float]:
+        """Seconds until the last verdict at the LLM rate so far (None before the first LLM verdict)."""
+        scored = self.sources.get('llm', 0)
+        if scored >= self.to_score:
+            return 0.0
+        if not scored or self.scoring_started is None:
+            return None
+        return (self.to_score - scored) * (time.perf_counter() - self.scoring_started) / scored
+
+    def snapshot(self) -> Dict:
+        eta = self.eta()
+        return {
+            'row': self.row,
+            'source': self.source,
+            'counts': dict(self.counts),
+            'elapsed_s': round(time.perf_counter() - self.started, 2),
+            'eta_s': round(eta, 1) if eta is not None else None,
+        }
+
+
+class AnswerQualityAssessor:
+    def __init__(self, anthropic_api_key: str = None, model: str = DEFAULT_MODEL, batch_size: int = 1,
+                 concurrency: int = 1, requests_per_second: float = None, max_retries: int = 3,
+                 cache: Optional[VerdictCache] = None, top_k: Optional[int] = None, min_score: float = 0.0,
+                 local_tier: Optional[LocalClassifier] = None):
+        """Initialize the assessor with Anthropic API key.
+
+        concurrency is the number of LLM calls in flight at once,
+        requests_per_second caps the call rate (None for no limit) and
+        max_retries bounds the retries of rate-limited or failed calls.
+        cache, if given, stores verdicts across runs. top_k limits the answers
+        sent per question to the k best BM25 matches scoring above min_score
+        (None sends every answer). local_tier, if given, settles confident
+        "0" and "full answer" cases before any LLM call.
+        """
+        self.api_key = anthropic_api_key or os.getenv('ANTHROPIC_API_KEY')
+        if not self.api_key:
+            raise ValueError("ANTHROPIC_API_KEY must be provided either as parameter or environment variable")
+
+        self.model = model
+        self.batch_size = max(1, int(batch_size))
+        self.concurrency = max(1, int(concurrency))
+        self.max_retries = max_retries
+        self.bucket = TokenBucket(requests_per_second) if requests_per_second else None
+        self.cache = cache
+        self.cache_stats = {'hits': 0, 'misses': 0}
+        self.top_k = int(top_k) if top_k else None
+        self.min_score = float(min_score)
+        self.answer_index = None
+        self.retrieval_stats = {}
+        self.local_tier = local_tier
+        self.tier_stats = {}
+        self.progress = AssessmentProgress()
+        self.resumed_rows = 0
+        # Questions whose scoring call failed in the current run; their "0" is not cached
+        self.failed_questions = set()
+        # Through the LLM cassette when LLM_CASSETTE is set (see envelope/cassette.py)
+        base_url = llm_base_url()
+        self.llm = ChatAnthropic(
+            model=model,
+            anthropic_api_key=self.api_key,
+            temperature=0.1,
+            max_retries=0,  # Retries are handled by invoke() so they respect the rate limit
+            **({'anthropic_api_url': base_url} if base_url else {})
+        )
+
+    def invoke(self, prompt: str) -> str:
+        """Send one prompt, rate limited and retried on transient errors."""
+        def attempt():
+            with llm_call(self.model):
+                return self.llm.invoke([HumanMessage(content=prompt)])
+
+        result = call_with_retries(attempt, max_retries=self.max_retries, bucket=self.bucket)
+        return result.content
+
+    def load_questions(self, questions_file: str) -> pd.DataFrame:
+        """Load questions from CSV file."""
+        return pd.read_csv(questions_file)
+
+    def load_answers(self, answers_file: str) -> List[str]:
+        """Load answers from a text file, one answer per numbered item."""
+        answers = load_answers(answers_file)
+
+        # Built once per answers file and shared by every question
+        self.answer_index = BM25Index(answers) if self.top_k else None
+        return answers
+
+    def answer_indices(self, question: str) -> Optional[List[int]]:
+        """Positions of the answers to send with a question, in file order (None for all of them)."""
+        if self.answer_index is None:
+            return None
+        return sorted(idx for idx, _ in self.answer_index.top(question, self.top_k, self.min_score))
+
+    def assess_answer_quality(self, question: str, answers: List[str]) -> str:
+        """Assess the quality of answers for a specific question."""
+        all_answers = "\n".join(answers) if answers else "No answers provided"
+
+        prompt = f"""
+        Evaluate how well the provided answers respond to this specific question:
+        
+        QUESTION: {question}
+        
+        AVAILABLE ANSWERS:
+        {all_answers}
+        
+        Your task is to determine the answer quality based on these criteria:
+        
+        1. "full answer" - The answers completely and thoroughly address the question with specific details
+        2. "partial answer" - The answers partially address the question but lack some important details or completeness
+        3. "0" - The answers do not address the question at all, or no relevant answer is found
+        
+        Consider:
+        - Does any answer directly respond to what the question is asking?
+        - Is the response specific and detailed enough to be considered complete?
+        - Are there multiple aspects to the question that need to be addressed?
+        
+        Respond with ONLY one of these three options: "full answer", "partial answer", or "0"
+        """
+
+        try:
+            return normalize_verdict(self.invoke(prompt))
+        except Exception as e:
+            self.on_error(question, e)
+            self.failed_questions.add(question)
+            return "0"
+
+    def assess_batch(self, questions: Dict[str, str], answers: List[str]) -> Dict[str, str]:
+        """Score several questions, keyed by question id, in a single call.
+
+        Questions the batched reply does not give a valid verdict for fall
+        back to assess_answer_quality().
+        """
+        all_answers = "\n".join(answers) if answers else "No answers provided"
+        question_lines = "\n".join(f"{question_id}: {question}" for question_id, question in questions.items())
+
+        prompt = f"""
+        Evaluate how well the provided answers respond to each of these questions:
+
+        QUESTIONS:
+        {question_lines}
+
+        AVAILABLE ANSWERS:
+        {all_answers}
+
+        For each question, determine the answer quality based on these criteria:
+        {CRITERIA}
+        Respond with ONLY a JSON object mapping every question id to one of "full answer", "partial answer" or "0",
+        for example: {{"{next(iter(questions))}": "partial answer"}}
+        """
+
+        try:
+            verdicts = parse_batch_verdicts(self.invoke(prompt), list(questions))
+        except Exception as e:
+            self.on_error(", ".join(questions), e)
+            verdicts = {}
+
+        for question_id, question in questions.items():
+            if question_id not in verdicts:
+                verdicts[question_id] = self.assess_answer_quality(question, answers)
+        return verdicts
+
+    def on_error(self, question: str, error: Exception):
+        """Called when a scoring call fails (the question is retried or scored "0")."""
+
+    def on_verdict(self, position: int, total: int, question: str, quality: str):
+        """Called once per question as soon as its verdict is known (see self.progress for the details)."""
+
+    def score_chunk(self, chunk: List[Tuple[int, str]], answers: List[str]) -> Dict[str, str]:
+        """Score a chunk of (row index, question) pairs, keyed by question id."""
+        if len(chunk) == 1:
+            idx, question = chunk[0]
+            return {f"Q{idx}": self.assess_answer_quality(question, answers)}
+        return self.assess_batch({f"Q{idx}": question for idx, question in chunk}, answers)
+
+    def process_assessment(self, questions_file: str, answers_file: str, output_file: str = None,
+                           batch_size: Optional[int] = None, concurrency: Optional[int] = None,
+                           use_cache: bool = True, resume: bool = False):
+        """Score every question and write the questions CSV with an Answer_Quality column.
+
+        Returns the output file name and a count of each verdict. Cache hits
+        and misses of the run are left in cache_stats; use_cache=False skips
+        the lookups but still stores the fresh verdicts.
+
+        Verdicts are checkpointed next to the output file as they come in
+        (see envelope/checkpoint.py). With resume=True the rows checkpointed
+        by an interrupted run over the same inputs are kept instead of being
+        scored again; their number is left in resumed_rows.
+        """
+        started = time.perf_counter()
+        batch_size = max(1, int(batch_size or self.batch_size))
+        concurrency = max(1, int(concurrency or self.concurrency))
+        with span('load_inputs'):
+            questions_df = self.load_questions(questions_file)
+            answers = self.load_answers(answers_file)
+
+        if not output_file:
+            base_name = os.path.splitext(questions_file)[0]
+            output_file = f"{base_name}_assessed.csv"
+
+        output_df = questions_df.copy()
+        output_df['Answer_Quality'] = ""
+
+        rows = list(questions_df['Question'].items())
+        total = len(rows)
+        self.cache_stats = {'hits': 0, 'misses': 0}
+        self.failed_questions = set()
+        progress = self.progress = AssessmentProgress(total)
+
+        fingerprint = assessment_fingerprint(self.model, PROMPT_VERSION, [question for _, question in rows], answers,
+                                             self.top_k, self.min_score,
+                                             repr(self.local_tier) if self.local_tier else '')
+        checkpoint = AssessmentCheckpoint(checkpoint_path(output_file), fingerprint)
+        checkpointed = checkpoint.load() if resume else {}
+        checkpoint.open(checkpointed)
+        try:
+            output_file, summary = self._score(rows, answers, output_df, output_file, checkpoint, checkpointed,
+                                               batch_size, concurrency, use_cache)
+        except BaseException:
+            checkpoint.close()
+            raise
+        checkpoint.discard()
+
+        ASSESSMENT_DURATION.observe(time.perf_counter() - started)
+        return output_file, summary
+
+    def _score(self, rows, answers, output_df, output_file, checkpoint, checkpointed, batch_size, concurrency,
+               use_cache):
+        """The body of process_assessment(), once the inputs are loaded and the checkpoint is open."""
+        total = len(rows)
+        progress = self.progress
+
+        def record(chunk, verdicts, source='llm'):
+            ASSESSMENT_QUESTIONS.inc(source, amount=len(chunk))
+            if source != 'checkpoint':
+                # A failed call's "0" is scored again on resume
+                checkpoint.append((idx, verdicts[f"Q{idx}"]) for idx, question in chunk
+                                  if question not in self.failed_questions)
+            for idx, question in chunk:
+                quality = verdicts[f"Q{idx}"]
+                output_df.at[idx, 'Answer_Quality'] = quality
+                progress.record(idx, quality, source)
+                self.on_verdict(progress.done, total, question, quality)
+
+        resumed = [(idx, question) for idx, question in rows if idx in checkpointed]
+        record(resumed, {f"Q{idx}": checkpointed[idx] for idx, _ in resumed}, 'checkpoint')
+        rows = [(idx, question) for idx, question in rows if idx not in checkpointed]
+        self.resumed_rows = len(resumed)
+
+        with span('select_answers', questions=total):
+            selected = {idx: self.answer_indices(str(question)) for idx, question in rows}
+
+        def answers_for(chunk):
+            positions = [selected[idx] for idx, _ in chunk]
+            if any(position is None for position in positions):
+                return answers
+            union = set().union(*positions)
+            return [answer for position, answer in enumerate(answers) if position in union]
+
+        unmatched = []
+        if self.answer_index is not None:
+            # Nothing in the answers file relates to these questions
+            unmatched = [(idx, question) for idx, question in rows if not selected[idx]]
+            record(unmatched, {f"Q{idx}": "0" for idx, _ in unmatched}, 'no_match')
+            rows = [(idx, question) for idx, question in rows if selected[idx]]
+
+        keys = {}
+        if self.cache is not None:
+            with span('cache_lookup', questions=len(rows)):
+                keys = {idx: verdict_key(self.model, PROMPT_VERSION, str(question), answers_for([(idx, question)]))
+                        for idx, question in rows}
+                cached = self.cache.get_many(keys.values()) if use_cache else {}
+            hits = [(idx, question) for idx, question in rows if keys[idx] in cached]
+            record(hits, {f"Q{idx}": cached[keys[idx]] for idx, _ in hits}, 'cache')
+            rows_to_score = [(idx, question) for idx, question in rows if keys[idx] not in cached]
+            self.cache_stats = {'hits': len(hits), 'misses': len(rows_to_score)}
+        else:
+            rows_to_score = rows
+
+        if self.local_tier is not None:
+            # Cached LLM verdicts win over local ones, so the tier only sees the cache misses
+            with span('local_tier', questions=len(rows_to_score)):
+                local = self.local_tier.classify([question for _, question in rows_to_score], answers)
+            settled = [(idx, question) for (idx, question), (verdict, _) in zip(rows_to_score, local) if verdict]
+            record(settled, {f"Q{idx}": verdict for (idx, _), (verdict, _) in zip(rows_to_score, local) if verdict},
+                   'local')
+            rows_to_score = [row for row, (verdict, _) in zip(rows_to_score, local) if not verdict]
+            self.tier_stats = {'settled': len(settled), 'escalated': len(rows_to_score)}
+        else:
+            self.tier_stats = {}
+
+        chunks = [rows_to_score[start:start + batch_size] for start in range(0, len(rows_to_score), batch_size)]
+        chunk_answers = [answers_for(chunk) for chunk in chunks]
+
+        if self.answer_index is not None:
+            # Compared with sending the whole answers file with every call for the same questions
+            full_calls = math.ceil((len(rows_to_score) + len(unmatched)) / batch_size)
+            sent_tokens = sum(estimate_tokens("\n".join(subset)) for subset in chunk_answers)
+            self.retrieval_stats = {
+                'answers_sent': sum(len(subset) for subset in chunk_answers),
+                'questions_without_match': len(unmatched),
+                'input_tokens_saved': full_calls * estimate_tokens("\n".join(answers)) - sent_tokens
+            }
+        else:
+            self.retrieval_stats = {}
+
+        progress.start_scoring(len(rows_to_score))
+        with span('score', questions=len(rows_to_score), chunks=len(chunks), concurrency=concurrency):
+            if concurrency == 1:
+                for chunk, subset in zip(chunks, chunk_answers):
+                    record(chunk, self.score_chunk(chunk, subset))
+            else:
+                with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                    futures = {pool.submit(self.score_chunk, chunk, subset): chunk
+                               for chunk, subset in zip(chunks, chunk_answers)}
+                    try:
+                        # Rows are written by index, so completion order does not affect the output order
+                        for future in as_completed(futures):
+                            record(futures[future], future.result())
+                    except BaseException:
+                        # Only wait for the calls in flight, e.g. when a background job is cancelled
+                        pool.shutdown(cancel_futures=True)
+                        raise
+
+        if self.cache is not None and rows_to_score:
+            with span('cache_store'):
+                self.cache.put_many((keys[idx], output_df.at[idx, 'Answer_Quality'])
+                                    for idx, question in rows_to_score if question not in self.failed_questions)
+
+        with span('write_output'):
+            output_df.to_csv(output_file, index=False)
+
+        quality_counts = output_df['Answer_Quality'].value_counts()
+        summary = {quality: int(count) for quality, count in quality_counts.items()}
+        return output_file, summary
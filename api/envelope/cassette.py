@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Record/replay transport for the Anthropic API
+
+A local proxy that every LLM path reaches through its base URL: the
+interviewer and biographer clients (sync and async), the rolling-context
+summariser and the assessor's ChatAnthropic. It runs in one of three modes:
+
+- record: forward each call upstream and append it to a cassette file, a
+  JSON line per call with the request, the response status and the response
+  body as timed chunks (so streamed replies keep their token timings);
+- replay: answer each call from the cassette without a network connection or
+  API key, with the recorded timings scaled by `speed` (1 as recorded, 0 no
+  latency). Calls are matched on their request body (`exact`), or served in
+  recorded order whatever they contain (`sequence`, for load tests whose
+  requests vary); identical calls get their recordings in turn, then start over;
+- passthrough: forward without recording.
+
+API keys are forwarded but never recorded. Set LLM_CASSETTE to the mode (and
+LLM_CASSETTE_FILE, LLM_CASSETTE_SPEED, LLM_CASSETTE_MATCH, LLM_UPSTREAM) and
+the apps route their calls through an in-process proxy; or run one by hand:
+
+    python -m envelope.cassette serve --mode replay --cassette llm_cassette.jsonl --speed 0 --port 8788
+"""
+
+import argparse
+import codecs
+import functools
+import hashlib
+import http.client
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+MODES = ('record', 'replay', 'passthrough')
+MATCHES = ('exact', 'sequence')
+DEFAULT_UPSTREAM = 'https://api.anthropic.com'
+
+# Request headers that are not passed upstream: hop-by-hop ones, and accept-encoding so the
+# recorded bodies are plain text
+DROPPED_HEADERS = {'host', 'connection', 'content-length', 'accept-encoding', 'keep-alive', 'transfer-encoding'}
+# Response headers that are recorded and replayed
+KEPT_HEADERS = ('content-type', 'retry-after', 'request-id')
+
+
+def request_key(method: str, path: str, body: bytes, match: str = 'exact') -> str:
+    """What a call is looked up by in a cassette."""
+    try:
+        data = json.loads(body or b'{}')
+    except ValueError:
+        data = body.decode('utf-8', 'replace')
+    if match == 'sequence':
+        data = {'stream': bool(isinstance(data, dict) and data.get('stream'))}
+    canonical = json.dumps([method, path.split('?')[0], data], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:32]
+
+
+class Cassette:
+    """Recorded calls in a JSONL file, replayed in recorded order per key."""
+
+    def __init__(self, path: str, match: str = 'exact'):
+        self.path = path
+        self.match = match
+        self._calls: Dict[str, List[Dict]] = defaultdict(list)
+        self._next: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        call = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    key = request_key(call['method'], call['path'],
+                                      json.dumps(call['request']).encode('utf-8'), match)
+                    self._calls[key].append(call)
+
+    def __len__(self):
+        return sum(len(calls) for calls in self._calls.values())
+
+    def next(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            calls = self._calls.get(key)
+            if not calls:
+                return None
+            call = calls[self._next[key] % len(calls)]
+            self._next[key] += 1
+            return call
+
+    def append(self, call: Dict):
+        line = json.dumps(call, ensure_ascii=False) + '\n'
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class CassetteServer:
+    def __init__(self, mode: str, path: str = 'llm_cassette.jsonl', upstream: str = DEFAULT_UPSTREAM,
+                 speed: float = 1.0, match: str = 'exact', host: str = '127.0.0.1', port: int = 0):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode {mode!r} (expected one of {', '.join(MODES)})")
+        if match not in MATCHES:
+            raise ValueError(f"Unknown cassette match {match!r} (expected one of {', '.join(MATCHES)})")
+        self.mode = mode
+        self.upstream = urlsplit(upstream)
+        self.speed = speed
+        self.match = match
+        self.cassette = Cassette(path, match) if mode != 'passthrough' else None
+        if mode == 'replay' and not len(self.cassette):
+            print(f"Cassette {path} has no recorded calls; every call will miss")
+        self.counts = {'requests': 0, 'recorded': 0, 'replayed': 0, 'misses': 0, 'errors': 0}
+        self._lock = threading.Lock()
+        self.httpd = _HTTPServer((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def count(self, name: str):
+        with self._lock:
+            self.counts[name] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self.counts)
+
+    def connect(self) -> http.client.HTTPConnection:
+        connection = http.client.HTTPSConnection if self.upstream.scheme == 'https' else http.client.HTTPConnection
+        return connection(self.upstream.hostname, self.upstream.port, timeout=600)
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == '/stats':
+                    self._send(200, {'content-type': 'application/json'}, json.dumps(server.stats()))
+                else:
+                    self._proxy(b'')
+
+            def do_POST(self):
+                self._proxy(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+
+            def _proxy(self, body: bytes):
+                server.count('requests')
+                if server.mode == 'replay':
+                    self._replay(body)
+                else:
+                    self._forward(body)
+
+            def _send(self, status: int, headers: Dict, text: str):
+                data = text.encode('utf-8')
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _replay(self, body: bytes):
+                call = server.cassette.next(request_key(self.command, self.path, body, server.match))
+                if call is None:
+                    server.count('misses')
+                    self._send(404, {'content-type': 'application/json'}, json.dumps({
+                        'type': 'error',
+                        'error': {'type': 'not_found_error',
+                                  'message': f"No recorded response for this call in {server.cassette.path}"}}))
+                    return
+                server.count('replayed')
+                started = time.perf_counter()
+
+                def wait(offset_ms):
+                    delay = offset_ms / 1000 * server.speed - (time.perf_counter() - started)
+                    if delay > 0:
+                        time.sleep(delay)
+
+                if not call['headers'].get('content-type', '').startswith('text/event-stream'):
+                    wait(call['elapsed_ms'])
+                    self._send(call['status'], call['headers'], "".join(text for _, text in call['chunks']))
+                    return
+                self.send_response(call['status'])
+                for name, value in call['headers'].items():
+                    self.send_header(name, value)
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                self.close_connection = True
+                for offset_ms, text in call['chunks']:
+                    wait(offset_ms)
+                    self.wfile.write(text.encode('utf-8'))
+                    self.wfile.flush()
+
+            def _forward(self, body: bytes):
+                started = time.perf_counter()
+                headers = {name: value for name, value in self.headers.items()
+                           if name.lower() not in DROPPED_HEADERS}
+                try:
+                    connection = server.connect()
+                    connection.request(self.command, server.upstream.path.rstrip('/') + self.path,
+                                       body=body or None, headers=headers)
+                    response = connection.getresponse()
+                except OSError as e:
+                    server.count('errors')
+                    self._send(502, {'content-type': 'application/json'}, json.dumps({
+                        'type': 'error', 'error': {'type': 'api_error', 'message': f"Upstream unreachable: {e}"}}))
+                    return
+
+                kept = {name: response.getheader(name) for name in KEPT_HEADERS if response.getheader(name)}
+                streamed = kept.get('content-type', '').startswith('text/event-stream')
+                decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+                chunks = []
+                if streamed:
+                    # Relay the stream as it arrives, recording when each part came
+                    self.send_response(response.status)
+                    for name, value in kept.items():
+                        self.send_header(name, value)
+                    self.send_header('Connection', 'close')
+                    self.end_headers()
+                    self.close_connection = True
+                try:
+                    if streamed:
+                        while data := response.read1(65536):
+                            chunks.append([round((time.perf_counter() - started) * 1000, 1), decoder.decode(data)])
+                            self.wfile.write(data)
+                            self.wfile.flush()
+                    else:
+                        text = decoder.decode(response.read(), final=True)
+                        chunks.append([round((time.perf_counter() - started) * 1000, 1), text])
+                        self._send(response.status, kept, text)
+                finally:
+                    connection.close()
+
+                if server.mode == 'record':
+                    try:
+                        request = json.loads(body or b'{}')
+                    except ValueError:
+                        request = body.decode('utf-8', 'replace')
+                    server.cassette.append({
+                        'method': self.command,
+                        'path': self.path,
+                        'request': request,
+                        'status': response.status,
+                        'headers': kept,
+                        'chunks': chunks,
+                        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+                    })
+                    server.count('recorded')
+
+        return Handler
+
+
+def create_cassette_server() -> Optional[CassetteServer]:
+    """CassetteServer configured by LLM_CASSETTE (record, replay or passthrough; unset for none),
+    LLM_CASSETTE_FILE, LLM_CASSETTE_SPEED, LLM_CASSETTE_MATCH and LLM_UPSTREAM (default: the
+    ANTHROPIC_BASE_URL the clients would otherwise use, or the Anthropic API)."""
+    mode = os.getenv('LLM_CASSETTE')
+    if not mode or mode == 'off':
+        return None
+    return CassetteServer(
+        mode,
+        path=os.getenv('LLM_CASSETTE_FILE', 'llm_cassette.jsonl'),
+        upstream=os.getenv('LLM_UPSTREAM') or os.getenv('ANTHROPIC_BASE_URL') or DEFAULT_UPSTREAM,
+        speed=float(os.getenv('LLM_CASSETTE_SPEED', 1)),
+        match=os.getenv('LLM_CASSETTE_MATCH', 'exact')
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def llm_base_url() -> Optional[str]:
+    """Base URL every Anthropic client of the process should use: the in-process cassette proxy
+    when LLM_CASSETTE is set, otherwise None (the client's own default)."""
+    server = create_cassette_server()
+    if server is None:
+        return None
+    server.start()
+    print(f"LLM calls go through a {server.mode} cassette proxy at {server.base_url}")
+    return server.base_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record/replay proxy for the Anthropic API')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    serve = subcommands.add_parser('serve', help='Run the proxy')
+    serve.add_argument('--mode', choices=MODES, required=True)
+    serve.add_argument('--cassette', default='llm_cassette.jsonl', help='Cassette file (default: llm_cassette.jsonl)')
+    serve.add_argument('--upstream', default=os.getenv('LLM_UPSTREAM') or DEFAULT_UPSTREAM,
+                       help='API that record and passthrough forward to')
+    serve.add_argument('--speed', type=float, default=1.0, help='Replay timing factor (0: no latency)')
+    serve.add_argument('--match', choices=MATCHES, default='exact', help='How replayed calls are matched')
+    serve.add_argument('--port', type=int, default=8788)
+    args = parser.parse_args()
+
+    server = CassetteServer(args.mode, args.cassette, args.upstream, args.speed, args.match, port=args.port)
+    print(f"Cassette proxy ({args.mode}) listening on {server.base_url}", flush=True)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
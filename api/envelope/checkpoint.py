@@ -0,0 +1,103 @@
+"""
+Checkpoints of assessment runs
+
+The output CSV of an assessment is only written once every question has a
+verdict, so a run killed halfway would lose everything scored so far. Each
+verdict is therefore also appended to a JSON lines checkpoint next to the
+output file as soon as it is known:
+
+    {"fingerprint": "..."}
+    {"row": 0, "quality": "full answer"}
+    {"row": 3, "quality": "0"}
+
+The first line is a fingerprint of everything that determines the verdicts:
+model, prompt version, the questions in file order, the answers and the
+retrieval and local tier settings. A resumed run with the same fingerprint
+takes the checkpointed rows as they are and only scores the rest; any other
+run starts the checkpoint over. The checkpoint is deleted once the output is written.
+
+Lines are flushed as they are written, which survives the process being
+killed; they are not fsynced, so a power loss may drop the last few.
+"""
+
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from envelope.verdict_cache import normalize_answers
+
+CHECKPOINT_SUFFIX = '.checkpoint.jsonl'
+
+
+def assessment_fingerprint(model: str, prompt_version: str, questions: List[str], answers: List[str],
+                           top_k: Optional[int] = None, min_score: float = 0.0, local_tier: str = '') -> str:
+    digest = hashlib.sha256()
+    parts = [model, prompt_version, json.dumps([str(question) for question in questions], ensure_ascii=False),
+             normalize_answers(answers), str(top_k), str(min_score), local_tier]
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def checkpoint_path(output_file: str) -> str:
+    return output_file + CHECKPOINT_SUFFIX
+
+
+class AssessmentCheckpoint:
+    """Verdicts of one assessment run, appended as they are produced."""
+
+    def __init__(self, path: str, fingerprint: str):
+        self.path = path
+        self.fingerprint = fingerprint
+        self._file = None
+
+    def load(self) -> Dict[int, str]:
+        """Verdicts by row of an earlier run with the same fingerprint ({} if there is none)."""
+        verdicts = {}
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                header = json.loads(f.readline() or '{}')
+                if header.get('fingerprint') != self.fingerprint:
+                    return {}
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        verdicts[int(entry['row'])] = entry['quality']
+                    except (ValueError, KeyError, TypeError):
+                        break  # a line cut short when the run was killed
+        except (OSError, ValueError):
+            return {}
+        return verdicts
+
+    def open(self, verdicts: Optional[Dict[int, str]] = None):
+        """Start the checkpoint over with the fingerprint and the verdicts carried over from load()."""
+        # Rewritten rather than appended to, so a line cut short by a kill does not stay in the middle
+        lines = [json.dumps({'fingerprint': self.fingerprint}) + '\n']
+        lines += [json.dumps({'row': int(row), 'quality': quality}, ensure_ascii=False) + '\n'
+                  for row, quality in sorted((verdicts or {}).items())]
+        with open(self.path + '.tmp', 'w', encoding='utf-8') as f:
+            f.writelines(lines)
+        os.replace(self.path + '.tmp', self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def append(self, verdicts: Iterable[Tuple[int, str]]):
+        lines = [json.dumps({'row': int(row), 'quality': quality}, ensure_ascii=False) + '\n'
+                 for row, quality in verdicts]
+        if lines and self._file is not None:
+            self._file.writelines(lines)
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def discard(self):
+        """Close and delete the checkpoint once the run's output is written."""
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
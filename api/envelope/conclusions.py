@@ -0,0 +1,255 @@
+"""
+Conclusions extraction shared by the /conclusions endpoints and
+biographer/conclusions.py
+
+Pulls the text between <response> tags out of the assistant turns of each
+transcript and writes it to a numbered text file next to the transcript.
+A manifest of what was processed (source stats and content hash) lets repeat
+runs skip transcripts that have not changed since their output was written.
+
+Transcripts are parsed one message at a time (iter_messages) so a huge
+transcript is never held in memory as a whole, and with workers > 1 a batch of
+transcripts is spread over a process pool. Output is identical either way.
+"""
+
+import codecs
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional
+
+from envelope.metrics import CONCLUSIONS_DURATION, CONCLUSIONS_FILES
+
+RESPONSE_PATTERN = re.compile(r'<response>(.*?)</response>', re.DOTALL)
+
+BIOGRAPHY_SUMMARY_HEADER = "BIOGRAPHICAL STORY SUMMARY\n" + "=" * 50 + "\n\n"
+
+
+CHUNK_SIZE = 1 << 16
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+
+def iter_messages(filename: str, digest=None) -> Iterator[Dict]:
+    """Yield the messages of a transcript (a JSON array) one at a time.
+
+    Only the message being decoded is buffered. If digest (a hashlib object) is
+    given, it is fed the raw bytes of the file along the way.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    pos = 0
+    eof = False
+    started = False
+
+    with open(filename, 'rb') as f:
+        def fill():
+            nonlocal buffer, pos, eof
+            block = f.read(max(CHUNK_SIZE, len(buffer) - pos))
+            if digest is not None:
+                digest.update(block)
+            eof = not block
+            buffer = buffer[pos:] + decoder.decode(block, final=eof)
+            pos = 0
+
+        while True:
+            while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+                pos += 1
+            if pos == len(buffer):
+                if eof:
+                    raise json.JSONDecodeError("Unexpected end of transcript", buffer, pos)
+                fill()
+                continue
+
+            char = buffer[pos]
+            if not started:
+                if char != '[':
+                    raise json.JSONDecodeError("Transcript is not a JSON array", buffer, pos)
+                started = True
+                pos += 1
+                continue
+            if char == ']':
+                break
+            if char == ',':
+                pos += 1
+                continue
+
+            try:
+                message, end = _decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill()  # The message continues past the end of the buffer
+                continue
+            pos = end
+            yield message
+
+        if digest is not None:
+            for block in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(block)
+
+
+def extract_conclusions(filename: str, digest=None) -> List[str]:
+    """Return the stripped contents of every <response> block in a transcript."""
+    conclusions = []
+    for message in iter_messages(filename, digest):
+        if message['role'] == 'assistant' and '<response>' in message['content']:
+            for match in RESPONSE_PATTERN.findall(message['content']):
+                conclusions.append(match.strip())
+    return conclusions
+
+
+def save_conclusions(conclusions: List[str], conclusion_filename: str, header: str = ""):
+    with open(conclusion_filename, 'w', encoding='utf-8') as f:
+        f.write(header)
+        for i, conclusion in enumerate(conclusions, 1):
+            f.write(f"{i}. {conclusion}\n\n")
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ConclusionsManifest:
+    """Record of which transcripts have been processed into which output.
+
+    Entries are keyed by transcript path. A transcript is current when its
+    output is as recorded and either its mtime/size are unchanged or, failing
+    that, its content hash still matches.
+    """
+
+    def __init__(self, path: str = 'conclusions_manifest.json'):
+        self.path = path
+        self._lock = threading.Lock()
+        self.dirty = False
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.entries = {}
+
+    def is_current(self, source: str, output: str) -> bool:
+        entry = self.entries.get(source)
+        if not entry or entry['output'] != output:
+            return False
+        if entry['count'] and not os.path.exists(output):
+            return False
+
+        stat = os.stat(source)
+        if (stat.st_mtime_ns, stat.st_size) == (entry['mtime_ns'], entry['size']):
+            return True
+        if file_digest(source) != entry['sha256']:
+            return False
+        # Touched but not changed: remember the new stats so the hash is not needed next time
+        with self._lock:
+            entry['mtime_ns'], entry['size'] = stat.st_mtime_ns, stat.st_size
+            self.dirty = True
+        return True
+
+    def update(self, source: str, output: str, count: int, stat: os.stat_result = None, sha256: str = None):
+        stat = stat or os.stat(source)
+        with self._lock:
+            self.entries[source] = {
+                'output': output,
+                'count': count,
+                'mtime_ns': stat.st_mtime_ns,
+                'size': stat.st_size,
+                'sha256': sha256 or file_digest(source)
+            }
+            self.dirty = True
+
+    def save(self):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with self._lock:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, indent=2)
+            self.dirty = False
+        os.replace(tmp, self.path)
+
+
+class NoTranscriptsError(Exception):
+    """There are no transcripts to extract conclusions from."""
+
+
+def output_filename(source: str, suffix: str) -> str:
+    return f"{os.path.splitext(source)[0]}{suffix}"
+
+
+def extract_and_save(source: str, output: str, header: str = "", hash_source: bool = False):
+    """Process one transcript. Runs in a worker process in batch mode."""
+    stat = os.stat(source)
+    digest = hashlib.sha256() if hash_source else None
+    conclusions = extract_conclusions(source, digest)
+    if conclusions:
+        save_conclusions(conclusions, output, header)
+    return source, output, len(conclusions), stat, digest.hexdigest() if digest else None
+
+
+def process_conversations(files: List[str], suffix: str = '_conclusions.txt', header: str = "",
+                          manifest: Optional[ConclusionsManifest] = None, force: bool = False,
+                          workers: int = 1, progress: Optional[Callable[..., None]] = None) -> Dict:
+    """Extract and save conclusions for every transcript that changed.
+
+    Returns {'results': [...], 'processed': n, 'skipped': n}, where results
+    lists (source, output, count) for each processed transcript that had
+    conclusions, in the order of files. With force=True every transcript is
+    processed again; with workers > 1 transcripts are processed in a pool of
+    that many processes. progress(done, total, source=, output=, count=) is
+    called after each transcript; if it raises, the transcripts done so far
+    stay in the manifest.
+    """
+    started = time.perf_counter()
+    pending = []
+    skipped = 0
+    for source in files:
+        output = output_filename(source, suffix)
+        if not force and manifest and manifest.is_current(source, output):
+            skipped += 1
+            continue
+        pending.append((source, output))
+
+    sources = [source for source, _ in pending]
+    outputs = [output for _, output in pending]
+    options = [header] * len(pending), [manifest is not None] * len(pending)
+    results = []
+    processed = 0
+
+    def collect(outcomes):
+        nonlocal processed
+        for source, output, count, stat, sha256 in outcomes:
+            processed += 1
+            if count:
+                results.append((source, output, count))
+            if manifest:
+                manifest.update(source, output, count, stat, sha256)
+            if progress:
+                progress(processed, len(pending), source=source, output=output, count=count)
+
+    try:
+        if workers > 1 and len(pending) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                chunksize = max(1, len(pending) // (workers * 4))
+                try:
+                    collect(pool.map(extract_and_save, sources, outputs, *options, chunksize=chunksize))
+                except BaseException:
+                    pool.shutdown(cancel_futures=True)
+                    raise
+        else:
+            collect(map(extract_and_save, sources, outputs, *options))
+    finally:
+        if manifest and manifest.dirty:
+            manifest.save()
+
+    CONCLUSIONS_FILES.inc('processed', amount=processed)
+    CONCLUSIONS_FILES.inc('skipped', amount=skipped)
+    CONCLUSIONS_DURATION.observe(time.perf_counter() - started)
+    return {'results': results, 'processed': processed, 'skipped': skipped}
@@ -0,0 +1,180 @@
+"""
+Bounded chat context via rolling summarisation
+
+Sending the whole history on every turn makes input tokens and latency grow
+with the length of a session until long interviews hit the context limit.
+RollingContext builds the messages for a turn from
+
+- a running summary of the older turns, sent ahead of the first kept message;
+- the last turns verbatim (at least `keep_turns`), with the <response> notes
+  stripped from the interviewer's replies, since the answers they restate
+  are right there in the user's messages.
+
+Once `batch_turns` turns beyond the kept ones have built up, they are folded
+into the summary by an LLM call on a background thread. Until the new summary
+is ready those turns are still sent verbatim; it is applied on the next turn of
+the session, so only the request path ever modifies a conversation and the
+summary is saved with the session like the rest of it. Between refreshes
+the sent prefix does not change, so it stays in the prompt cache.
+
+conversation['history'] is never modified: /end and the journal persist the
+full raw history. The summary state lives in conversation['context'], with the
+estimated tokens of the full history and of what was sent for the last turn.
+"""
+
+import os
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from envelope.retrieval import estimate_tokens
+
+RESPONSE_BLOCK = re.compile(r'\s*<response>.*?</response>\s*', re.DOTALL)
+
+SUMMARY_HEADER = "Summary of the interview so far (these earlier turns are not repeated below):"
+
+SUMMARY_SYSTEM_PROMPT = """You keep the running summary of an oral history interview.
+You are given the current summary (possibly empty) and the next part of the transcript.
+Return the updated summary only: every fact the interviewee has shared (names, places, dates,
+events, feelings), the notes recorded in <response> tags, and which topics and questions have
+been covered. Keep the interviewee's own wording for important details. Do not add commentary."""
+
+
+def strip_responses(text: str) -> str:
+    """Remove the <response> notes from an interviewer reply."""
+    return RESPONSE_BLOCK.sub(" ", text).strip()
+
+
+def resent(message: Dict) -> Dict:
+    """A history message as it is sent again: interviewer replies without their notes."""
+    if message['role'] != 'assistant' or not isinstance(message['content'], str):
+        return message
+    # A reply made of nothing but notes (the wrap-up listing every answer) is kept as is
+    return {**message, 'content': strip_responses(message['content']) or message['content']}
+
+
+def message_text(content) -> str:
+    return content if isinstance(content, str) else "".join(block.get('text', '') for block in content)
+
+
+def format_transcript(messages: List[Dict]) -> str:
+    speakers = {'user': 'Interviewee', 'assistant': 'Interviewer'}
+    return "\n\n".join(f"{speakers[m['role']]}: {message_text(m['content'])}" for m in messages)
+
+
+def turn_starts(history: List[Dict]) -> List[int]:
+    """Indexes of the user messages that start a turn (a run of user messages counts once)."""
+    return [i for i, message in enumerate(history)
+            if message['role'] == 'user' and (i == 0 or history[i - 1]['role'] == 'assistant')]
+
+
+def count_tokens(system, messages: List[Dict]) -> int:
+    """Rough input tokens of a request (see envelope/retrieval.py)."""
+    system_text = message_text(system) if system else ""
+    return estimate_tokens(system_text) + sum(estimate_tokens(message_text(m['content'])) for m in messages)
+
+
+class AnthropicSummarizer:
+    """Folds transcript turns into the running summary with a Messages API call."""
+
+    def __init__(self, client, model: str = "claude-3-7-sonnet-20250219", max_tokens: int = 4000):
+        self.client = client
+        self.model = model
+        self.max_tokens = max_tokens
+
+    def __call__(self, summary: str, messages: List[Dict]) -> str:
+        prompt = (f"<summary>\n{summary}\n</summary>\n\n"
+                  f"<transcript>\n{format_transcript(messages)}\n</transcript>")
+        message = self.client.messages.create(
+            model=self.model,
+            max_tokens=self.max_tokens,
+            temperature=0,
+            system=SUMMARY_SYSTEM_PROMPT,
+            messages=[{"role": "user", "content": prompt}]
+        )
+        return message.content[0].text.strip()
+
+
+class RollingContext:
+    def __init__(self, summarize: Callable[[str, List[Dict]], str], keep_turns: int = 10,
+                 batch_turns: int = 6, enabled: bool = True, executor: ThreadPoolExecutor = None):
+        """summarize(summary, messages) returns the summary with messages folded in."""
+        self.summarize = summarize
+        self.keep_turns = keep_turns
+        self.batch_turns = batch_turns
+        self.enabled = enabled
+        self.executor = executor or ThreadPoolExecutor(max_workers=2, thread_name_prefix='summarize')
+        self._pending: Dict[str, Tuple[int, int, Future]] = {}
+        self._lock = threading.Lock()
+
+    def messages(self, session_id: str, conversation: Dict, system=None) -> List[Dict]:
+        """The messages to send for the next turn of a conversation (whose last message is the new one)."""
+        history = conversation['history']
+        if not self.enabled:
+            return history
+
+        state = conversation.setdefault('context', {'summary': '', 'summarized': 0})
+        self._apply_finished(session_id, state, history)
+        self._schedule(session_id, state, history)
+
+        messages = [resent(message) for message in history[state['summarized']:]]
+        if state['summary']:
+            first = messages[0]
+            content = [{'type': 'text', 'text': first['content']}] if isinstance(first['content'], str) \
+                else list(first['content'])
+            messages[0] = {**first, 'content': [{'type': 'text', 'text': f"{SUMMARY_HEADER}\n{state['summary']}"}]
+                           + content}
+
+        state['history_tokens'] = count_tokens(system, history)
+        state['sent_tokens'] = count_tokens(system, messages)
+        return messages
+
+    def _apply_finished(self, session_id: str, state: Dict, history: List[Dict]):
+        with self._lock:
+            pending = self._pending.get(session_id)
+            if pending is None or not pending[-1].done():
+                return
+            del self._pending[session_id]
+        start, upto, future = pending
+        try:
+            summary = future.result()
+        except Exception as e:
+            print(f"Summarising session {session_id} failed, keeping its turns verbatim: {e}")
+            return
+        if summary and state['summarized'] == start and upto <= len(history):
+            state['summary'] = summary
+            state['summarized'] = upto
+
+    def _schedule(self, session_id: str, state: Dict, history: List[Dict]):
+        """Start folding the oldest unsummarised turns once batch_turns of them are beyond the kept ones."""
+        starts = [i for i in turn_starts(history) if i >= state['summarized']]
+        if len(starts) < self.keep_turns + self.batch_turns:
+            return
+        upto = starts[-self.keep_turns]
+        with self._lock:
+            if session_id in self._pending:
+                return
+            future = self.executor.submit(self.summarize, state['summary'], history[state['summarized']:upto])
+            self._pending[session_id] = (state['summarized'], upto, future)
+
+    def pending(self, session_id: str) -> Optional[Future]:
+        with self._lock:
+            pending = self._pending.get(session_id)
+        return pending[-1] if pending else None
+
+    def discard(self, session_id: str):
+        """Forget a summary still being computed for a session that has ended."""
+        with self._lock:
+            self._pending.pop(session_id, None)
+
+
+def create_rolling_context(summarize: Callable[[str, List[Dict]], str]) -> RollingContext:
+    """RollingContext configured by CONTEXT_ROLLING (on unless 0), CONTEXT_KEEP_TURNS and
+    CONTEXT_SUMMARY_BATCH."""
+    return RollingContext(
+        summarize,
+        keep_turns=int(os.getenv('CONTEXT_KEEP_TURNS', 10)),
+        batch_turns=int(os.getenv('CONTEXT_SUMMARY_BATCH', 6)),
+        enabled=os.getenv('CONTEXT_ROLLING', '1') != '0'
+    )
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Anthropic Messages API
+
+Serves POST /v1/messages in both the plain JSON and the streaming (SSE) form so
+the chat endpoints can be exercised without an API key or network access.
+Point an anthropic client at it with base_url=server.base_url.
+
+Usage is estimated at about 4 characters a token, and prompt caching is
+emulated: a request reads from the cache the longest prefix an earlier request
+wrote at one of its `cache_control` breakpoints, and writes everything up to
+its own last breakpoint.
+
+For load tests the latencies can be jittered and a share of the calls can be
+failed with an API error (error_rate, error_status); GET /stats reports the
+calls served and the errors injected so far.
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = "Thank you for sharing that. <response>A test conclusion.</response> What happened next?"
+
+ERROR_TYPES = {400: 'invalid_request_error', 429: 'rate_limit_error', 500: 'api_error', 529: 'overloaded_error'}
+
+
+def make_reply(tokens: int) -> str:
+    """An interviewer-style reply of about `tokens` output tokens (as counted by split_tokens)."""
+    filler = " ".join(f"word{i % 50}" for i in range(max(0, tokens - len(split_tokens(DEFAULT_REPLY)))))
+    return f"{filler} {DEFAULT_REPLY}" if filler else DEFAULT_REPLY
+
+
+def split_tokens(text: str):
+    """Split text into word-sized chunks, keeping the whitespace."""
+    return re.findall(r'\S+\s*|\s+', text)
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Load tests open hundreds of connections at once; the default backlog of 5 drops them
+    request_queue_size = 1024
+
+
+class FakeAnthropicServer:
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, reply: str = DEFAULT_REPLY,
+                 first_token_delay: float = 0.0, token_delay: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, error_status: int = 529, seed: int = None):
+        """jitter scales every delay by a random factor in [1 - jitter, 1 + jitter], and error_rate
+        is the share of calls answered with an error_status API error instead of a reply."""
+        self.reply = reply
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = []
+        self.errors = 0
+        self.cached_prefixes = set()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.httpd = _HTTPServer((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def record(self, body: dict):
+        with self._lock:
+            self.requests.append(body)
+
+    def should_fail(self) -> bool:
+        if not self.error_rate:
+            return False
+        with self._lock:
+            failed = self._random.random() < self.error_rate
+            self.errors += failed
+        return failed
+
+    def delay(self, seconds: float):
+        if seconds and self.jitter:
+            with self._lock:
+                seconds *= self._random.uniform(1 - self.jitter, 1 + self.jitter)
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'requests': len(self.requests), 'errors': self.errors}
+
+    def usage(self, body: dict) -> dict:
+        """Input token counts of a request, with cache reads and writes."""
+        system = body.get('system') or []
+        blocks = [{'type': 'text', 'text': system}] if isinstance(system, str) else list(system)
+        for message in body.get('messages', []):
+            content = message['content']
+            for block in ([{'type': 'text', 'text': content}] if isinstance(content, str) else content):
+                blocks.append({**block, 'role': message['role']})
+
+        digest = hashlib.sha256()
+        prefixes, sizes, breakpoints = [], [], []
+        for i, block in enumerate(blocks):
+            text = json.dumps({k: v for k, v in block.items() if k != 'cache_control'}, sort_keys=True)
+            digest.update(text.encode('utf-8'))
+            prefixes.append(digest.hexdigest())
+            sizes.append(len(text) // 4)
+            if 'cache_control' in block:
+                breakpoints.append(i)
+
+        last = breakpoints[-1] if breakpoints else -1
+        with self._lock:
+            hit = max((i for i in range(last + 1) if prefixes[i] in self.cached_prefixes), default=-1)
+            self.cached_prefixes.update(prefixes[i] for i in breakpoints)
+        return {
+            'input_tokens': sum(sizes[last + 1:]),
+            'cache_creation_input_tokens': sum(sizes[hit + 1:last + 1]),
+            'cache_read_input_tokens': sum(sizes[:hit + 1])
+        }
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == '/stats':
+                    self._send_json(200, server.stats())
+                else:
+                    self._send_json(404, {'type': 'error', 'error': {'type': 'not_found_error', 'message': self.path}})
+
+            def do_POST(self):
+                if not self.path.startswith('/v1/messages'):
+                    self._send_json(404, {'type': 'error', 'error': {'type': 'not_found_error', 'message': self.path}})
+                    return
+
+                length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(length) or b'{}')
+                server.record(body)
+
+                if server.should_fail():
+                    self._send_json(server.error_status, {'type': 'error', 'error': {
+                        'type': ERROR_TYPES.get(server.error_status, 'api_error'), 'message': 'Injected error'}})
+                elif body.get('stream'):
+                    self._stream(body)
+                else:
+                    server.delay(server.first_token_delay + server.token_delay * len(split_tokens(server.reply)))
+                    self._send_json(200, self._message(body, server.reply))
+
+            def _message(self, body, text):
+                return {
+                    'id': f"msg_{uuid.uuid4().hex[:24]}",
+                    'type': 'message',
+                    'role': 'assistant',
+                    'model': body.get('model', 'fake-model'),
+                    'content': [{'type': 'text', 'text': text}] if text else [],
+                    'stop_reason': 'end_turn' if text else None,
+                    'stop_sequence': None,
+                    'usage': {**server.usage(body), 'output_tokens': len(split_tokens(text))}
+                }
+
+            def _send_json(self, status, payload):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _event(self, event, payload):
+                self.wfile.write(f"event: {event}\ndata: {json.dumps(payload)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+
+            def _stream(self, body):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Cache-Control', 'no-cache')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                self.close_connection = True
+
+                tokens = split_tokens(server.reply)
+                start = self._message(body, '')
+                start['usage']['output_tokens'] = 1
+                self._event('message_start', {'type': 'message_start', 'message': start})
+                self._event('content_block_start', {'type': 'content_block_start', 'index': 0,
+                                                    'content_block': {'type': 'text', 'text': ''}})
+                server.delay(server.first_token_delay)
+                for i, token in enumerate(tokens):
+                    if i:
+                        server.delay(server.token_delay)
+                    self._event('content_block_delta', {'type': 'content_block_delta', 'index': 0,
+                                                        'delta': {'type': 'text_delta', 'text': token}})
+                self._event('content_block_stop', {'type': 'content_block_stop', 'index': 0})
+                self._event('message_delta', {'type': 'message_delta',
+                                              'delta': {'stop_reason': 'end_turn', 'stop_sequence': None},
+                                              'usage': {'output_tokens': len(tokens)}})
+                self._event('message_stop', {'type': 'message_stop'})
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local fake Anthropic Messages API')
+    parser.add_argument('--port', type=int, default=8787)
+    parser.add_argument('--first-token-delay', type=float, default=0.0, help='Seconds before the first token')
+    parser.add_argument('--token-delay', type=float, default=0.0, help='Seconds between tokens')
+    parser.add_argument('--reply-tokens', type=int, default=0, help='Length of the reply in tokens (default: a short reply)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Scale delays by a random factor in [1-j, 1+j]')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of calls failed with an API error')
+    parser.add_argument('--error-status', type=int, default=529, help='HTTP status of the injected errors')
+    parser.add_argument('--seed', type=int, default=None, help='Seed of the jitter and error injection')
+    args = parser.parse_args()
+
+    server = FakeAnthropicServer(port=args.port, first_token_delay=args.first_token_delay,
+                                 token_delay=args.token_delay, jitter=args.jitter,
+                                 reply=make_reply(args.reply_tokens) if args.reply_tokens else DEFAULT_REPLY,
+                                 error_rate=args.error_rate, error_status=args.error_status, seed=args.seed)
+    print(f"Fake Anthropic API listening on {server.base_url}", flush=True)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
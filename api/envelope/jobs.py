@@ -0,0 +1,365 @@
+"""
+Background jobs for the long-running endpoints
+
+/assess_quality and /conclusions can run for minutes, longer than most proxy
+and serverless timeouts. Submitted with "background": true they are queued
+here instead and the request returns a job id right away; the job runs on a
+small pool of worker threads and its status, progress and result are read
+back from the job endpoints.
+
+Jobs are kept in a SQLite table (WAL mode, like the SQLite session store), so
+any worker process on the host can report on a job and finished results
+outlive the process that ran them. Submitting the same kind of job with the
+same parameters while an identical one is queued or running returns that job
+instead of starting a second one.
+
+On shutdown queued jobs are cancelled and running jobs are asked to stop at
+their next progress report. Jobs left queued or running by a process that died
+are marked failed when the next queue on the host starts.
+
+Settings are read from environment variables, see create_job_queue().
+"""
+
+import atexit
+import hashlib
+import json
+import os
+import queue
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, Optional, Tuple
+
+from envelope.metrics import JOB_WAIT, JOBS_FINISHED, JOBS_QUEUED
+
+# Called as progress(done, total, **detail); jobs keep done and total
+ProgressCallback = Callable[..., None]
+Handler = Callable[[Dict, ProgressCallback], Dict]
+
+ACTIVE = ('queued', 'running')
+
+DEFAULT_RETENTION = 7 * 24 * 60 * 60
+DEFAULT_SHUTDOWN_TIMEOUT = 30.0
+# Progress is written to the table at most this often (and always at the end)
+PROGRESS_INTERVAL = 0.5
+
+
+class JobCancelled(Exception):
+    """Raised from a job's progress callback once the job is cancelled."""
+
+
+def job_key(kind: str, params: Dict) -> str:
+    """What identical submissions are recognized by."""
+    canonical = json.dumps([kind, params], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def isoformat(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp).isoformat(timespec='seconds') if timestamp else None
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobQueue:
+    """A persistent job table served by a pool of worker threads.
+
+    Handlers are registered per kind of job and called as
+    handler(params, progress) on a worker thread; they report progress with
+    progress(done, total, **detail) and return the JSON result of the job.
+    The worker threads start with the first submission.
+    """
+
+    def __init__(self, path: str = 'jobs.sqlite3', workers: int = 1, retention: float = DEFAULT_RETENTION,
+                 shutdown_timeout: float = DEFAULT_SHUTDOWN_TIMEOUT):
+        self.path = path
+        self.workers = max(1, int(workers))
+        self.retention = retention
+        self.shutdown_timeout = shutdown_timeout
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.handlers: Dict[str, Handler] = {}
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        self._queue = queue.Queue()
+        self._threads = []
+        self._queued = set()   # ids waiting in this process
+        self._running = {}     # id -> cancel event of the jobs running in this process
+        self._closed = False
+        self._ready = False
+        atexit.register(self.shutdown)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            # The table is set up on first use, so importing an app writes nothing to disk
+            with self._lock:
+                if not self._ready:
+                    self._setup(conn)
+                    self._ready = True
+        return conn
+
+    def _setup(self, conn: sqlite3.Connection):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL,
+                done INTEGER,
+                total INTEGER,
+                result TEXT,
+                error TEXT,
+                owner TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_key_status ON jobs (key, status)")
+        self._recover(conn)
+
+    def _recover(self, conn: sqlite3.Connection):
+        """Fail the jobs that a dead process on this host left queued or running."""
+        host = self.owner.split(':')[0]
+        rows = conn.execute("SELECT id, owner FROM jobs WHERE status IN (?, ?)", ACTIVE).fetchall()
+        for job_id, owner in rows:
+            owner_host, _, pid = owner.rpartition(':')
+            # A pid equal to ours was reused since: this queue has not run anything yet
+            if owner_host == host and (int(pid) == os.getpid() or not pid_alive(int(pid))):
+                conn.execute("UPDATE jobs SET status = 'failed', error = ?, finished_at = ? "
+                             "WHERE id = ? AND status IN (?, ?)",
+                             ('Interrupted: the server stopped before the job finished', time.time(), job_id, *ACTIVE))
+
+    def register(self, kind: str, handler: Handler):
+        self.handlers[kind] = handler
+
+    def submit(self, kind: str, params: Dict) -> Tuple[Dict, bool]:
+        """Queue a job, or find the identical one already queued or running.
+
+        Returns the job (see get()) and whether it was newly created.
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown kind of job: {kind}")
+        key = job_key(kind, params)
+        now = time.time()
+        conn = self._connect()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The job queue is shut down")
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT id FROM jobs WHERE key = ? AND status IN (?, ?) ORDER BY created_at LIMIT 1",
+                                   (key, *ACTIVE)).fetchone()
+                if row is None:
+                    job_id = uuid.uuid4().hex
+                    conn.execute("INSERT INTO jobs (id, kind, key, params, status, owner, created_at) "
+                                 "VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+                                 (job_id, kind, key, json.dumps(params, ensure_ascii=False), self.owner, now))
+                    conn.execute("DELETE FROM jobs WHERE finished_at < ?", (now - self.retention,))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            if row is not None:
+                return self.get(row[0]), False
+            self._queued.add(job_id)
+            JOBS_QUEUED.inc(kind)
+            self._start_workers()
+        self._queue.put(job_id)
+        return self.get(job_id), True
+
+    def _start_workers(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f"job-worker-{len(self._threads)}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            job_id = self._queue.get()
+            if job_id is None:
+                return
+            self._run(job_id)
+
+    def _run(self, job_id: str):
+        conn = self._connect()
+        cancel = threading.Event()
+        with self._lock:
+            self._queued.discard(job_id)
+            if self._closed:
+                return
+            started = time.time()
+            claimed = conn.execute("UPDATE jobs SET status = 'running', started_at = ? WHERE id = ? AND status = 'queued'",
+                                   (started, job_id)).rowcount
+            if not claimed:
+                return
+            self._running[job_id] = cancel
+        kind, params, created = conn.execute("SELECT kind, params, created_at FROM jobs WHERE id = ?",
+                                             (job_id,)).fetchone()
+        JOBS_QUEUED.dec(kind)
+        JOB_WAIT.observe(started - created, kind)
+
+        last_write = 0.0
+
+        def progress(done: int, total: int, **detail):
+            nonlocal last_write
+            if cancel.is_set():
+                raise JobCancelled()
+            now = time.monotonic()
+            if done >= total or now - last_write >= PROGRESS_INTERVAL:
+                last_write = now
+                conn.execute("UPDATE jobs SET done = ?, total = ? WHERE id = ?", (done, total, job_id))
+
+        status, result, error = 'done', None, None
+        try:
+            result = json.dumps(self.handlers[kind](json.loads(params), progress), ensure_ascii=False)
+        except JobCancelled:
+            status, error = 'cancelled', 'Cancelled at shutdown' if self._closed else 'Cancelled'
+        except Exception as e:
+            status, error = 'failed', str(e)
+        finally:
+            with self._lock:
+                self._running.pop(job_id, None)
+        conn.execute("UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ? AND status = 'running'",
+                     (status, result, error, time.time(), job_id))
+        JOBS_FINISHED.inc(kind, status)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Status and progress of a job, None if there is no such job."""
+        row = self._connect().execute(
+            "SELECT id, kind, status, done, total, error, created_at, started_at, finished_at FROM jobs WHERE id = ?",
+            (job_id,)).fetchone()
+        if row is None:
+            return None
+        job_id, kind, status, done, total, error, created_at, started_at, finished_at = row
+        return {
+            'job_id': job_id,
+            'kind': kind,
+            'status': status,
+            'progress': {'done': done, 'total': total} if total is not None else None,
+            'error': error,
+            'created_at': isoformat(created_at),
+            'started_at': isoformat(started_at),
+            'finished_at': isoformat(finished_at),
+        }
+
+    def result(self, job_id: str) -> Optional[Dict]:
+        """The result of a finished job (None until it is done)."""
+        row = self._connect().execute("SELECT result FROM jobs WHERE id = ? AND status = 'done'",
+                                      (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def cancel(self, job_id: str, reason: str = 'Cancelled') -> bool:
+        """Cancel a job of this process: at once if queued, at its next progress report if running."""
+        with self._lock:
+            if job_id in self._running:
+                self._running[job_id].set()
+                return True
+            if job_id not in self._queued:
+                return False
+            self._queued.discard(job_id)
+            cancelled = self._connect().execute(
+                "UPDATE jobs SET status = 'cancelled', error = ?, finished_at = ? WHERE id = ? AND status = 'queued'",
+                (reason, time.time(), job_id)).rowcount
+        if cancelled:
+            kind = self._connect().execute("SELECT kind FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+            JOBS_QUEUED.dec(kind)
+            JOBS_FINISHED.inc(kind, 'cancelled')
+        return bool(cancelled)
+
+    def shutdown(self, timeout: Optional[float] = None):
+        """Cancel the queued jobs, stop the running ones and wait up to timeout for the workers."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if not self._threads:
+                return
+            queued = list(self._queued)
+            running = list(self._running)
+        for job_id in queued:
+            self.cancel(job_id, 'Cancelled at shutdown')
+        for job_id in running:
+            self.cancel(job_id)
+        for _ in self._threads:
+            self._queue.put(None)
+
+        deadline = time.monotonic() + (self.shutdown_timeout if timeout is None else timeout)
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+        # Jobs still running past the timeout die with the process
+        with self._lock:
+            running = list(self._running)
+        conn = self._connect()
+        for job_id in running:
+            conn.execute("UPDATE jobs SET status = 'cancelled', error = ?, finished_at = ? "
+                         "WHERE id = ? AND status = 'running'", ('Cancelled at shutdown', time.time(), job_id))
+
+
+def submit_job(jobs: JobQueue, kind: str, params: Dict):
+    """Queue a job from a Flask route and answer 202 with where to follow it."""
+    from flask import jsonify, url_for
+
+    job, created = jobs.submit(kind, params)
+    return jsonify({
+        **job,
+        'deduplicated': not created,
+        'status_url': url_for('job_status', job_id=job['job_id']),
+        'result_url': url_for('job_result', job_id=job['job_id']),
+    }), 202
+
+
+def serve_jobs(app, jobs: JobQueue, path: str = '/jobs'):
+    """Add the job status and result routes to a Flask app."""
+    from flask import jsonify
+
+    @app.route(f"{path}/<job_id>", methods=['GET'])
+    def job_status(job_id):
+        job = jobs.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Unknown job'}), 404
+        return jsonify(job)
+
+    @app.route(f"{path}/<job_id>/result", methods=['GET'])
+    def job_result(job_id):
+        job = jobs.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Unknown job'}), 404
+        if job['status'] == 'done':
+            return jsonify(jobs.result(job_id))
+        if job['status'] == 'failed':
+            return jsonify({'error': job['error'], 'job': job}), 500
+        if job['status'] == 'cancelled':
+            return jsonify({'error': job['error'], 'job': job}), 409
+        # Not finished yet
+        return jsonify(job), 202
+
+
+def create_job_queue() -> JobQueue:
+    """Build the job queue configured by environment variables.
+
+    JOB_DB_PATH            SQLite database file (default jobs.sqlite3)
+    JOB_WORKERS            jobs run at once per process (default 1)
+    JOB_RETENTION          seconds finished jobs and their results are kept (default 7 days)
+    JOB_SHUTDOWN_TIMEOUT   seconds running jobs get to stop on shutdown (default 30)
+    """
+    return JobQueue(os.getenv('JOB_DB_PATH', 'jobs.sqlite3'),
+                    workers=int(os.getenv('JOB_WORKERS', 1)),
+                    retention=float(os.getenv('JOB_RETENTION', DEFAULT_RETENTION)),
+                    shutdown_timeout=float(os.getenv('JOB_SHUTDOWN_TIMEOUT', DEFAULT_SHUTDOWN_TIMEOUT)))
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Append-only conversation journals
+
+Every chat turn is appended to a per-session JSONL file as it happens, so a
+session that is never ended is still on disk. Appends only write to the page
+cache; a background committer fsyncs all journals written since its last pass
+in one go (group commit), and writers that need durability wait for the pass
+that covers their line.
+
+Ending a session seals its journal with a rename and compact_journal() writes
+it out right away; compact_journals() catches up on sealed journals left
+behind (e.g. sessions evicted from the store). Both write the usual transcript
+files (`conversation_*.json` / `biographer_story_*.json`) so the existing
+consumers keep working. The accounting records journaled with the replies go to a
+`<stem>.turns.jsonl` sidecar next to the transcript (see envelope/accounting.py).
+Run it by hand with:
+
+    python -m envelope.journal compact --journal-dir journals --output-dir .
+"""
+
+import argparse
+import atexit
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from envelope.accounting import TURNS_SUFFIX, write_turns
+
+OPEN_SUFFIX = '.jsonl'
+SEALED_SUFFIX = '.sealed.jsonl'
+
+
+class ConversationJournal:
+    """Per-session JSONL journals with group-committed fsyncs.
+
+    Journals are keyed by the stem of the transcript they become, e.g.
+    "conversation_0101_1200_3000" is compacted to "conversation_0101_1200_3000.json".
+    """
+
+    def __init__(self, directory: str = 'journals'):
+        self.directory = directory
+        self._cond = threading.Condition()
+        self._dirty = set()
+        self._written = 0  # sequence number of the last appended line
+        self._synced = 0   # every line up to this sequence number is on disk
+        self._failed = None  # (first_seq, last_seq, error) of the last failed fsync pass
+        # The directory and the committer thread are set up on the first write, so importing an app
+        # writes nothing to disk (a read-only serverless filesystem) and starts no thread
+        self._committer = None
+        atexit.register(self.flush)
+
+    def _start(self):
+        """Create the directory and start the committer; the caller holds self._cond."""
+        if self._committer is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._committer = threading.Thread(target=self._commit_loop, daemon=True)
+            self._committer.start()
+
+    def path(self, stem: str) -> str:
+        return os.path.join(self.directory, stem + OPEN_SUFFIX)
+
+    def sealed_path(self, stem: str) -> str:
+        return os.path.join(self.directory, stem + SEALED_SUFFIX)
+
+    def append(self, stem: str, message: Dict, sync: bool = True):
+        """Append one message to a journal.
+
+        With sync=True this returns once the line has been fsynced; lines
+        appended concurrently by other requests share the same fsync.
+        """
+        line = json.dumps(message, ensure_ascii=False) + '\n'
+        path = self.path(stem)
+        with self._cond:
+            self._start()
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(line)
+            self._written += 1
+            seq = self._written
+            self._dirty.add(path)
+            self._cond.notify_all()
+        if sync:
+            self._wait_for(seq)
+
+    def flush(self):
+        """Wait until everything appended so far is on disk."""
+        with self._cond:
+            seq = self._written
+        self._wait_for(seq)
+
+    def seal(self, stem: str) -> str:
+        """Mark a session's journal as finished, ready for compaction."""
+        with self._cond:
+            self._start()
+        self.flush()
+        path = self.path(stem)
+        sealed = self.sealed_path(stem)
+        if not os.path.exists(path):
+            # Sessions without any turns still produce an (empty) transcript
+            open(path, 'a').close()
+        os.replace(path, sealed)
+        return sealed
+
+    def _wait_for(self, seq: int):
+        with self._cond:
+            while self._synced < seq:
+                self._cond.wait()
+            if self._failed and self._failed[0] <= seq <= self._failed[1]:
+                raise self._failed[2]
+
+    def _commit_loop(self):
+        while True:
+            with self._cond:
+                while not self._dirty:
+                    self._cond.wait()
+                dirty, self._dirty = self._dirty, set()
+                upto = self._written
+
+            error = None
+            for path in dirty:
+                try:
+                    fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+                except FileNotFoundError:
+                    # Sealed (renamed) after the write; seal() flushed it first
+                    continue
+                try:
+                    os.fsync(fd)
+                except OSError as e:
+                    error = e
+                finally:
+                    os.close(fd)
+
+            with self._cond:
+                if error:
+                    self._failed = (self._synced + 1, upto, error)
+                self._synced = max(self._synced, upto)
+                self._cond.notify_all()
+
+
+def read_journal_entries(path: str) -> List[Dict]:
+    """Read the lines of a journal, ignoring a torn final line."""
+    entries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return entries
+
+
+def read_journal(path: str) -> List[Dict]:
+    """Read the messages of a journal, ignoring a torn final line."""
+    return [{'role': entry['role'], 'content': entry['content']} for entry in read_journal_entries(path)]
+
+
+def write_transcript(path: str, stem: str, output_dir: str = '.') -> Optional[str]:
+    """Write one journal out as `<stem>.json` (and its turns sidecar); None if the journal is gone."""
+    try:
+        entries = read_journal_entries(path)
+    except FileNotFoundError:
+        return None
+    history = [{'role': entry['role'], 'content': entry['content']} for entry in entries]
+    turns = [entry['turn'] for entry in entries if 'turn' in entry]
+
+    filename = os.path.join(output_dir, f"{stem}.json")
+    tmp = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(history, f, indent=2, ensure_ascii=False)
+    if turns:
+        write_turns(os.path.join(output_dir, f"{stem}{TURNS_SUFFIX}"), turns)
+    os.replace(tmp, filename)
+    return filename
+
+
+def compact_journal(journal_dir: str, stem: str, output_dir: str = '.') -> Optional[str]:
+    """Write out and remove the sealed journal of one session, e.g. right after it ended."""
+    path = os.path.join(journal_dir, stem + SEALED_SUFFIX)
+    filename = write_transcript(path, stem, output_dir)
+    if filename is not None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    return filename
+
+
+def compact_journals(journal_dir: str = 'journals', output_dir: str = '.',
+                     include_open: bool = False, min_idle: float = 0) -> List[str]:
+    """Write sealed journals out as transcript JSON files and remove them.
+
+    With include_open, journals of sessions that were never ended are also
+    written out (and kept) once they have been idle for min_idle seconds.
+    Returns the transcript files written.
+    """
+    if not os.path.isdir(journal_dir):
+        return []
+
+    written = []
+    now = time.time()
+    for name in sorted(os.listdir(journal_dir)):
+        path = os.path.join(journal_dir, name)
+        if name.endswith(SEALED_SUFFIX):
+            stem, sealed = name[:-len(SEALED_SUFFIX)], True
+        elif include_open and name.endswith(OPEN_SUFFIX):
+            stem, sealed = name[:-len(OPEN_SUFFIX)], False
+            try:
+                if now - os.path.getmtime(path) < min_idle:
+                    continue
+            except FileNotFoundError:
+                continue
+        else:
+            continue
+
+        filename = write_transcript(path, stem, output_dir)
+        if filename is None:
+            continue  # Compacted concurrently by another worker
+        written.append(filename)
+
+        if sealed:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage conversation journals')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    compact = subparsers.add_parser('compact', help='Write journals out as transcript JSON files')
+    compact.add_argument('--journal-dir', default=os.getenv('JOURNAL_DIR', 'journals'))
+    compact.add_argument('--output-dir', default='.')
+    compact.add_argument('--include-open', action='store_true',
+                         help='Also write out journals of sessions that were never ended')
+    compact.add_argument('--min-idle', type=float, default=3600,
+                         help='Only write out open journals idle for this many seconds (default 3600)')
+    args = parser.parse_args()
+
+    written = compact_journals(args.journal_dir, args.output_dir, args.include_open, args.min_idle)
+    for filename in written:
+        print(f"Wrote {filename}")
+    print(f"Compacted {len(written)} journals")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""
+Prometheus metrics for the Flask and ASGI apps
+
+A small, dependency-free implementation of counters, gauges and histograms
+rendered in the Prometheus text format (version 0.0.4). Updating a metric
+takes one short lock per metric, so it is safe from request threads,
+assessment worker threads and the event loop alike, and costs about a
+microsecond on the hot path. Gauges backed by a function (session store size
+and bytes) are only evaluated when /metrics is scraped.
+
+instrument_app() adds the route latency hooks and the /metrics route to a
+Flask app, and instrument_client() wraps an Anthropic client so every
+messages.create() and messages.stream() call is timed per model.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+LLM_BUCKETS = (0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+JOB_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 1800.0, 3600.0)
+
+
+def escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        return "\n".join([f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+                         + self.samples())
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        if not values and not self.label_names:
+            values = [((), 0)]
+        return [f"{self.name}{format_labels(self.label_names, labels)} {format_value(value)}"
+                for labels, value in values]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def __init__(self, *args, function: Optional[Callable[[], float]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.function = function
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def samples(self) -> List[str]:
+        if self.function is not None:
+            try:
+                return [f"{self.name} {format_value(self.function())}"]
+            except Exception:
+                return []
+        return super().samples()
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, *args, buckets: Iterable[float] = LATENCY_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [count per bucket (the last one is +Inf), sum]
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def count(self, *labels) -> int:
+        with self._lock:
+            series = self._values.get(labels)
+            return sum(series[0]) if series else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._values.items())
+        lines = []
+        for labels, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{format_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.label_names, labels)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+
+    def get(self, name: str) -> Optional[Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_DURATION = Histogram('http_request_duration_seconds', 'Time to the response headers, per route',
+                          ['route', 'method', 'status'])
+LLM_DURATION = Histogram('llm_request_duration_seconds', 'Duration of Anthropic API calls (whole stream when '
+                         'streamed)', ['model'], buckets=LLM_BUCKETS)
+LLM_ERRORS = Counter('llm_request_errors_total', 'Anthropic API calls that raised', ['model'])
+LLM_IN_FLIGHT = Gauge('llm_requests_in_flight', 'Anthropic API calls currently waiting on a reply')
+ASSESSMENT_QUESTIONS = Counter('assessment_questions_total', 'Questions given an answer quality verdict, by '
+                               'where the verdict came from (llm, cache, no_match, local or checkpoint)', ['source'])
+ASSESSMENT_DURATION = Histogram('assessment_duration_seconds', 'Duration of answer quality assessment runs',
+                                buckets=JOB_BUCKETS)
+CONCLUSIONS_DURATION = Histogram('conclusions_processing_duration_seconds', 'Duration of conclusions '
+                                 'processing runs', buckets=JOB_BUCKETS)
+CONCLUSIONS_FILES = Counter('conclusions_files_total', 'Transcripts seen by conclusions processing, by result '
+                            '(processed or skipped)', ['result'])
+JOBS_QUEUED = Gauge('jobs_queued', 'Background jobs waiting for a worker', ['kind'])
+JOB_WAIT = Histogram('job_queue_wait_seconds', 'Time background jobs waited for a worker', ['kind'],
+                     buckets=JOB_BUCKETS)
+JOBS_FINISHED = Counter('jobs_finished_total', 'Background jobs run to the end, by status (done, failed or '
+                        'cancelled)', ['kind', 'status'])
+
+
+@contextmanager
+def llm_call(model: Optional[str]):
+    """Time one Anthropic API call and count it in flight while it runs.
+
+    Only exceptions count as errors: a client disconnecting mid-stream closes
+    the generator (GeneratorExit), which is not a failed call.
+    """
+    model = model or 'unknown'
+    LLM_IN_FLIGHT.inc()
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        LLM_ERRORS.inc(model)
+        raise
+    finally:
+        LLM_IN_FLIGHT.dec()
+        LLM_DURATION.observe(time.perf_counter() - started, model)
+
+
+class _TrackedStream:
+    """A messages.stream() context manager (sync or async) timed from enter to exit."""
+
+    def __init__(self, manager, model: Optional[str]):
+        self._manager = manager
+        self._tracker = llm_call(model)
+
+    def __enter__(self):
+        self._tracker.__enter__()
+        try:
+            return self._manager.__enter__()
+        except BaseException as e:
+            self._tracker.__exit__(type(e), e, e.__traceback__)
+            raise
+
+    def __exit__(self, *exc):
+        try:
+            return self._manager.__exit__(*exc)
+        finally:
+            self._tracker.__exit__(*exc)
+
+    async def __aenter__(self):
+        self._tracker.__enter__()
+        try:
+            return await self._manager.__aenter__()
+        except BaseException as e:
+            self._tracker.__exit__(type(e), e, e.__traceback__)
+            raise
+
+    async def __aexit__(self, *exc):
+        try:
+            return await self._manager.__aexit__(*exc)
+        finally:
+            self._tracker.__exit__(*exc)
+
+
+class _Messages:
+    def __init__(self, messages):
+        self._messages = messages
+
+    def create(self, **kwargs):
+        with llm_call(kwargs.get('model')):
+            return self._messages.create(**kwargs)
+
+    def stream(self, **kwargs):
+        return _TrackedStream(self._messages.stream(**kwargs), kwargs.get('model'))
+
+    def __getattr__(self, name):
+        return getattr(self._messages, name)
+
+
+class _AsyncMessages(_Messages):
+    async def create(self, **kwargs):
+        with llm_call(kwargs.get('model')):
+            return await self._messages.create(**kwargs)
+
+
+class InstrumentedClient:
+    """An Anthropic or AsyncAnthropic client whose messages calls are recorded in the LLM metrics."""
+
+    def __init__(self, client):
+        self._client = client
+        is_async = type(client.messages).__name__.startswith('Async')
+        self.messages = (_AsyncMessages if is_async else _Messages)(client.messages)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def instrument_client(client):
+    return InstrumentedClient(client)
+
+
+def register_session_store(sessions):
+    """Export the size of a session store, read when /metrics is scraped."""
+    Gauge('sessions_active', 'Sessions in the session store', function=lambda: len(sessions))
+    Gauge('sessions_bytes', 'Serialized size of the sessions in the session store', function=sessions.nbytes)
+
+
+def observe_request(route: str, method: str, status: int, started: float):
+    HTTP_DURATION.observe(time.perf_counter() - started, route, method, str(status))
+
+
+def metrics_response():
+    from flask import Response
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
+def instrument_app(app, sessions, path: str = '/metrics'):
+    """Record the latency of every route of a Flask app and serve the metrics at path."""
+    from flask import g, request
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_latency(response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            observe_request(route, request.method, response.status_code, started)
+        return response
+
+    register_session_store(sessions)
+    app.add_url_rule(path, 'metrics', metrics_response, methods=['GET'])
@@ -0,0 +1,52 @@
+"""
+Prompt caching for the chat endpoints
+
+The system prompt (the template with its question list, ~10k tokens) is the
+same on every turn of a session, and every turn resends the whole history
+before the new message. PromptCache marks both with `cache_control`
+breakpoints so the API serves them from its prompt cache, at a tenth of the
+input price, instead of processing them again:
+
+- the system block, shared by every session on the same prompt (or slice);
+- the last message, so the next turn of the session reads everything before
+  its new message from the cache and only that message is processed in full.
+
+Cached prefixes expire after about five minutes without use. The history in
+the session store and the journal is never modified; only the request is. The
+cache reads and writes of each turn are recorded by envelope/accounting.py.
+"""
+
+import os
+from typing import Dict, List, Union
+
+EPHEMERAL = {'type': 'ephemeral'}
+
+
+def cached_blocks(content: Union[str, List[Dict]]) -> List[Dict]:
+    """Content (a string or content blocks) as content blocks, with a cache breakpoint on the last one."""
+    blocks = [{'type': 'text', 'text': content}] if isinstance(content, str) else [dict(block) for block in content]
+    blocks[-1]['cache_control'] = EPHEMERAL
+    return blocks
+
+
+class PromptCache:
+    def __init__(self, enabled: bool = True, cache_history: bool = True):
+        self.enabled = enabled
+        self.cache_history = cache_history
+
+    def request(self, system, history: List[Dict]) -> Dict:
+        """The `system` and `messages` arguments of messages.create() for a turn, with cache breakpoints."""
+        if not self.enabled:
+            return {'system': system, 'messages': history}
+        messages = list(history)
+        if self.cache_history and messages and messages[-1]['content']:
+            messages[-1] = {**messages[-1], 'content': cached_blocks(messages[-1]['content'])}
+        return {'system': cached_blocks(system) if system else system, 'messages': messages}
+
+
+def create_prompt_cache() -> PromptCache:
+    """PromptCache configured by PROMPT_CACHE (on unless 0) and PROMPT_CACHE_HISTORY (on unless 0;
+    0 caches the system prompt only)."""
+    return PromptCache(enabled=os.getenv('PROMPT_CACHE', '1') != '0',
+                       cache_history=os.getenv('PROMPT_CACHE_HISTORY', '1') != '0')
+
@@ -0,0 +1,252 @@
+"""
+Precompiled system prompts
+
+Every system prompt variant is the `system prompt.txt` template with a question
+bank rendered into {{QUESTIONS_LIST}}. `python -m envelope.prompts build`
+renders all of them into `prompts/<variant>.<sha256 prefix>.txt` and records
+the content hash of each artifact and of its sources, and the number of groups
+of each question bank, in `prompts/manifest.json`.
+
+load_prompt() serves the artifact as is when no source has been modified
+since the build (or when the sources still hash to what was built, so a fresh
+checkout with new mtimes does not count as a change), and renders the prompt
+live from the sources otherwise. Run the build, or `build --check` in CI,
+whenever the template or a question bank changes.
+
+SlicedPrompt renders a per-session variant carrying only the slice of the
+question bank the session is working through (see envelope/questions.py). It
+only loads the bank and template when the manifest says slicing would shrink
+the prompt; a bank with too few groups is served from the artifact alone.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+from typing import Dict, Iterable, List, Optional
+
+from envelope.questions import QuestionBank, load_questions, render_questions, render_system_prompt
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ARTIFACT_DIR = os.path.join(API_DIR, 'prompts')
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+# Appended to a sliced question list so the interviewer does not wrap up at the end of the slice
+CONTINUATION_NOTE = ("(More questions will be added to this list as the interview progresses. "
+                     "Do not conclude the interview before they have been asked.)")
+
+TEMPLATE = 'biographer/system prompt.txt'
+
+# Columns a question bank can be sliced by; the manifest records the number of groups of each
+GROUP_BY = ('Category', 'Field')
+
+# Variant name -> (template, question bank), relative to the api directory
+VARIANTS = {
+    'interviewer': (TEMPLATE, 'biographer/ask_these.csv'),      # index.py, server/app.py
+    'biographer': (TEMPLATE, 'biographer/ask_these.csv'),       # biographer.py
+    'cli': (TEMPLATE, 'biographer/interview-questions.csv'),    # biographer/interviewer.py
+}
+
+
+def sha256_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def sha256_file(path: str) -> str:
+    with open(path, 'rb') as f:
+        return sha256_bytes(f.read())
+
+
+def load_template(name: str) -> str:
+    with open(os.path.join(API_DIR, VARIANTS[name][0]), 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def load_bank(name: str, group_by: str = 'Category') -> QuestionBank:
+    return QuestionBank.from_csv(os.path.join(API_DIR, VARIANTS[name][1]), group_by)
+
+
+def render_prompt(name: str) -> str:
+    """Render a prompt variant from its sources."""
+    return render_system_prompt(load_template(name), load_questions(os.path.join(API_DIR, VARIANTS[name][1])))
+
+
+def read_manifest(directory: str = ARTIFACT_DIR) -> Optional[Dict]:
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get('version') == MANIFEST_VERSION else None
+
+
+def build_prompts(directory: str = ARTIFACT_DIR, names: Iterable[str] = None) -> Dict:
+    """Render the variants into content-addressed artifacts and write the manifest."""
+    os.makedirs(directory, exist_ok=True)
+    manifest = read_manifest(directory) or {'version': MANIFEST_VERSION, 'variants': {}}
+
+    for name in names or VARIANTS:
+        text = render_prompt(name)
+        questions = load_questions(os.path.join(API_DIR, VARIANTS[name][1]))
+        data = text.encode('utf-8')
+        digest = sha256_bytes(data)
+        filename = f"{name}.{digest[:16]}.txt"
+        path = os.path.join(directory, filename)
+        if not os.path.exists(path):
+            tmp = f"{path}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        manifest['variants'][name] = {
+            'file': filename,
+            'sha256': digest,
+            'sources': {source: sha256_file(os.path.join(API_DIR, source)) for source in VARIANTS[name]},
+            'groups': {group_by: len(QuestionBank(questions, group_by)) for group_by in GROUP_BY},
+        }
+
+    tmp = os.path.join(directory, f"{MANIFEST_NAME}.tmp")
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.write('\n')
+    os.replace(tmp, os.path.join(directory, MANIFEST_NAME))
+
+    # Drop artifacts no variant points at any more
+    current = {entry['file'] for entry in manifest['variants'].values()} | {MANIFEST_NAME}
+    for filename in os.listdir(directory):
+        if filename.endswith('.txt') and filename not in current:
+            os.remove(os.path.join(directory, filename))
+    return manifest
+
+
+def is_current(entry: Dict, built_at: float) -> bool:
+    """Whether the sources of a manifest entry are unchanged since the build."""
+    paths = {source: os.path.join(API_DIR, source) for source in entry['sources']}
+    try:
+        if all(os.stat(path).st_mtime <= built_at for path in paths.values()):
+            return True
+        return all(sha256_file(path) == entry['sources'][source] for source, path in paths.items())
+    except OSError:
+        return False
+
+
+def current_entry(name: str, directory: str = ARTIFACT_DIR) -> Optional[Dict]:
+    """The manifest entry of a variant, or None if there is none or its sources changed since the build."""
+    manifest = read_manifest(directory)
+    entry = manifest and manifest['variants'].get(name)
+    if not entry:
+        return None
+    try:
+        built_at = os.stat(os.path.join(directory, MANIFEST_NAME)).st_mtime
+    except OSError:
+        return None
+    return entry if is_current(entry, built_at) else None
+
+
+def load_artifact(name: str, directory: str = ARTIFACT_DIR) -> Optional[str]:
+    """The built prompt for a variant, or None if it is missing, stale or corrupt."""
+    entry = current_entry(name, directory)
+    if not entry:
+        return None
+    try:
+        with open(os.path.join(directory, entry['file']), 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    if sha256_bytes(data) != entry['sha256']:
+        return None
+    return data.decode('utf-8')
+
+
+def built_groups(name: str, group_by: str = 'Category', directory: str = ARTIFACT_DIR) -> Optional[int]:
+    """Number of groups of a variant's question bank as recorded at build time (None if not known)."""
+    entry = current_entry(name, directory)
+    return entry.get('groups', {}).get(group_by) if entry else None
+
+
+def load_prompt(name: str, directory: str = ARTIFACT_DIR) -> str:
+    """The system prompt for a variant: the built artifact if current, else rendered live."""
+    prompt = load_artifact(name, directory)
+    return prompt if prompt is not None else render_prompt(name)
+
+
+class SlicedPrompt:
+    """Per-session system prompts for a variant, carrying only the active slice of its question bank.
+
+    With slicing disabled (or a bank of too few groups to slice) for_history()
+    returns the full prompt, exactly as load_prompt() does, and the sources
+    are not read at all when the artifact is current.
+    """
+
+    def __init__(self, name: str, enabled: bool = True, lookahead: int = 1, coverage: float = 0.5,
+                 group_by: str = 'Category', directory: str = ARTIFACT_DIR):
+        self.name = name
+        self.lookahead = lookahead
+        self.coverage = coverage
+        self.full = load_prompt(name, directory)
+        self.bank = self.template = None
+        if enabled:
+            groups = built_groups(name, group_by, directory)
+            # Without a current build the bank has to be read to find out
+            if groups is None or groups > 1 + lookahead:
+                self.bank = load_bank(name, group_by)
+                self.template = load_template(name)
+        self._rendered: Dict[int, str] = {}
+
+    @property
+    def slicing(self) -> bool:
+        return self.bank is not None and len(self.bank) > 1 + self.lookahead
+
+    def position(self, history: List[Dict]) -> int:
+        return self.bank.position(history, self.coverage) if self.slicing else 0
+
+    def for_history(self, history: List[Dict]) -> str:
+        """System prompt for the next turn of a conversation with this history."""
+        if not self.slicing:
+            return self.full
+        position = self.position(history)
+        prompt = self._rendered.get(position)
+        if prompt is None:
+            questions = render_questions(self.bank.slice(position, self.lookahead))
+            if self.bank.has_more(position, self.lookahead):
+                questions += "\n" + CONTINUATION_NOTE
+            prompt = self._rendered[position] = self.template.replace("{{QUESTIONS_LIST}}", questions)
+        return prompt
+
+
+def create_sliced_prompt(name: str) -> SlicedPrompt:
+    """SlicedPrompt configured by QUESTION_SLICING (on unless 0), QUESTION_LOOKAHEAD,
+    QUESTION_COVERAGE and QUESTION_GROUP_BY (Category or Field)."""
+    return SlicedPrompt(
+        name,
+        enabled=os.getenv('QUESTION_SLICING', '1') != '0',
+        lookahead=int(os.getenv('QUESTION_LOOKAHEAD', 1)),
+        coverage=float(os.getenv('QUESTION_COVERAGE', 0.5)),
+        group_by=os.getenv('QUESTION_GROUP_BY', 'Category')
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the precompiled system prompts')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    build = subcommands.add_parser('build', help='Render every variant into the artifact directory')
+    build.add_argument('--dir', default=ARTIFACT_DIR, help='Artifact directory (default: api/prompts)')
+    build.add_argument('--check', action='store_true',
+                       help='Only check the artifacts are current; exit 1 if any needs rebuilding')
+    args = parser.parse_args()
+
+    if args.check:
+        stale = [name for name in VARIANTS if load_artifact(name, args.dir) != render_prompt(name)]
+        for name in stale:
+            print(f"{name}: artifact missing or out of date")
+        return 1 if stale else 0
+
+    manifest = build_prompts(args.dir)
+    for name, entry in sorted(manifest['variants'].items()):
+        print(f"{name}: {entry['file']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
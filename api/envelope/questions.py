@@ -0,0 +1,90 @@
+"""
+Interview question bank
+
+The question CSVs (Category, Field, Question) are read with the standard csv
+module rather than pandas, which the chat endpoints otherwise do not need and
+which dominates their cold-start import time.
+
+QuestionBank groups the questions by Category (or Field) so a session's system
+prompt can carry only the group being covered plus a small lookahead instead
+of the whole bank. Progress is derived from the conversation itself: every
+<response> summary the interviewer writes counts as one answered question, and
+once enough of the active group is answered the slice moves to the next one.
+Deriving it from the history keeps it correct across the session store,
+journal replays and server restarts without any extra state.
+"""
+
+import csv
+import math
+from typing import Dict, List, Tuple
+
+OVERFLOW = '__overflow__'
+
+
+def load_questions(path: str) -> List[Dict[str, str]]:
+    """Read a question CSV into a list of row dicts.
+
+    Questions containing unquoted commas (as in interview-questions.csv) spill
+    into extra fields; those are joined back onto the last column.
+    """
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.DictReader(f, restkey=OVERFLOW)
+        rows = list(reader)
+    last = reader.fieldnames[-1] if reader.fieldnames else None
+    for row in rows:
+        overflow = row.pop(OVERFLOW, None)
+        if overflow:
+            row[last] = ",".join([row[last]] + overflow)
+    return rows
+
+
+def render_questions(questions: List[Dict[str, str]]) -> str:
+    """Format questions the way the system prompt's {{QUESTIONS_LIST}} expects."""
+    return "\n".join(f"Category: {q['Category']}, Field: {q['Field']}, Question: {q['Question']}" for q in questions)
+
+
+def render_system_prompt(template: str, questions: List[Dict[str, str]]) -> str:
+    return template.replace("{{QUESTIONS_LIST}}", render_questions(questions))
+
+
+class QuestionBank:
+    def __init__(self, questions: List[Dict[str, str]], group_by: str = 'Category'):
+        self.questions = questions
+        self.group_by = group_by
+        self.by_field: Dict[Tuple[str, str], List[Dict[str, str]]] = {}
+        groups: Dict[str, List[Dict[str, str]]] = {}
+        for question in questions:
+            self.by_field.setdefault((question['Category'], question['Field']), []).append(question)
+            groups.setdefault(question[group_by], []).append(question)
+        # Groups keep the order of the CSV, which is the order of the interview
+        self.groups: List[Tuple[str, List[Dict[str, str]]]] = list(groups.items())
+
+    @classmethod
+    def from_csv(cls, path: str, group_by: str = 'Category') -> 'QuestionBank':
+        return cls(load_questions(path), group_by)
+
+    def __len__(self) -> int:
+        return len(self.groups)
+
+    @staticmethod
+    def answered(history: List[Dict]) -> int:
+        """Number of answers the interviewer has recorded in <response> tags."""
+        return sum(message['content'].count('<response>') for message in history
+                   if message.get('role') == 'assistant' and isinstance(message.get('content'), str))
+
+    def position(self, history: List[Dict], coverage: float = 0.5) -> int:
+        """Index of the active group: the first one with fewer than `coverage` of its questions answered."""
+        answered = self.answered(history)
+        for index, (_, questions) in enumerate(self.groups):
+            needed = max(1, math.ceil(coverage * len(questions)))
+            if answered < needed:
+                return index
+            answered -= needed
+        return max(0, len(self.groups) - 1)
+
+    def slice(self, position: int, lookahead: int = 1) -> List[Dict[str, str]]:
+        """Questions of the active group and the `lookahead` groups after it."""
+        return [question for _, questions in self.groups[position:position + 1 + lookahead] for question in questions]
+
+    def has_more(self, position: int, lookahead: int = 1) -> bool:
+        return position + 1 + lookahead < len(self.groups)
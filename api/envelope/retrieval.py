@@ -0,0 +1,82 @@
+"""
+Lexical pre-selection of answers for answer quality assessment
+
+BM25Index scores every answer against a question using Okapi BM25 over
+lowercased, lightly stemmed word tokens (no network, no model). The assessor
+sends only the best-matching answers for each question instead of the whole
+answers file, and a question nothing matches can be scored "0" without an LLM
+call.
+"""
+
+import math
+import re
+from collections import Counter
+from typing import List, Tuple
+
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+NUMBERING = re.compile(r"^\s*\d+\.\s+")
+
+# Rough size of a token for reporting prompt savings (no tokenizer is shipped)
+CHARS_PER_TOKEN = 4
+
+STOPWORDS = frozenset("""
+    a about after all also am an and any are as at be been before being but by can could did do does
+    during for from had has have he her him his how i if in into is it its me more most my no not of on
+    one or our out over she so some than that the their them then there these they this those to too up
+    us was we were what when where which while who whom why will with would you your yours
+""".split())
+
+
+def stem(token: str) -> str:
+    """Strip the commonest English suffixes so "games"/"game" and "played"/"play" match."""
+    if token.endswith("ies") and len(token) > 4:
+        return token[:-3] + "y"
+    for suffix in ("ing", "ed", "s"):
+        if token.endswith(suffix) and not token.endswith("ss") and len(token) - len(suffix) >= 3:
+            return token[:-len(suffix)]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    return [stem(token) for token in TOKEN_PATTERN.findall(NUMBERING.sub("", text).lower())
+            if token not in STOPWORDS and not token.isdigit()]
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN
+
+
+class BM25Index:
+    """BM25 index over a fixed list of documents."""
+
+    def __init__(self, documents: List[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.terms = [Counter(tokenize(document)) for document in documents]
+        self.lengths = [sum(terms.values()) for terms in self.terms]
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        document_frequency = Counter(term for terms in self.terms for term in terms)
+        count = len(documents)
+        self.idf = {term: math.log(1 + (count - df + 0.5) / (df + 0.5)) for term, df in document_frequency.items()}
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def scores(self, query: str) -> List[float]:
+        query_terms = [term for term in set(tokenize(query)) if term in self.idf]
+        scores = []
+        for terms, length in zip(self.terms, self.lengths):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * length / self.average_length) if self.average_length else self.k1
+            for term in query_terms:
+                tf = terms.get(term, 0)
+                if tf:
+                    score += self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            scores.append(score)
+        return scores
+
+    def top(self, query: str, k: int, min_score: float = 0.0) -> List[Tuple[int, float]]:
+        """The (index, score) pairs of the k best documents scoring above min_score, best first."""
+        ranked = sorted(((score, -idx) for idx, score in enumerate(self.scores(query)) if score > min_score),
+                        reverse=True)
+        return [(-idx, score) for score, idx in ranked[:k]]
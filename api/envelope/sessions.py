@@ -0,0 +1,352 @@
+"""
+Session storage for the interview endpoints
+
+Replaces the module-level `active_conversations` dict with a bounded store.
+Sessions are evicted least-recently-used first once the entry or byte cap is
+reached, and after `idle_ttl` seconds without activity. Every evicted session
+is handed to an `on_evict(session_id, conversation)` callback so the caller can
+persist the transcript instead of dropping it.
+
+Two backends share the same dict-like interface:
+
+- MemorySessionStore: in-process, the default
+- SQLiteSessionStore: a SQLite database in WAL mode, so several gunicorn
+  workers on one host can serve the same sessions
+
+Backends are selected with environment variables, see create_session_store().
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+EvictCallback = Callable[[str, Dict], None]
+
+DEFAULT_MAX_ENTRIES = 1000
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_IDLE_TTL = 6 * 60 * 60
+
+
+def conversation_size(conversation: Dict) -> int:
+    """Approximate memory footprint of a conversation as its JSON length."""
+    return len(json.dumps(conversation, ensure_ascii=False))
+
+
+class SessionStore:
+    """Dict-like interface shared by the session backends.
+
+    Conversations returned by get() may be copies (SQLite backend), so callers
+    must write a conversation back with `store[session_id] = conversation`
+    after changing it. A request that may have outlived its session (e.g. an
+    LLM call still in flight when /end ran) writes back with
+    replace_if_present() instead, so the ended session is not brought back.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES,
+                 idle_ttl: float = DEFAULT_IDLE_TTL, on_evict: Optional[EvictCallback] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.on_evict = on_evict
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def put(self, session_id: str, conversation: Dict):
+        raise NotImplementedError
+
+    def replace_if_present(self, session_id: str, conversation: Dict) -> bool:
+        """Store a conversation only if its session is still live; returns whether it was stored."""
+        raise NotImplementedError
+
+    def pop(self, session_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def nbytes(self) -> int:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def __getitem__(self, session_id: str) -> Dict:
+        conversation = self.get(session_id)
+        if conversation is None:
+            raise KeyError(session_id)
+        return conversation
+
+    def __setitem__(self, session_id: str, conversation: Dict):
+        self.put(session_id, conversation)
+
+    def __delitem__(self, session_id: str):
+        if self.pop(session_id) is None:
+            raise KeyError(session_id)
+
+    def _evicted(self, evicted: List[Tuple[str, Dict]]):
+        """Hand evicted sessions to the callback, outside of any lock."""
+        if not self.on_evict:
+            return
+        for session_id, conversation in evicted:
+            try:
+                self.on_evict(session_id, conversation)
+            except Exception as e:
+                print(f"Error persisting evicted session {session_id}: {e}")
+
+
+class MemorySessionStore(SessionStore):
+    """In-process LRU store with idle expiry."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # session_id -> (conversation, size, last_access), least recently used first
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        now = time.time()
+        evicted = []
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            conversation, size, last_access = entry
+            if now - last_access > self.idle_ttl:
+                self._remove(session_id)
+                evicted.append((session_id, conversation))
+                conversation = None
+            else:
+                self._entries[session_id] = (conversation, size, now)
+                self._entries.move_to_end(session_id)
+        self._evicted(evicted)
+        return conversation
+
+    def put(self, session_id: str, conversation: Dict):
+        self._store(session_id, conversation)
+
+    def replace_if_present(self, session_id: str, conversation: Dict) -> bool:
+        return self._store(session_id, conversation, only_if_present=True)
+
+    def _store(self, session_id: str, conversation: Dict, only_if_present: bool = False) -> bool:
+        size = conversation_size(conversation)
+        with self._lock:
+            if session_id in self._entries:
+                self._remove(session_id)
+            elif only_if_present:
+                return False
+            self._entries[session_id] = (conversation, size, time.time())
+            self._bytes += size
+            evicted = self._enforce_limits(keep=session_id)
+        self._evicted(evicted)
+        return True
+
+    def pop(self, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            if session_id not in self._entries:
+                return None
+            return self._remove(session_id)
+
+    def sweep(self):
+        """Evict every session idle for longer than idle_ttl."""
+        with self._lock:
+            evicted = self._enforce_limits()
+        self._evicted(evicted)
+
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, session_id: str) -> Dict:
+        conversation, size, _ = self._entries.pop(session_id)
+        self._bytes -= size
+        return conversation
+
+    def _enforce_limits(self, keep: str = None) -> List[Tuple[str, Dict]]:
+        evicted = []
+        cutoff = time.time() - self.idle_ttl
+        for session_id in list(self._entries):
+            over_limit = len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            expired = self._entries[session_id][2] < cutoff
+            if not (over_limit or expired):
+                # Entries are in access order, so everything after this one is newer
+                break
+            if session_id == keep:
+                continue
+            evicted.append((session_id, self._remove(session_id)))
+        return evicted
+
+
+class SQLiteSessionStore(SessionStore):
+    """SQLite-backed store shared between worker processes.
+
+    The database runs in WAL mode so readers in one worker do not block the
+    writer in another. Limits are enforced on write, and idle sessions are
+    swept at most once every `sweep_interval` seconds.
+    """
+
+    def __init__(self, path: str = 'sessions.sqlite3', sweep_interval: float = 30.0, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.sweep_interval = sweep_interval
+        self._last_sweep = 0.0
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    bytes INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions (last_access)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute("SELECT data, last_access FROM sessions WHERE session_id = ?",
+                           (session_id,)).fetchone()
+        if row is None:
+            return None
+        conversation = json.loads(row[0])
+        if now - row[1] > self.idle_ttl:
+            if self.pop(session_id) is not None:
+                self._evicted([(session_id, conversation)])
+            return None
+        conn.execute("UPDATE sessions SET last_access = ? WHERE session_id = ?", (now, session_id))
+        return conversation
+
+    def put(self, session_id: str, conversation: Dict):
+        self._store(session_id, conversation)
+
+    def replace_if_present(self, session_id: str, conversation: Dict) -> bool:
+        return self._store(session_id, conversation, only_if_present=True)
+
+    def _store(self, session_id: str, conversation: Dict, only_if_present: bool = False) -> bool:
+        data = json.dumps(conversation, ensure_ascii=False)
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if only_if_present:
+                # The check and the write share the transaction, so a concurrent pop() cannot slip in between
+                stored = conn.execute("UPDATE sessions SET data = ?, bytes = ?, last_access = ? WHERE session_id = ?",
+                                      (data, len(data), now, session_id)).rowcount > 0
+            else:
+                conn.execute(
+                    "INSERT OR REPLACE INTO sessions (session_id, data, bytes, last_access) VALUES (?, ?, ?, ?)",
+                    (session_id, data, len(data), now)
+                )
+                stored = True
+            evicted = []
+            if stored:
+                evicted = self._enforce_limits(conn, keep=session_id,
+                                               sweep=now - self._last_sweep > self.sweep_interval)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._evicted(evicted)
+        return stored
+
+    def pop(self, session_id: str) -> Optional[Dict]:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT data FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if row is not None:
+                conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return json.loads(row[0]) if row else None
+
+    def sweep(self):
+        """Evict every session idle for longer than idle_ttl."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            evicted = self._enforce_limits(conn, sweep=True)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._evicted(evicted)
+
+    def nbytes(self) -> int:
+        return self._connect().execute("SELECT COALESCE(SUM(bytes), 0) FROM sessions").fetchone()[0]
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def _take(self, conn: sqlite3.Connection, rows) -> List[Tuple[str, Dict]]:
+        evicted = []
+        for session_id, data in rows:
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            evicted.append((session_id, json.loads(data)))
+        return evicted
+
+    def _enforce_limits(self, conn: sqlite3.Connection, keep: str = None, sweep: bool = False) -> List[Tuple[str, Dict]]:
+        """Delete sessions over the limits inside the caller's transaction and return them."""
+        evicted = []
+        if sweep:
+            self._last_sweep = time.time()
+            rows = conn.execute("SELECT session_id, data FROM sessions WHERE last_access < ? AND session_id != ?",
+                                (time.time() - self.idle_ttl, keep or '')).fetchall()
+            evicted += self._take(conn, rows)
+
+        count, total_bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM sessions").fetchone()
+        if count <= self.max_entries and total_bytes <= self.max_bytes:
+            return evicted
+
+        oldest = conn.execute("SELECT session_id, data, bytes FROM sessions WHERE session_id != ? ORDER BY last_access",
+                              (keep or '',))
+        rows = []
+        for session_id, data, size in oldest:
+            if count <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            rows.append((session_id, data))
+            count -= 1
+            total_bytes -= size
+        return evicted + self._take(conn, rows)
+
+
+def create_session_store(on_evict: Optional[EvictCallback] = None) -> SessionStore:
+    """Build the session store configured by environment variables.
+
+    SESSION_STORE          'memory' (default) or 'sqlite'
+    SESSION_DB_PATH        SQLite database file (default sessions.sqlite3)
+    SESSION_MAX_ENTRIES    maximum number of live sessions
+    SESSION_MAX_BYTES      maximum total size of live sessions
+    SESSION_IDLE_TTL       seconds of inactivity before a session is evicted
+    """
+    options = {
+        'max_entries': int(os.getenv('SESSION_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)),
+        'max_bytes': int(os.getenv('SESSION_MAX_BYTES', DEFAULT_MAX_BYTES)),
+        'idle_ttl': float(os.getenv('SESSION_IDLE_TTL', DEFAULT_IDLE_TTL)),
+        'on_evict': on_evict,
+    }
+    backend = os.getenv('SESSION_STORE', 'memory').lower()
+    if backend == 'sqlite':
+        return SQLiteSessionStore(path=os.getenv('SESSION_DB_PATH', 'sessions.sqlite3'), **options)
+    if backend != 'memory':
+        raise ValueError(f"Unknown SESSION_STORE backend: {backend}")
+    return MemorySessionStore(**options)
@@ -0,0 +1,184 @@
+"""
+Metadata index for saved biographer stories
+
+Keeps message counts and file stats of every `biographer_story_*.json` in a
+small SQLite database so /api/biographer/stories can page, sort and filter
+without opening the transcripts. A story is parsed once when it is saved (or
+first seen) and again only when its mtime or size changes.
+
+The directory is rescanned (stat only) when its own mtime changes, which
+catches stories added, renamed or deleted behind the index's back; the rows of
+each returned page are re-validated individually to catch in-place edits.
+The database therefore lives in a `.story_index/` subdirectory by default:
+creating or removing its WAL files there does not touch the mtime of the
+scanned directory, which would otherwise trigger a rescan on every request.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+SORT_COLUMNS = {
+    'modified': 'mtime_ns',
+    'filename': 'filename',
+    'message_count': 'message_count',
+    'size': 'size',
+}
+
+# Directory mtimes this recent may still be followed by changes in the same tick
+MTIME_SETTLE_NS = 1_000_000_000
+
+# Subdirectory of the stories directory holding the index database by default
+INDEX_DIR = '.story_index'
+
+
+class StoryIndex:
+    def __init__(self, directory: str = '.', path: str = None, prefix: str = 'biographer_story_'):
+        self.directory = directory
+        if not path:
+            os.makedirs(os.path.join(directory, INDEX_DIR), exist_ok=True)
+            path = os.path.join(directory, INDEX_DIR, 'stories_index.sqlite3')
+        self.path = path
+        self.prefix = prefix
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS stories (
+                filename TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                message_count INTEGER NOT NULL,
+                session_info TEXT NOT NULL
+            )
+        """)
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)")
+        for column in SORT_COLUMNS.values():
+            if column != 'filename':
+                conn.execute(f"CREATE INDEX IF NOT EXISTS stories_{column} ON stories ({column})")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def is_story(self, filename: str) -> bool:
+        return filename.startswith(self.prefix) and filename.endswith('.json')
+
+    def record(self, filename: str, stat: os.stat_result = None) -> Optional[Dict]:
+        """Parse a story and store its metadata. Call this whenever a story is saved."""
+        filename = os.path.basename(filename)
+        path = os.path.join(self.directory, filename)
+        try:
+            stat = stat or os.stat(path)
+            with open(path, 'r', encoding='utf-8') as f:
+                conversation = json.load(f)
+        except FileNotFoundError:
+            self._connect().execute("DELETE FROM stories WHERE filename = ?", (filename,))
+            return None
+        except json.JSONDecodeError as e:
+            print(f"Skipping unreadable story {filename}: {e}")
+            return None
+
+        story = {
+            'filename': filename,
+            'message_count': len(conversation),
+            'session_info': filename.split('_')[2:4]  # Extract date from filename
+        }
+        self._connect().execute(
+            "INSERT OR REPLACE INTO stories (filename, mtime_ns, size, message_count, session_info) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (filename, stat.st_mtime_ns, stat.st_size, story['message_count'], json.dumps(story['session_info']))
+        )
+        return story
+
+    def refresh(self, force: bool = False) -> int:
+        """Bring the index in line with the directory if it has changed.
+
+        Only files that are new or whose mtime/size differ are parsed. Returns
+        the number of stories (re)parsed or dropped.
+        """
+        conn = self._connect()
+        dir_mtime = os.stat(self.directory).st_mtime_ns
+        row = conn.execute("SELECT value FROM meta WHERE key = 'dir_mtime_ns'").fetchone()
+        if not force and row is not None and row[0] == dir_mtime:
+            return 0
+
+        known = {filename: (mtime, size) for filename, mtime, size in
+                 conn.execute("SELECT filename, mtime_ns, size FROM stories")}
+        changed = 0
+        seen = set()
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not (entry.is_file() and self.is_story(entry.name)):
+                    continue
+                seen.add(entry.name)
+                stat = entry.stat()
+                if known.get(entry.name) != (stat.st_mtime_ns, stat.st_size):
+                    self.record(entry.name, stat)
+                    changed += 1
+
+        for filename in set(known) - seen:
+            conn.execute("DELETE FROM stories WHERE filename = ?", (filename,))
+            changed += 1
+
+        if time.time_ns() - dir_mtime > MTIME_SETTLE_NS:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('dir_mtime_ns', ?)", (dir_mtime,))
+        return changed
+
+    def query(self, page: int = 1, page_size: Optional[int] = 100, sort: str = 'modified', order: str = 'desc',
+              search: str = None, min_messages: int = None) -> Tuple[List[Dict], int]:
+        """Return one page of stories (all of them if page_size is None) and the total number matching the filters."""
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"sort must be one of: {', '.join(SORT_COLUMNS)}")
+        if order not in ('asc', 'desc'):
+            raise ValueError("order must be 'asc' or 'desc'")
+        if page < 1 or (page_size is not None and page_size < 1):
+            raise ValueError("page and page_size must be positive")
+
+        self.refresh()
+
+        where, params = [], []
+        if search:
+            where.append("instr(filename, ?) > 0")
+            params.append(search)
+        if min_messages is not None:
+            where.append("message_count >= ?")
+            params.append(min_messages)
+        where_sql = f"WHERE {' AND '.join(where)}" if where else ""
+
+        conn = self._connect()
+        total = conn.execute(f"SELECT COUNT(*) FROM stories {where_sql}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT filename, mtime_ns, size, message_count, session_info FROM stories {where_sql} "
+            f"ORDER BY {SORT_COLUMNS[sort]} {order.upper()}, filename LIMIT ? OFFSET ?",
+            # LIMIT -1 is no limit in SQLite
+            params + ([page_size, (page - 1) * page_size] if page_size is not None else [-1, 0])
+        ).fetchall()
+
+        stories = []
+        for filename, mtime, size, message_count, session_info in rows:
+            try:
+                stat = os.stat(os.path.join(self.directory, filename))
+            except FileNotFoundError:
+                conn.execute("DELETE FROM stories WHERE filename = ?", (filename,))
+                total -= 1
+                continue
+            if (stat.st_mtime_ns, stat.st_size) != (mtime, size):
+                # Edited in place since it was indexed
+                story = self.record(filename, stat)
+                if story:
+                    stories.append(story)
+                continue
+            stories.append({
+                'filename': filename,
+                'message_count': message_count,
+                'session_info': json.loads(session_info)
+            })
+        return stories, total
@@ -0,0 +1,152 @@
+"""
+Token streaming for the chat endpoints
+
+Relays a Messages API stream to the browser as Server-Sent Events so the first
+words of a reply show up as soon as Claude produces them instead of after the
+whole reply has been generated.
+
+stream_progress() does the same for long-running work such as assessments:
+each progress report is sent as an event as soon as it is made.
+"""
+
+import contextvars
+import json
+import queue
+import threading
+import time
+from typing import AsyncIterator, Callable, Dict, Iterator
+
+from envelope.accounting import record_turn
+
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no',  # Stop nginx/Vercel proxies from buffering the stream
+}
+
+
+# Sent when nothing else was for this long, so proxies do not close an idle stream
+KEEPALIVE_INTERVAL = 15.0
+
+
+class StreamClosed(Exception):
+    """Raised from a progress callback once the client has gone."""
+
+
+def sse_event(event: str, data: Dict) -> str:
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def stream_progress(run: Callable[[Dict, Callable], Dict], params: Dict, event: str = 'progress',
+                    error_prefix: str = 'Error') -> Iterator[str]:
+    """Run run(params, progress) on a thread and relay it as SSE events.
+
+    Each progress(done, total, **detail) call becomes an `event` event, and the
+    result a final `done` event (or an `error` event if run raised). If the
+    client disconnects, the next progress call raises StreamClosed so the work
+    stops early.
+    """
+    events = queue.Queue()
+    closed = threading.Event()
+
+    def progress(done: int, total: int, **detail):
+        if closed.is_set():
+            raise StreamClosed()
+        events.put(sse_event(event, {'done': done, 'total': total, **detail}))
+
+    def work():
+        try:
+            events.put(sse_event('done', run(params, progress)))
+        except StreamClosed:
+            pass
+        except Exception as e:
+            events.put(sse_event('error', {'error': f'{error_prefix}: {str(e)}'}))
+        finally:
+            events.put(None)
+
+    # The copied context keeps the spans of the work under the request's trace
+    threading.Thread(target=contextvars.copy_context().run, args=(work,), daemon=True).start()
+    try:
+        while True:
+            try:
+                message = events.get(timeout=KEEPALIVE_INTERVAL)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            if message is None:
+                return
+            yield message
+    finally:
+        closed.set()
+
+
+def stream_chat(client, conversation: Dict, session_id: str, request_started: float = None,
+                **create_kwargs) -> Iterator[str]:
+    """Stream Claude's reply for a conversation as SSE events.
+
+    Emits a `token` event per text delta, then a single `done` event carrying
+    the full reply, timings and the turn's accounting record (see
+    envelope/accounting.py; request_started is when the request arrived, for
+    the server latency). The finished reply is appended to
+    conversation['history'] only once the stream has completed, so an aborted
+    stream leaves the history exactly as a failed non-streaming call would.
+    create_kwargs may include `messages` to send the history in another form
+    (e.g. with cache breakpoints, see envelope/prompt_cache.py).
+    """
+    started = time.perf_counter()
+    time_to_first_token = None
+    parts = []
+
+    try:
+        with client.messages.stream(**{'messages': conversation['history'], **create_kwargs}) as stream:
+            for text in stream.text_stream:
+                if time_to_first_token is None:
+                    time_to_first_token = time.perf_counter() - started
+                parts.append(text)
+                yield sse_event('token', {'text': text})
+            final = stream.get_final_message()
+    except Exception as e:
+        yield sse_event('error', {'error': f'Error getting response: {str(e)}'})
+        return
+
+    yield finish_stream(conversation, session_id, parts, started, time_to_first_token, final, request_started)
+
+
+async def astream_chat(client, conversation: Dict, session_id: str, request_started: float = None,
+                       **create_kwargs) -> AsyncIterator[str]:
+    """stream_chat() for an AsyncAnthropic client."""
+    started = time.perf_counter()
+    time_to_first_token = None
+    parts = []
+
+    try:
+        async with client.messages.stream(**{'messages': conversation['history'], **create_kwargs}) as stream:
+            async for text in stream.text_stream:
+                if time_to_first_token is None:
+                    time_to_first_token = time.perf_counter() - started
+                parts.append(text)
+                yield sse_event('token', {'text': text})
+            final = await stream.get_final_message()
+    except Exception as e:
+        yield sse_event('error', {'error': f'Error getting response: {str(e)}'})
+        return
+
+    yield finish_stream(conversation, session_id, parts, started, time_to_first_token, final, request_started)
+
+
+def finish_stream(conversation: Dict, session_id: str, parts, started: float, time_to_first_token,
+                  final=None, request_started: float = None) -> str:
+    """Append the completed reply (and its accounting record) to the conversation and build the `done` event."""
+    assistant_response = "".join(parts)
+    conversation['history'].append({"role": "assistant", "content": assistant_response})
+    time_to_first_token_ms = round(time_to_first_token * 1000, 1) if time_to_first_token is not None else None
+    usage = record_turn(conversation, final, started, request_started, streamed=True,
+                        time_to_first_token_ms=time_to_first_token_ms)
+
+    return sse_event('done', {
+        'response': assistant_response,
+        'session_id': session_id,
+        'time_to_first_token_ms': time_to_first_token_ms,
+        'total_time_ms': usage['llm_ms'],
+        'usage': usage
+    })
@@ -0,0 +1,344 @@
+"""
+Request tracing spans and opt-in per-request profiling
+
+span() times a stage of a request (parsing, loading the session, building the
+prompt, the LLM call, journal writes, ...). Spans nest through a context
+variable, so they follow a request across functions without being passed
+around, and the spans of one request are written to the trace file together,
+as JSON lines, when its root span ends:
+
+    {"trace": "9f1c...", "span": 3, "parent": 1, "name": "llm", "start": 1718000000.123456, "ms": 812.4}
+
+Tracing is off unless TRACE_FILE is set, and span() then costs a function call.
+TRACE_MIN_MS only keeps the traces of requests slower than that many ms.
+
+trace_app() opens a root span per Flask request and, when asked, profiles it:
+
+- PROFILE_TOKEN set: requests sent with `X-Profile: <token>` are profiled;
+- PROFILE_REQUESTS=1: every request is profiled (development only);
+- PROFILE_MODE (or the `X-Profile-Mode` header): `cprofile` (default) writes
+  a pstats `.prof` file (snakeviz, flameprof, gprof2dot), `sample` samples
+  the request thread's stack every PROFILE_INTERVAL_MS (default 5) and writes
+  collapsed stacks to a `.folded` file (flamegraph.pl, speedscope, inferno).
+
+Profiles go to PROFILE_DIR (default `profiles`) and the response names the
+file in an `X-Profile-File` header. Streamed replies are profiled and traced
+until the stream ends.
+
+The summary command reports the p50/p95/max time of every stage per route:
+
+    python -m envelope.tracing summary trace.jsonl
+"""
+
+import argparse
+import contextvars
+import itertools
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+PROFILE_MODES = ('cprofile', 'sample')
+
+_current = contextvars.ContextVar('trace_span', default=None)
+
+# Built once: json.dumps() with options builds an encoder per call
+_encode = json.JSONEncoder(default=str).encode
+
+
+class Span:
+    __slots__ = ('tracer', 'trace_id', 'span_id', 'parent', 'name', 'attrs', 'start', 'started', 'records', '_ids')
+
+    def __init__(self, tracer: 'Tracer', name: str, parent: Optional['Span'], attrs: Dict):
+        self.tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.attrs = attrs
+        if parent is None:
+            self.trace_id = uuid.uuid4().hex[:16]
+            self.records = []
+            self._ids = itertools.count(1)
+        else:
+            self.trace_id = parent.trace_id
+            self.records = parent.records
+            self._ids = parent._ids
+        self.span_id = next(self._ids)
+        self.start = time.time()
+        self.started = time.perf_counter()
+        _current.set(self)
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def finish(self):
+        """End the span; ending the root span writes the trace."""
+        ms = (time.perf_counter() - self.started) * 1000
+        self.records.append({
+            'trace': self.trace_id,
+            'span': self.span_id,
+            'parent': self.parent.span_id if self.parent is not None else None,
+            'name': self.name,
+            'start': round(self.start, 6),
+            'ms': round(ms, 3),
+            **self.attrs
+        })
+        _current.set(self.parent)
+        if self.parent is None and ms >= self.tracer.min_ms:
+            self.tracer.write(self.records)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        self.finish()
+        return False
+
+
+class NullSpan:
+    """What span() returns while tracing is off."""
+    trace_id = None
+
+    def set(self, **attrs):
+        pass
+
+    def finish(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Tracer:
+    def __init__(self, path: Optional[str] = None, min_ms: float = 0.0):
+        """Spans are written to path as JSON lines (no path turns tracing off)."""
+        self.path = path
+        self.enabled = bool(path)
+        self.min_ms = min_ms
+        self._lock = threading.Lock()
+        self._file = None
+
+    def span(self, name: str, **attrs):
+        """A span that is a child of the current one (or the root of a new trace)."""
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, _current.get(), attrs)
+
+    def write(self, records: List[Dict]):
+        # The children end first; the file lists a trace root first
+        lines = "".join(_encode(record) + "\n" for record in reversed(records))
+        try:
+            with self._lock:
+                if self._file is None:
+                    self._file = open(self.path, 'a', encoding='utf-8')
+                self._file.write(lines)
+                self._file.flush()
+        except OSError as e:
+            print(f"Could not write trace to {self.path}: {e}")
+
+
+def create_tracer() -> Tracer:
+    """Tracer configured by TRACE_FILE and TRACE_MIN_MS."""
+    return Tracer(os.getenv('TRACE_FILE') or None, float(os.getenv('TRACE_MIN_MS', 0)))
+
+
+TRACER = create_tracer()
+
+
+def span(name: str, **attrs):
+    """Time a stage of the current request: `with span('llm', model=model): ...`"""
+    return TRACER.span(name, **attrs)
+
+
+def current_span():
+    return _current.get() or NULL_SPAN
+
+
+class CProfiler:
+    suffix = '.prof'
+
+    def __init__(self):
+        import cProfile
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def stop(self, path: str):
+        self.profile.disable()
+        self.profile.dump_stats(path)
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Samples the stack of one thread at a fixed interval into collapsed stacks."""
+    suffix = '.folded'
+
+    def __init__(self, thread_id: int = None, interval: float = 0.005):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name='stack-sampler')
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self, path: str):
+        self._stop.set()
+        self._thread.join()
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class Profiling:
+    def __init__(self, directory: str = 'profiles', token: Optional[str] = None, every_request: bool = False,
+                 mode: str = 'cprofile', interval: float = 0.005):
+        self.directory = directory
+        self.token = token
+        self.every_request = every_request
+        self.mode = mode if mode in PROFILE_MODES else 'cprofile'
+        self.interval = interval
+
+    def requested(self, headers) -> Optional[str]:
+        """The profiling mode asked for by a request's headers (None for no profile)."""
+        if not self.every_request and not (self.token and headers.get('X-Profile') == self.token):
+            return None
+        mode = headers.get('X-Profile-Mode', self.mode)
+        return mode if mode in PROFILE_MODES else self.mode
+
+    def start(self, mode: str):
+        try:
+            return StackSampler(interval=self.interval) if mode == 'sample' else CProfiler()
+        except ValueError as e:
+            # Python 3.12+ allows a single cProfile at a time
+            print(f"Not profiling this request: {e}")
+            return None
+
+    def path(self, profiler, name: str, trace_id: Optional[str]) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        name = re.sub(r'[^A-Za-z0-9_.-]+', '_', name or 'request')
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        return os.path.join(self.directory, f"{stamp}_{name}_{trace_id or uuid.uuid4().hex[:16]}{profiler.suffix}")
+
+
+def create_profiling() -> Profiling:
+    """Profiling configured by PROFILE_DIR, PROFILE_TOKEN, PROFILE_REQUESTS, PROFILE_MODE and PROFILE_INTERVAL_MS."""
+    return Profiling(
+        directory=os.getenv('PROFILE_DIR', 'profiles'),
+        token=os.getenv('PROFILE_TOKEN') or None,
+        every_request=os.getenv('PROFILE_REQUESTS', '0') == '1',
+        mode=os.getenv('PROFILE_MODE', 'cprofile'),
+        interval=float(os.getenv('PROFILE_INTERVAL_MS', 5)) / 1000
+    )
+
+
+def trace_app(app, profiling: Optional[Profiling] = None):
+    """Open a root span per request of a Flask app and profile the requests that ask for it."""
+    from flask import g, request
+    profiling = profiling or create_profiling()
+
+    @app.before_request
+    def start_trace():
+        g.trace = span('request', route=request.url_rule.rule if request.url_rule is not None else 'unmatched',
+                       method=request.method)
+        mode = profiling.requested(request.headers)
+        profiler = profiling.start(mode) if mode else None
+        if profiler is not None:
+            g.profile = (profiler, profiling.path(profiler, request.endpoint, g.trace.trace_id))
+
+    @app.after_request
+    def name_trace(response):
+        trace = g.get('trace')
+        if trace is not None and trace.trace_id:
+            trace.set(status=response.status_code)
+            response.headers['X-Trace-Id'] = trace.trace_id
+        if g.get('profile'):
+            response.headers['X-Profile-File'] = os.path.basename(g.profile[1])
+        return response
+
+    @app.teardown_request
+    def finish_trace(error=None):
+        profile = g.pop('profile', None)
+        if profile is not None:
+            profiler, path = profile
+            try:
+                profiler.stop(path)
+            except OSError as e:
+                print(f"Could not write profile to {path}: {e}")
+        trace = g.pop('trace', None)
+        if trace is not None:
+            trace.finish()
+
+
+def read_trace(path: str) -> List[Dict]:
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+
+def summarize_trace(records: List[Dict]) -> Dict[str, Dict[str, Dict]]:
+    """p50/p95/max ms of every span name, keyed by the route of its root span."""
+    from envelope.accounting import percentile
+    routes = {r['trace']: r.get('route', r['name']) for r in records if r.get('parent') is None}
+    durations = defaultdict(lambda: defaultdict(list))
+    for record in records:
+        durations[routes.get(record['trace'], '?')][record['name']].append(record['ms'])
+    return {route: {name: {'count': len(values), 'p50_ms': percentile(values, 0.5),
+                           'p95_ms': percentile(values, 0.95), 'max_ms': max(values)}
+                    for name, values in names.items()}
+            for route, names in durations.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Request trace spans')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    summary = subcommands.add_parser('summary', help='p50/p95/max time of every stage per route')
+    summary.add_argument('trace_file', help='Trace file written with TRACE_FILE')
+    summary.add_argument('--json', action='store_true', help='Print the figures as JSON')
+    args = parser.parse_args()
+
+    routes = summarize_trace(read_trace(args.trace_file))
+    if args.json:
+        print(json.dumps(routes, indent=2))
+        return 0
+    print(f"{'route / stage':<48} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for route, names in sorted(routes.items()):
+        print(route)
+        # The root span first, then the stages from slowest
+        for name, s in sorted(names.items(), key=lambda item: (item[0] != 'request', -item[1]['p95_ms'])):
+            print(f"  {name:<46} {s['count']:>6} {s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f} {s['max_ms']:>9.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+Local first tier of answer quality assessment
+
+LocalClassifier settles the obvious questions without an LLM call and leaves
+the rest to the LLM. It looks at three things, all computed locally:
+
+- coverage: the share of the question's content words (after stopwords,
+  question boilerplate such as "describe" or "remember", and stemming) that
+  appear in the answer covering most of them;
+- length: the number of words in that answer;
+- hedging: phrases such as "don't remember" or "not sure" in that answer.
+
+A question is settled as "0" with confidence 1 - coverage, i.e. when none or
+almost none of its words appear in any answer, and as "full answer" with
+confidence coverage * min(1, words / full_words), i.e. when one long answer
+covers all of its words without hedging. A verdict is only kept if its
+confidence reaches the threshold for it; everything else ("partial answer"
+is never settled locally) is escalated. A threshold of 0 turns that verdict
+off, and higher thresholds settle fewer questions with fewer mistakes.
+
+benchmarks/tier_report.py measures the agreement with LLM verdicts against
+the LLM calls saved for a range of thresholds.
+"""
+
+from typing import List, Optional, Tuple
+
+from envelope.retrieval import NUMBERING, TOKEN_PATTERN, stem, tokenize
+
+DEFAULT_ZERO_CONFIDENCE = 1.0
+DEFAULT_FULL_CONFIDENCE = 0.9
+DEFAULT_FULL_WORDS = 40
+
+# Words of the question that say how to answer rather than what about
+QUESTION_WORDS = frozenset(stem(word) for word in """
+    describe detail details tell explain share remember memory memories recall think like kind kinds thing things
+    typical typically especially often ever
+""".split())
+
+HEDGES = ("don't remember", "do not remember", "can't remember", "cannot remember", "don't recall",
+          "do not recall", "not sure", "no memory", "no memories", "don't know", "do not know", "rather not")
+
+
+def question_terms(question: str) -> set:
+    return {term for term in tokenize(question) if term not in QUESTION_WORDS}
+
+
+class LocalClassifier:
+    """Confidence thresholds of the local tier (see the module docstring)."""
+
+    def __init__(self, zero_confidence: float = DEFAULT_ZERO_CONFIDENCE,
+                 full_confidence: float = DEFAULT_FULL_CONFIDENCE, full_words: int = DEFAULT_FULL_WORDS):
+        self.zero_confidence = float(zero_confidence)
+        self.full_confidence = float(full_confidence)
+        self.full_words = max(1, int(full_words))
+
+    def __repr__(self):
+        return (f"LocalClassifier(zero_confidence={self.zero_confidence}, full_confidence={self.full_confidence}, "
+                f"full_words={self.full_words})")
+
+    def features(self, question: str, answers: List[Tuple[set, int, bool]]) -> Optional[Tuple[float, int, bool]]:
+        """Coverage, words and hedging of the answer covering most of the question (None without content words)."""
+        terms = question_terms(question)
+        if not terms:
+            return None
+        best = (0.0, 0, False)
+        for answer_terms, words, hedged in answers:
+            coverage = len(terms & answer_terms) / len(terms)
+            # Ties go to the longer answer
+            if (coverage, words) > best[:2]:
+                best = (coverage, words, hedged)
+        return best
+
+    def classify(self, questions: List[str], answers: List[str]) -> List[Tuple[Optional[str], float]]:
+        """(verdict, confidence) per question, with verdict None for the questions to escalate."""
+        prepared = [(set(tokenize(answer)), len(TOKEN_PATTERN.findall(NUMBERING.sub("", answer))),
+                     any(hedge in answer.lower().replace("’", "'") for hedge in HEDGES))
+                    for answer in answers]
+        results = []
+        for question in questions:
+            features = self.features(str(question), prepared)
+            if features is None:
+                results.append((None, 0.0))
+                continue
+            coverage, words, hedged = features
+            zero = 1.0 - coverage
+            full = 0.0 if hedged else coverage * min(1.0, words / self.full_words)
+            if self.zero_confidence and zero >= self.zero_confidence:
+                results.append(("0", zero))
+            elif self.full_confidence and full >= self.full_confidence:
+                results.append(("full answer", full))
+            else:
+                results.append((None, max(zero, full)))
+        return results
@@ -0,0 +1,102 @@
+"""
+Persistent cache of answer quality verdicts
+
+Verdicts are stored in a small SQLite database keyed by a content hash of
+everything that determines them: the model, the prompt version, the question
+and the (whitespace-normalized) answers it was scored against. Re-running an
+assessment over the same answers file, or retrying a request, is then served
+from the cache without calling the LLM.
+
+The cache holds at most `max_entries` verdicts; beyond that the least recently
+used entries are evicted.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Tuple
+
+DEFAULT_MAX_ENTRIES = 100_000
+
+
+def normalize_answers(answers: List[str]) -> str:
+    """Collapse whitespace so reformatting an answers file does not miss the cache."""
+    return "\n".join(" ".join(answer.split()) for answer in answers)
+
+
+def verdict_key(model: str, prompt_version: str, question: str, answers: List[str]) -> str:
+    digest = hashlib.sha256()
+    for part in (model, prompt_version, " ".join(question.split()), normalize_answers(answers)):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class VerdictCache:
+    def __init__(self, path: str = 'assessment_cache.sqlite3', max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._connect().execute("""
+            CREATE TABLE IF NOT EXISTS verdicts (
+                key TEXT PRIMARY KEY,
+                verdict TEXT NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._connect().execute("CREATE INDEX IF NOT EXISTS verdicts_last_used ON verdicts (last_used)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, str]:
+        """Look up verdicts for the given keys, marking the hits as recently used."""
+        keys = list(dict.fromkeys(keys))
+        conn = self._connect()
+        found = {}
+        # Stay well below SQLite's bound-parameter limit
+        for start in range(0, len(keys), 500):
+            part = keys[start:start + 500]
+            marks = ",".join("?" * len(part))
+            found.update(conn.execute(f"SELECT key, verdict FROM verdicts WHERE key IN ({marks})", part))
+        if found:
+            now = time.time()
+            conn.executemany("UPDATE verdicts SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+        return found
+
+    def put_many(self, items: Iterable[Tuple[str, str]]):
+        """Store (key, verdict) pairs and evict the least recently used beyond max_entries."""
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT OR REPLACE INTO verdicts (key, verdict, last_used) VALUES (?, ?, ?)",
+                             [(key, verdict, now) for key, verdict in items])
+            excess = len(self) - self.max_entries
+            if excess > 0:
+                conn.execute("DELETE FROM verdicts WHERE key IN "
+                             "(SELECT key FROM verdicts ORDER BY last_used LIMIT ?)", (excess,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def clear(self):
+        self._connect().execute("DELETE FROM verdicts")
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+
+
+def create_verdict_cache() -> VerdictCache:
+    """Build the cache configured by ASSESS_CACHE_PATH and ASSESS_CACHE_MAX_ENTRIES."""
+    return VerdictCache(os.getenv('ASSESS_CACHE_PATH', 'assessment_cache.sqlite3'),
+                        max_entries=int(os.getenv('ASSESS_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)))
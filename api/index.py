@@ -1,18 +1,28 @@
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from flask import Flask, request, jsonify, render_template_string
-import anthropic
-import pandas as pd
-import json
+from flask import Flask, request, jsonify, render_template_string, Response, stream_with_context
+import functools
+import time
+import uuid
 from datetime import datetime
-import re
-from typing import List, Dict
-from langchain_anthropic import ChatAnthropic
-from langchain.schema import HumanMessage
+from envelope.streaming import stream_chat, stream_progress, SSE_HEADERS
+from envelope.sessions import create_session_store
+from envelope.journal import ConversationJournal, compact_journal, compact_journals
+from envelope.prompts import create_sliced_prompt
+from envelope.prompt_cache import create_prompt_cache
+from envelope.accounting import journal_entry, record_turn
+from envelope.context import AnthropicSummarizer, create_rolling_context
+from envelope.metrics import instrument_app, instrument_client
+from envelope.tracing import span, trace_app
+from envelope.jobs import create_job_queue, serve_jobs, submit_job
 from dotenv import load_dotenv
 
+# anthropic, pandas and langchain take seconds to import, so to keep serverless cold starts
+# short they are imported by the routes that need them (see benchmarks/import_profile.py)
+
 # Load environment variables
 script_dir = os.path.dirname(os.path.abspath(__file__))
 env_path = os.path.join(script_dir, 'environment.env')
@@ -30,23 +40,54 @@ print("Environment loaded successfully!")
 
 app = Flask(__name__)
 
-# Initialize Anthropic client
-client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+@functools.lru_cache(maxsize=None)
+def get_client():
+    """Anthropic client, built on first use"""
+    import anthropic
+    from envelope.cassette import llm_base_url
+    # Calls are timed per model for /metrics, and recorded or replayed when LLM_CASSETTE is set
+    return instrument_client(anthropic.Anthropic(api_key=ANTHROPIC_API_KEY, base_url=llm_base_url()))
+
+@functools.lru_cache(maxsize=None)
+def get_prompts():
+    """System prompts, with the slice of the question bank each session is on (see envelope/prompts.py), loaded on first use"""
+    return create_sliced_prompt('interviewer')
+
+# The system prompt and history prefix are marked cacheable on every call (see envelope/prompt_cache.py)
+prompt_cache = create_prompt_cache()
+
+@functools.lru_cache(maxsize=None)
+def get_context():
+    """Rolling summary of the older turns of long sessions (see envelope/context.py), built on first use"""
+    return create_rolling_context(AnthropicSummarizer(get_client()))
+
+# Every turn is appended to a per-session journal as it happens (see envelope/journal.py)
+journal = ConversationJournal(os.getenv('JOURNAL_DIR', 'journals'))
+
+# Background /assess_quality and /conclusions runs (see envelope/jobs.py for the JOB_* settings)
+jobs = create_job_queue()
 
-# Read system prompt and questions once at startup
-system_prompt_path = os.path.join(script_dir, "biographer", "system prompt.txt")
-questions_csv_path = os.path.join(script_dir, "biographer", "ask_these.csv")
+@functools.lru_cache(maxsize=None)
+def get_verdict_cache():
+    """Assessment verdicts shared by every /assess_quality request"""
+    from envelope.verdict_cache import create_verdict_cache
+    return create_verdict_cache()
 
-with open(system_prompt_path, "r") as f:
-    system_prompt = f.read()
+def save_evicted_conversation(session_id, conversation):
+    """Seal the journal of a session dropped from the session store the same way /end would"""
+    journal.seal(f"conversation_{session_id}")
 
-questions_df = pd.read_csv(questions_csv_path)
-questions_list = questions_df.to_dict('records')
-questions_str = "\n".join([f"Category: {q['Category']}, Field: {q['Field']}, Question: {q['Question']}" for q in questions_list])
-system_prompt = system_prompt.replace("{{QUESTIONS_LIST}}", questions_str)
+# Store active conversations (bounded, see envelope/sessions.py for the SESSION_* settings)
+active_conversations = create_session_store(on_evict=save_evicted_conversation)
 
-# Store active conversations
-active_conversations = {}
+# Route latency and the /metrics endpoint (see envelope/metrics.py)
+instrument_app(app, active_conversations)
+
+# Per-request trace spans and opt-in profiles (see envelope/tracing.py for TRACE_FILE and PROFILE_*)
+trace_app(app)
+
+# Status and results of background jobs
+serve_jobs(app, jobs)
 
 # HTML template for the chat interface
 CHAT_TEMPLATE = """
@@ -222,104 +263,6 @@ CHAT_TEMPLATE = """
 </html>
 """
 
-class AnswerQualityAssessor:
-    def __init__(self):
-        self.llm = ChatAnthropic(
-            model="claude-3-sonnet-20240229",
-            anthropic_api_key=ANTHROPIC_API_KEY,
-            temperature=0.1
-        )
-
-    def load_questions(self, questions_file: str) -> pd.DataFrame:
-        return pd.read_csv(questions_file)
-
-    def load_answers(self, answers_file: str) -> List[str]:
-        with open(answers_file, 'r', encoding='utf-8') as f:
-            content = f.read().strip()
-        
-        answers = []
-        if content:
-            lines = content.split('\n')
-            current_answer = ""
-            
-            for line in lines:
-                line = line.strip()
-                if line and (line[0].isdigit() and '. ' in line):
-                    if current_answer:
-                        answers.append(current_answer.strip())
-                    current_answer = line
-                elif line:
-                    current_answer += " " + line
-            
-            if current_answer:
-                answers.append(current_answer.strip())
-        
-        return answers
-
-    def assess_answer_quality(self, question: str, answers: List[str]) -> str:
-        all_answers = "\n".join(answers) if answers else "No answers provided"
-        
-        prompt = f"""
-        Evaluate how well the provided answers respond to this specific question:
-        
-        QUESTION: {question}
-        
-        AVAILABLE ANSWERS:
-        {all_answers}
-        
-        Your task is to determine the answer quality based on these criteria:
-        
-        1. "full answer" - The answers completely and thoroughly address the question with specific details
-        2. "partial answer" - The answers partially address the question but lack some important details or completeness
-        3. "0" - The answers do not address the question at all, or no relevant answer is found
-        
-        Consider:
-        - Does any answer directly respond to what the question is asking?
-        - Is the response specific and detailed enough to be considered complete?
-        - Are there multiple aspects to the question that need to be addressed?
-        
-        Respond with ONLY one of these three options: "full answer", "partial answer", or "0"
-        """
-        
-        try:
-            message = HumanMessage(content=prompt)
-            result = self.llm.invoke([message])
-            
-            result_str = result.content.strip().lower()
-            
-            if "full answer" in result_str:
-                return "full answer"
-            elif "partial answer" in result_str:
-                return "partial answer"
-            else:
-                return "0"
-                
-        except Exception as e:
-            return "0"
-
-    def process_assessment(self, questions_file: str, answers_file: str, output_file: str = None):
-        questions_df = self.load_questions(questions_file)
-        answers = self.load_answers(answers_file)
-        
-        output_df = questions_df.copy()
-        output_df['Answer_Quality'] = ""
-        
-        for idx, row in questions_df.iterrows():
-            question = row['Question']
-            quality = self.assess_answer_quality(question, answers)
-            output_df.at[idx, 'Answer_Quality'] = quality
-        
-        if not output_file:
-            base_name = os.path.splitext(questions_file)[0]
-            output_file = f"{base_name}_assessed.csv"
-        
-        output_df.to_csv(output_file, index=False)
-        
-        quality_counts = output_df['Answer_Quality'].value_counts()
-        summary = {quality: int(count) for quality, count in quality_counts.items()}
-        
-        return output_file, summary
-
 # Routes
 
 @app.route("/api/python")
@@ -333,7 +276,8 @@ def index():
 @app.route('/interviewer/start', methods=['POST'])
 def start_interview():
     """Start a new interview session"""
-    conversation_id = datetime.now().strftime("%M%S")
+    # The random part keeps sessions started in the same second apart
+    conversation_id = f"{datetime.now().strftime('%M%S')}_{uuid.uuid4().hex[:6]}"
     session_id = f"{datetime.now().strftime('%d%m_%H%M')}_{conversation_id}"
     
     active_conversations[session_id] = {
@@ -349,61 +293,125 @@ def start_interview():
 @app.route('/interviewer/chat', methods=['POST'])
 def chat():
     """Handle chat messages"""
-    data = request.get_json()
+    started = time.perf_counter()
+    with span('parse'):
+        data = request.get_json()
     session_id = data.get('session_id')
     user_message = data.get('message')
     
-    if not session_id or session_id not in active_conversations:
+    with span('session_load'):
+        conversation = active_conversations.get(session_id) if session_id else None
+    if conversation is None:
         return jsonify({'error': 'Invalid session'}), 400
     
     if not user_message:
         return jsonify({'error': 'Message is required'}), 400
     
     # Add user message to history
-    conversation = active_conversations[session_id]
-    conversation['history'].append({"role": "user", "content": user_message})
+    with span('journal_message'):
+        conversation['history'].append({"role": "user", "content": user_message})
+        journal.append(f"conversation_{session_id}", conversation['history'][-1], sync=False)
     
     try:
-        # Get response from Claude
-        message = client.messages.create(
-            model="claude-3-7-sonnet-20250219",
-            max_tokens=20000,
-            temperature=1,
-            system=system_prompt,
-            messages=conversation['history']
-        )
+        # Get response from Claude; long sessions send a rolling summary of their older turns
+        with span('build_request', messages=len(conversation['history'])):
+            system = get_prompts().for_history(conversation['history'])
+            turn = prompt_cache.request(system, get_context().messages(session_id, conversation, system))
+        llm_started = time.perf_counter()
+        with span('llm'):
+            message = get_client().messages.create(
+                model="claude-3-7-sonnet-20250219",
+                max_tokens=20000,
+                temperature=1,
+                **turn
+            )
         
         assistant_response = message.content[0].text
         
         # Add assistant response to history
         conversation['history'].append({"role": "assistant", "content": assistant_response})
+        usage = record_turn(conversation, message, llm_started, started)
+        # Write the updated history back, unless /end removed the session while the reply was on its way
+        with span('session_save'):
+            still_active = active_conversations.replace_if_present(session_id, conversation)
+        if still_active:
+            with span('journal_reply'):
+                journal.append(f"conversation_{session_id}", journal_entry(conversation))
         
         return jsonify({
             'response': assistant_response,
-            'session_id': session_id
+            'session_id': session_id,
+            'usage': usage
         })
         
     except Exception as e:
+        # Keep the user's message of the failed turn
+        active_conversations.replace_if_present(session_id, conversation)
         return jsonify({'error': f'Error getting response: {str(e)}'}), 500
 
+@app.route('/interviewer/chat/stream', methods=['POST'])
+def chat_stream():
+    """Handle chat messages, streaming the reply as Server-Sent Events"""
+    started = time.perf_counter()
+    data = request.get_json()
+    session_id = data.get('session_id')
+    user_message = data.get('message')
+    
+    conversation = active_conversations.get(session_id) if session_id else None
+    if conversation is None:
+        return jsonify({'error': 'Invalid session'}), 400
+    
+    if not user_message:
+        return jsonify({'error': 'Message is required'}), 400
+    
+    # Add user message to history
+    conversation['history'].append({"role": "user", "content": user_message})
+    journal.append(f"conversation_{session_id}", conversation['history'][-1], sync=False)
+    
+    def events():
+        try:
+            system = get_prompts().for_history(conversation['history'])
+            yield from stream_chat(
+                get_client(),
+                conversation,
+                session_id,
+                request_started=started,
+                model="claude-3-7-sonnet-20250219",
+                max_tokens=20000,
+                temperature=1,
+                **prompt_cache.request(system, get_context().messages(session_id, conversation, system))
+            )
+        finally:
+            # Write the updated history back and journal the reply once the stream has finished,
+            # unless /end removed the session in the meantime
+            still_active = active_conversations.replace_if_present(session_id, conversation)
+            if still_active and conversation['history'][-1]['role'] == 'assistant':
+                journal.append(f"conversation_{session_id}", journal_entry(conversation))
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers=SSE_HEADERS)
+
 @app.route('/interviewer/end', methods=['POST'])
 def end_interview():
     """End interview session and save conversation"""
     data = request.get_json()
     session_id = data.get('session_id')
     
-    if not session_id or session_id not in active_conversations:
+    conversation = active_conversations.get(session_id) if session_id else None
+    if conversation is None:
         return jsonify({'error': 'Invalid session'}), 400
     
-    conversation = active_conversations[session_id]
     filename = f"conversation_{session_id}.json"
     
     try:
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(conversation['history'], f, indent=2, ensure_ascii=False)
+        # The turns are already journaled; sealing and compacting the journal writes filename
+        with span('journal_seal'):
+            journal.seal(f"conversation_{session_id}")
+            compact_journal(journal.directory, f"conversation_{session_id}")
         
         # Remove from active conversations
-        del active_conversations[session_id]
+        with span('session_remove'):
+            active_conversations.pop(session_id)
+            get_context().discard(session_id)
         
         return jsonify({
             'message': 'Session ended successfully',
@@ -413,62 +421,135 @@ def end_interview():
     except Exception as e:
         return jsonify({'error': f'Error saving conversation: {str(e)}'}), 500
 
+def run_conclusions(params, progress=None):
+    """Extract the conclusions of every changed conversation (the /conclusions job)"""
+    from envelope.conclusions import ConclusionsManifest, NoTranscriptsError, process_conversations
+    
+    # Write out the journals of ended sessions first
+    with span('compact_journals'):
+        compact_journals(journal.directory)
+    
+    # Find all conversation JSON files
+    with span('list_files'):
+        conversation_files = [f for f in os.listdir('.') if f.startswith('conversation_') and f.endswith('.json')]
+    
+    if not conversation_files:
+        raise NoTranscriptsError('No conversation files found')
+    
+    # Only transcripts that changed since the manifest was written are processed,
+    # spread over a process pool when workers > 1
+    with span('process_conversations', files=len(conversation_files), workers=params['workers']):
+        run = process_conversations(
+            sorted(conversation_files),
+            suffix='_conclusions.txt',
+            manifest=ConclusionsManifest(),
+            force=params['force'],
+            workers=params['workers'],
+            progress=progress
+        )
+    
+    results = [{
+        'conversation_file': file,
+        'conclusions_file': conclusion_filename,
+        'conclusions_count': count
+    } for file, conclusion_filename, count in run['results']]
+    
+    return {
+        'message': f'Processed {len(results)} conversation files',
+        'results': results,
+        'processed': run['processed'],
+        'skipped': run['skipped']
+    }
+
 @app.route('/conclusions', methods=['POST'])
 def process_conclusions():
     """Process conclusions from conversation files"""
+    data = request.get_json(silent=True) or {}
+    force = bool(data.get('force', False))
     try:
-        # Find all conversation JSON files
-        conversation_files = [f for f in os.listdir('.') if f.startswith('conversation_') and f.endswith('.json')]
-        
-        if not conversation_files:
-            return jsonify({'error': 'No conversation files found'}), 404
-        
-        results = []
-        
-        for file in conversation_files:
-            with open(file, 'r', encoding='utf-8') as f:
-                conversation = json.load(f)
-            
-            conclusions = []
-            
-            for message in conversation:
-                if message['role'] == 'assistant' and '<response>' in message['content']:
-                    matches = re.findall(r'<response>(.*?)</response>', message['content'], re.DOTALL)
-                    if matches:
-                        for match in matches:
-                            conclusions.append(match.strip())
-            
-            if conclusions:
-                # Save conclusions
-                base_name = os.path.splitext(file)[0]
-                conclusion_filename = f"{base_name}_conclusions.txt"
-                
-                with open(conclusion_filename, 'w', encoding='utf-8') as f:
-                    for i, conclusion in enumerate(conclusions, 1):
-                        f.write(f"{i}. {conclusion}\n\n")
-                
-                results.append({
-                    'conversation_file': file,
-                    'conclusions_file': conclusion_filename,
-                    'conclusions_count': len(conclusions)
-                })
-        
-        return jsonify({
-            'message': f'Processed {len(results)} conversation files',
-            'results': results
-        })
-        
+        workers = int(data.get('workers', os.getenv('CONCLUSIONS_WORKERS', 1)))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'workers must be an integer'}), 400
+    
+    from envelope.conclusions import NoTranscriptsError
+    
+    params = {'force': force, 'workers': workers}
+    # background: true queues a job and answers with its id right away
+    if data.get('background'):
+        return submit_job(jobs, 'conclusions', params)
+    
+    try:
+        return jsonify(run_conclusions(params))
+    except NoTranscriptsError as e:
+        return jsonify({'error': str(e)}), 404
     except Exception as e:
         return jsonify({'error': f'Error processing conclusions: {str(e)}'}), 500
 
+def run_assessment(params, progress=None):
+    """Score the answers of an assessment request (the /assess_quality job)"""
+    from envelope.assessment import AnswerQualityAssessor
+    from envelope.triage import LocalClassifier
+    
+    assessor = AnswerQualityAssessor(
+        ANTHROPIC_API_KEY,
+        batch_size=params['batch_size'],
+        concurrency=params['concurrency'],
+        requests_per_second=params['requests_per_second'],
+        cache=get_verdict_cache(),
+        top_k=params['top_k'],
+        min_score=params['min_score'],
+        local_tier=LocalClassifier(params['zero_confidence'], params['full_confidence']) if params['local_tier'] else None
+    )
+    if progress:
+        # Each verdict with its row, source, running totals and ETA (see envelope/assessment.py)
+        assessor.on_verdict = lambda position, total, question, quality: progress(
+            position, total, question=question, quality=quality, **assessor.progress.snapshot())
+    result_file, summary = assessor.process_assessment(params['questions_file'], params['answers_file'],
+                                                       params['output_file'], use_cache=params['use_cache'],
+                                                       resume=params['resume'])
+    
+    return {
+        'message': 'Assessment completed successfully',
+        'output_file': result_file,
+        'summary': summary,
+        'cache': assessor.cache_stats,
+        'resumed': assessor.resumed_rows,
+        'retrieval': assessor.retrieval_stats or None,
+        'local_tier': assessor.tier_stats or None
+    }
+
 @app.route('/assess_quality', methods=['POST'])
 def assess_answer_quality():
     """Assess answer quality using the AnswerQualityAssessor"""
+    from envelope.triage import DEFAULT_FULL_CONFIDENCE, DEFAULT_ZERO_CONFIDENCE
+    
     data = request.get_json()
     default_questions_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "biographer", "ask_these.csv")
     questions_file = data.get('questions_file', default_questions_path)
     answers_file = data.get('answers_file')
     output_file = data.get('output_file')
+    # use_cache: false re-scores every question (the fresh verdicts still refresh the cache)
+    use_cache = data.get('use_cache', True) is not False
+    # resume: true keeps the verdicts checkpointed by an interrupted run over the same files
+    resume = data.get('resume') is True
+    # local_tier: true settles the obvious "0" and "full answer" cases without an LLM call
+    local_tier = data.get('local_tier', os.getenv('ASSESS_LOCAL_TIER', '').lower() in ('1', 'true', 'yes')) is True
+    
+    try:
+        # Questions scored per LLM call; 1 keeps the one-call-per-question behaviour
+        batch_size = int(data.get('batch_size', os.getenv('ASSESS_BATCH_SIZE', 1)))
+        # LLM calls in flight at once, and an optional cap on calls per second
+        concurrency = int(data.get('concurrency', os.getenv('ASSESS_CONCURRENCY', 1)))
+        requests_per_second = float(data.get('requests_per_second', os.getenv('ASSESS_RATE_LIMIT', 0))) or None
+        # Send only the top_k best-matching answers with each question (0 sends them all)
+        top_k = int(data.get('top_k', os.getenv('ASSESS_TOP_K', 0))) or None
+        min_score = float(data.get('min_score', os.getenv('ASSESS_MIN_SCORE', 0)))
+        # Confidence a local verdict needs to be kept (0 never settles that verdict locally)
+        zero_confidence = float(data.get('zero_confidence', os.getenv('ASSESS_ZERO_CONFIDENCE', DEFAULT_ZERO_CONFIDENCE)))
+        full_confidence = float(data.get('full_confidence', os.getenv('ASSESS_FULL_CONFIDENCE', DEFAULT_FULL_CONFIDENCE)))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'batch_size, concurrency, requests_per_second, top_k, min_score, zero_confidence '
+                                 'and full_confidence must be numbers'}), 400
     
     if not answers_file:
         return jsonify({'error': 'answers_file is required'}), 400
@@ -479,19 +560,37 @@ def assess_answer_quality():
     if not os.path.exists(answers_file):
         return jsonify({'error': f'Answers file {answers_file} not found'}), 404
     
+    params = {
+        'questions_file': questions_file,
+        'answers_file': answers_file,
+        'output_file': output_file,
+        'use_cache': use_cache,
+        'resume': resume,
+        'batch_size': batch_size,
+        'concurrency': concurrency,
+        'requests_per_second': requests_per_second,
+        'top_k': top_k,
+        'min_score': min_score,
+        'local_tier': local_tier,
+        'zero_confidence': zero_confidence,
+        'full_confidence': full_confidence
+    }
+    # background: true queues a job and answers with its id right away
+    if data.get('background'):
+        return submit_job(jobs, 'assess', params)
+    # stream: true sends each verdict as a Server-Sent Event as soon as it is known, then the result
+    if data.get('stream'):
+        events = stream_progress(run_assessment, params, 'verdict', 'Error during assessment')
+        return Response(stream_with_context(events), mimetype='text/event-stream', headers=SSE_HEADERS)
+    
     try:
-        assessor = AnswerQualityAssessor()
-        result_file, summary = assessor.process_assessment(questions_file, answers_file, output_file)
-        
-        return jsonify({
-            'message': 'Assessment completed successfully',
-            'output_file': result_file,
-            'summary': summary
-        })
-        
+        return jsonify(run_assessment(params))
     except Exception as e:
         return jsonify({'error': f'Error during assessment: {str(e)}'}), 500
 
+jobs.register('conclusions', run_conclusions)
+jobs.register('assess', run_assessment)
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
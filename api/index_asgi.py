@@ -0,0 +1,37 @@
+"""
+Async (ASGI) entry point for the interviewer API
+
+Serves the same routes as index.py, with /interviewer/chat and
+/interviewer/chat/stream awaiting Claude through AsyncAnthropic instead of
+holding a worker thread (see envelope/asgi.py).
+
+    uvicorn index_asgi:app --port 4001
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import anthropic
+
+import index
+from envelope.asgi import AsyncChatApp
+from envelope.cassette import llm_base_url
+from envelope.metrics import instrument_client
+
+app = AsyncChatApp(
+    index.app,
+    '/interviewer',
+    sessions=index.active_conversations,
+    journal=index.journal,
+    journal_prefix='conversation_',
+    client=instrument_client(anthropic.AsyncAnthropic(api_key=index.ANTHROPIC_API_KEY, base_url=llm_base_url())),
+    max_threads=int(os.getenv('ASGI_THREADS', 0)) or None,
+    prompt_cache=index.prompt_cache,
+    context=index.get_context(),
+    jobs=index.jobs,
+    model="claude-3-7-sonnet-20250219",
+    max_tokens=20000,
+    temperature=1,
+    system=lambda history: index.get_prompts().for_history(history)
+)
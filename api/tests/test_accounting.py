@@ -0,0 +1,84 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from envelope import accounting
+from envelope.accounting import (TURNS_SUFFIX, journal_entry, read_turns, record_turn, summarize_turns, turn_cost,
+                                 write_turns)
+from envelope.journal import ConversationJournal, compact_journals
+
+
+def reply(input_tokens=100, output_tokens=20, cache_read=None):
+    usage = SimpleNamespace(input_tokens=input_tokens, output_tokens=output_tokens,
+                            cache_read_input_tokens=cache_read)
+    return SimpleNamespace(model='claude-3-7-sonnet-20250219', stop_reason='end_turn', usage=usage)
+
+
+def test_record_turn():
+    conversation = {'history': [{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hello"}]}
+    started = time.perf_counter() - 0.5
+
+    record = record_turn(conversation, reply(cache_read=900), started + 0.1, started, streamed=True)
+
+    assert record['model'] == 'claude-3-7-sonnet-20250219'
+    assert record['stop_reason'] == 'end_turn'
+    assert (record['input_tokens'], record['output_tokens']) == (100, 20)
+    assert (record['cache_read_input_tokens'], record['cache_creation_input_tokens']) == (900, 0)
+    assert 400 <= record['llm_ms'] < record['server_ms']
+    assert record['streamed'] is True
+    assert conversation['usage'] == [record]
+    assert journal_entry(conversation) == {"role": "assistant", "content": "Hello", 'turn': record}
+
+
+def test_compaction_writes_sidecar_and_keeps_transcript_schema(tmp_path):
+    journal = ConversationJournal(str(tmp_path / 'journals'))
+    conversation = {'history': []}
+    for text in ["Hi", "More"]:
+        conversation['history'].append({"role": "user", "content": text})
+        journal.append('conversation_s1', journal_entry(conversation))
+        conversation['history'].append({"role": "assistant", "content": f"Re: {text}"})
+        record_turn(conversation, reply(), time.perf_counter())
+        journal.append('conversation_s1', journal_entry(conversation))
+    journal.seal('conversation_s1')
+
+    compact_journals(str(tmp_path / 'journals'), str(tmp_path))
+
+    with open(tmp_path / 'conversation_s1.json', encoding='utf-8') as f:
+        assert json.load(f) == conversation['history']
+    assert read_turns(str(tmp_path / f'conversation_s1{TURNS_SUFFIX}')) == conversation['usage']
+
+
+def test_summarize_turns_and_cost():
+    records = [{'model': 'claude-3-7-sonnet-20250219', 'input_tokens': 1000, 'output_tokens': 100,
+                'cache_read_input_tokens': 3000, 'llm_ms': float(ms), 'server_ms': ms + 5.0}
+               for ms in range(1, 101)]
+
+    stats = summarize_turns(records)
+
+    assert stats['turns'] == 100
+    assert (stats['llm_p50_ms'], stats['llm_p95_ms']) == (51.0, 96.0)
+    assert stats['server_p95_ms'] == 101.0
+    assert stats['input_tokens'] == 400000
+    assert stats['cache_read_share'] == 0.75
+    # 1000 input + 3000 cache reads at a tenth of the price, and 100 output tokens
+    assert turn_cost(records[0]) == pytest.approx((1300 * 3 + 100 * 15) / 1e6)
+    assert stats['cost_usd'] == pytest.approx(100 * turn_cost(records[0]))
+
+
+def test_stats_command(tmp_path, monkeypatch, capsys):
+    write_turns(str(tmp_path / f'biographer_story_bio_1{TURNS_SUFFIX}'), [{'llm_ms': 10.0, 'server_ms': 12.0}])
+    write_turns(str(tmp_path / f'conversation_2{TURNS_SUFFIX}'), [{'llm_ms': 30.0, 'server_ms': 33.0}] * 2)
+    monkeypatch.setattr(sys, 'argv', ['accounting', 'stats', '--dir', str(tmp_path), '--json'])
+
+    assert accounting.main() == 0
+
+    report = json.loads(capsys.readouterr().out)
+    assert sorted(report['sessions']) == ['biographer_story_bio_1', 'conversation_2']
+    assert report['fleet']['turns'] == 3
+    assert report['fleet']['llm_p50_ms'] == 30.0
@@ -0,0 +1,167 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import json
+import threading
+import time
+
+import anthropic
+import httpx
+import pytest
+from flask import Flask, Response, jsonify, request, stream_with_context
+
+from envelope.asgi import AsyncChatApp
+from envelope.fake_anthropic import FakeAnthropicServer, DEFAULT_REPLY
+from envelope.journal import ConversationJournal, read_journal
+from envelope.sessions import MemorySessionStore
+
+
+@pytest.fixture
+def served(tmp_path):
+    flask_app = Flask(__name__)
+    sessions = MemorySessionStore()
+    journal = ConversationJournal(str(tmp_path / 'journals'))
+
+    @flask_app.route('/chat/start', methods=['POST'])
+    def start():
+        sessions['s1'] = {'history': []}
+        return jsonify({'session_id': 's1', 'echo': request.get_json()})
+
+    @flask_app.route('/slow/stream', methods=['GET'])
+    def slow_stream():
+        def events():
+            for i in range(3):
+                yield f"data: {i}\n\n"
+                time.sleep(0.2)
+        return Response(stream_with_context(events()), mimetype='text/event-stream')
+
+    with FakeAnthropicServer(first_token_delay=0.2) as server:
+        client = anthropic.AsyncAnthropic(api_key='test', base_url=server.base_url)
+        app = AsyncChatApp(flask_app, '/chat', sessions=sessions, journal=journal, journal_prefix='conversation_',
+                           client=client, model='fake-model', max_tokens=100, system='Be brief')
+        yield app, sessions, journal, server
+
+
+def run(app, requests):
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as http:
+            return await requests(http)
+    return asyncio.run(main())
+
+
+def test_other_routes_are_served_by_flask(served):
+    app, sessions, journal, server = served
+
+    response = run(app, lambda http: http.post('/chat/start', json={'x': 1}))
+
+    assert response.status_code == 200
+    assert response.json() == {'session_id': 's1', 'echo': {'x': 1}}
+    assert 's1' in sessions
+    assert run(app, lambda http: http.get('/missing')).status_code == 404
+
+
+def test_streamed_flask_routes_are_relayed_as_they_are_produced(served):
+    app, sessions, journal, server = served
+    scope = {'type': 'http', 'method': 'GET', 'path': '/slow/stream', 'headers': [], 'query_string': b''}
+    sent = []
+
+    async def main():
+        started = time.perf_counter()
+        requests = iter([{'type': 'http.request', 'body': b''}])
+        finished = asyncio.Event()
+
+        async def receive():
+            try:
+                return next(requests)
+            except StopIteration:
+                await finished.wait()
+                return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append((message, time.perf_counter() - started))
+
+        await app(scope, receive, send)
+        finished.set()
+
+    asyncio.run(main())
+    bodies = [(message['body'], at) for message, at in sent if message['type'] == 'http.response.body']
+    assert sent[0][0]['status'] == 200
+    assert b"".join(body for body, _ in bodies) == b"data: 0\n\ndata: 1\n\ndata: 2\n\n"
+    assert bodies[0][1] < 0.15 and bodies[-1][1] >= 0.4
+
+
+def test_chat_keeps_the_flask_contract(served, tmp_path):
+    app, sessions, journal, server = served
+    sessions['s1'] = {'history': []}
+
+    assert run(app, lambda http: http.post('/chat/chat', json={'session_id': 'nope', 'message': 'hi'})).json() == \
+        {'error': 'Invalid session'}
+    assert run(app, lambda http: http.post('/chat/chat', content=b'not json')).status_code == 400
+
+    response = run(app, lambda http: http.post('/chat/chat', json={'session_id': 's1', 'message': 'hi'}))
+
+    assert response.status_code == 200
+    assert response.json() == {'response': DEFAULT_REPLY, 'session_id': 's1', 'usage': sessions['s1']['usage'][0]}
+    assert [m['role'] for m in sessions['s1']['history']] == ['user', 'assistant']
+    assert server.requests[0]['system'] == 'Be brief'
+    journal.flush()
+    assert len(read_journal(str(tmp_path / 'journals' / 'conversation_s1.jsonl'))) == 2
+
+
+def test_chat_stream_relays_events(served):
+    app, sessions, journal, server = served
+    sessions['s1'] = {'history': []}
+
+    response = run(app, lambda http: http.post('/chat/chat/stream', json={'session_id': 's1', 'message': 'hi'}))
+
+    assert response.headers['content-type'].startswith('text/event-stream')
+    events = [block.split('\n', 1) for block in response.text.strip().split('\n\n')]
+    assert events[-1][0] == 'event: done'
+    assert json.loads(events[-1][1][len('data: '):])['response'] == DEFAULT_REPLY
+    assert sessions['s1']['history'][-1] == {'role': 'assistant', 'content': DEFAULT_REPLY}
+
+
+def test_concurrent_chats_overlap(served):
+    app, sessions, journal, server = served
+    for i in range(20):
+        sessions[f's{i}'] = {'history': []}
+
+    async def chats(http):
+        return await asyncio.gather(*[http.post('/chat/chat', json={'session_id': f's{i}', 'message': 'hi'})
+                                      for i in range(20)])
+
+    started = time.monotonic()
+    responses = run(app, chats)
+
+    assert all(r.status_code == 200 for r in responses)
+    # 20 replies of 0.2s each finish together instead of one after another
+    assert time.monotonic() - started < 2
+
+
+def test_session_and_journal_calls_stay_off_the_event_loop(served, monkeypatch):
+    app, sessions, journal, server = served
+    sessions['s1'] = {'history': []}
+    loop_threads = []
+    blocking_threads = []
+
+    def on_thread(fn):
+        def wrapper(*args, **kwargs):
+            blocking_threads.append(threading.get_ident())
+            return fn(*args, **kwargs)
+        return wrapper
+
+    for name in ('get', 'replace_if_present'):
+        monkeypatch.setattr(sessions, name, on_thread(getattr(sessions, name)))
+    monkeypatch.setattr(journal, 'append', on_thread(journal.append))
+
+    async def chat(http):
+        loop_threads.append(threading.get_ident())
+        return await http.post('/chat/chat', json={'session_id': 's1', 'message': 'hi'})
+
+    assert run(app, chat).status_code == 200
+    # Session load, user message, reply and write-back
+    assert len(blocking_threads) == 4
+    assert loop_threads[0] not in blocking_threads
@@ -0,0 +1,292 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from envelope.assessment import AnswerQualityAssessor, parse_batch_verdicts
+from envelope.checkpoint import CHECKPOINT_SUFFIX
+from envelope.triage import LocalClassifier
+from envelope.verdict_cache import VerdictCache
+
+
+class FakeLLM:
+    """Answers single-question prompts from `single` and batched prompts from `batch`."""
+
+    def __init__(self, single=None, batch=None):
+        self.single = single or (lambda question: "full answer")
+        self.batch = batch or (lambda ids: "{}")
+        self.prompts = []
+
+    def invoke(self, messages):
+        prompt = messages[0].content
+        self.prompts.append(prompt)
+        if "QUESTIONS:" in prompt:
+            return SimpleNamespace(content=self.batch(re.findall(r'^\s*(Q\d+):', prompt, re.M)))
+        question = re.search(r'QUESTION: (.*)', prompt).group(1)
+        return SimpleNamespace(content=self.single(question))
+
+
+@pytest.fixture
+def files(tmp_path):
+    questions = tmp_path / 'questions.csv'
+    pd.DataFrame({
+        'Category': ['A'] * 5,
+        'Field': ['F'] * 5,
+        'Question': [f'Question {i}?' for i in range(5)]
+    }).to_csv(questions, index=False)
+    answers = tmp_path / 'answers.txt'
+    answers.write_text("1. First answer\ncontinues here\n2. Second answer\n", encoding='utf-8')
+    return str(questions), str(answers)
+
+
+def make_assessor(llm, **kwargs):
+    assessor = AnswerQualityAssessor(anthropic_api_key='test', **kwargs)
+    assessor.llm = llm
+    return assessor
+
+
+def test_load_answers_joins_numbered_items(files):
+    assessor = make_assessor(FakeLLM())
+    assert assessor.load_answers(files[1]) == ["1. First answer continues here", "2. Second answer"]
+
+
+def test_parse_batch_verdicts_is_strict():
+    ids = ['Q0', 'Q1', 'Q2', 'Q3']
+    text = '```json\n{"Q0": "Full Answer", "Q1": 0, "Q2": "mostly answered", "Q9": "0"}\n```'
+
+    assert parse_batch_verdicts(text, ids) == {'Q0': 'full answer', 'Q1': '0'}
+    assert parse_batch_verdicts('Here you go: {"Q0": "0"}', ids) == {}
+    assert parse_batch_verdicts('["0"]', ids) == {}
+
+
+def test_per_question_mode_makes_one_call_per_row(files, tmp_path):
+    llm = FakeLLM(single=lambda q: "partial answer" if q.endswith('1?') else "Full answer.")
+    output, summary = make_assessor(llm).process_assessment(*files, str(tmp_path / 'out.csv'))
+
+    df = pd.read_csv(output, keep_default_na=False)
+    assert list(df['Answer_Quality']) == ['full answer', 'partial answer', 'full answer', 'full answer', 'full answer']
+    assert summary == {'full answer': 4, 'partial answer': 1}
+    assert len(llm.prompts) == 5
+
+
+def test_batched_mode_falls_back_only_for_bad_rows(files, tmp_path):
+    def batch(ids):
+        verdicts = {question_id: "0" for question_id in ids}
+        if 'Q1' in verdicts:
+            verdicts['Q1'] = "unsure"
+        return str(verdicts).replace("'", '"')
+
+    llm = FakeLLM(single=lambda q: "partial answer", batch=batch)
+    output, summary = make_assessor(llm, batch_size=3).process_assessment(*files, str(tmp_path / 'out.csv'))
+
+    df = pd.read_csv(output, keep_default_na=False, dtype=str)
+    assert list(df['Answer_Quality']) == ['0', 'partial answer', '0', '0', '0']
+    assert summary == {'0': 4, 'partial answer': 1}
+    # Two batched calls (3 + 2 questions) and one retry for Q1
+    assert len(llm.prompts) == 3
+
+
+def test_unparseable_batch_retries_every_row(files, tmp_path):
+    llm = FakeLLM(single=lambda q: "full answer", batch=lambda ids: "I think they are all fine")
+    output, summary = make_assessor(llm, batch_size=5).process_assessment(*files, str(tmp_path / 'out.csv'))
+
+    assert summary == {'full answer': 5}
+    assert len(llm.prompts) == 6
+
+
+def test_concurrent_mode_keeps_row_order(files, tmp_path):
+    in_flight = []
+    peak = []
+    lock = threading.Lock()
+
+    def single(question):
+        with lock:
+            in_flight.append(question)
+            peak.append(len(in_flight))
+        time.sleep(random.uniform(0, 0.02))
+        with lock:
+            in_flight.remove(question)
+        return "partial answer" if question.endswith(('1?', '3?')) else "0"
+
+    seen = []
+    assessor = make_assessor(FakeLLM(single=single), concurrency=3)
+    assessor.on_verdict = lambda position, total, question, quality: seen.append(position)
+    output, summary = assessor.process_assessment(*files, str(tmp_path / 'out.csv'))
+
+    df = pd.read_csv(output, keep_default_na=False, dtype=str)
+    assert list(df['Answer_Quality']) == ['0', 'partial answer', '0', 'partial answer', '0']
+    assert summary == {'0': 3, 'partial answer': 2}
+    assert max(peak) <= 3
+    assert seen == [1, 2, 3, 4, 5]
+
+
+def test_cached_verdicts_skip_the_llm(files, tmp_path):
+    cache = VerdictCache(str(tmp_path / 'cache.sqlite3'))
+    llm = FakeLLM(single=lambda q: "partial answer")
+    assessor = make_assessor(llm, cache=cache)
+
+    assessor.process_assessment(*files, str(tmp_path / 'first.csv'))
+    assert assessor.cache_stats == {'hits': 0, 'misses': 5}
+
+    output, summary = assessor.process_assessment(*files, str(tmp_path / 'second.csv'))
+    assert assessor.cache_stats == {'hits': 5, 'misses': 0}
+    assert summary == {'partial answer': 5}
+    assert len(llm.prompts) == 5
+
+    # Different answers are a different key
+    (tmp_path / 'other.txt').write_text("1. Something else\n", encoding='utf-8')
+    assessor.process_assessment(files[0], str(tmp_path / 'other.txt'), str(tmp_path / 'third.csv'))
+    assert assessor.cache_stats == {'hits': 0, 'misses': 5}
+
+
+def test_progress_reports_each_row_with_totals(files, tmp_path):
+    def single(question):
+        time.sleep(0.03)
+        return "partial answer" if question.endswith('1?') else "full answer"
+
+    seen = []
+    assessor = make_assessor(FakeLLM(single=single), cache=VerdictCache(str(tmp_path / 'cache.sqlite3')))
+    assessor.on_verdict = lambda position, total, question, quality: seen.append(assessor.progress.snapshot())
+
+    assessor.process_assessment(*files, str(tmp_path / 'out.csv'))
+    assert [event['row'] for event in seen] == [0, 1, 2, 3, 4]
+    assert [event['source'] for event in seen] == ['llm'] * 5
+    assert seen[0]['counts'] == {'full answer': 1}
+    assert seen[-1]['counts'] == {'full answer': 4, 'partial answer': 1}
+    assert seen[0]['eta_s'] > 0 and seen[-1]['eta_s'] == 0.0
+    assert seen[-1]['elapsed_s'] >= 0.15
+
+    seen.clear()
+    assessor.process_assessment(*files, str(tmp_path / 'again.csv'))
+    assert [event['source'] for event in seen] == ['cache'] * 5
+    assert all(event['eta_s'] == 0.0 for event in seen)
+
+
+def test_cache_bypass_and_failed_calls(files, tmp_path):
+    cache = VerdictCache(str(tmp_path / 'cache.sqlite3'))
+
+    def single(question):
+        if question.endswith('2?'):
+            raise ValueError("bad request")
+        return "full answer"
+
+    llm = FakeLLM(single=single)
+    assessor = make_assessor(llm, cache=cache)
+    assessor.process_assessment(*files, str(tmp_path / 'out.csv'))
+    # The failed question was scored "0" but not cached
+    assert len(cache) == 4
+
+    assessor.process_assessment(*files, str(tmp_path / 'out.csv'), use_cache=False)
+    assert assessor.cache_stats == {'hits': 0, 'misses': 5}
+    assert len(llm.prompts) == 10
+
+
+
+def test_interrupted_run_resumes_from_the_checkpoint(files, tmp_path):
+    def single(question):
+        if question.endswith('1?'):
+            raise ValueError("bad request")
+        return "partial answer"
+
+    output = str(tmp_path / 'out.csv')
+    checkpoint = output + CHECKPOINT_SUFFIX
+
+    def stop_after_three(position, total, question, quality):
+        if position == 3:
+            raise KeyboardInterrupt
+
+    llm = FakeLLM(single=single)
+    assessor = make_assessor(llm)
+    assessor.on_verdict = stop_after_three
+    with pytest.raises(KeyboardInterrupt):
+        assessor.process_assessment(*files, output)
+    assert not os.path.exists(output) and os.path.exists(checkpoint)
+
+    # The failed row is not kept, so it is scored again along with the two never reached
+    llm.single = lambda question: "full answer"
+    assessor.on_verdict = lambda position, total, question, quality: None
+    output_file, summary = assessor.process_assessment(*files, output, resume=True)
+    assert assessor.resumed_rows == 2
+    assert len(llm.prompts) == 3 + 3
+    df = pd.read_csv(output_file, keep_default_na=False, dtype=str)
+    assert list(df['Answer_Quality']) == ['partial answer', 'full answer', 'partial answer', 'full answer',
+                                          'full answer']
+    assert not os.path.exists(checkpoint)
+
+
+def test_checkpoint_of_other_inputs_is_ignored(files, tmp_path):
+    output = str(tmp_path / 'out.csv')
+    checkpoint = output + CHECKPOINT_SUFFIX
+    with open(checkpoint, 'w', encoding='utf-8') as f:
+        f.write('{"fingerprint": "something else"}\n{"row": 0, "quality": "0"}\n')
+
+    llm = FakeLLM()
+    assessor = make_assessor(llm)
+    assessor.process_assessment(*files, output, resume=True)
+    assert assessor.resumed_rows == 0 and len(llm.prompts) == 5
+
+    # Without resume an existing checkpoint is started over
+    with open(checkpoint, 'w', encoding='utf-8') as f:
+        f.write('{"fingerprint": "something else"}\n')
+    assessor.on_verdict = lambda position, total, question, quality: None
+    assessor.process_assessment(*files, output)
+    assert not os.path.exists(checkpoint)
+
+
+
+def test_local_tier_escalates_only_uncertain_questions(tmp_path):
+    questions = tmp_path / 'questions.csv'
+    pd.DataFrame({'Question': ["Did you have any pets?", "What games did you play?",
+                               "What was the farmhouse porch like in summer?"]}).to_csv(questions, index=False)
+    answers = tmp_path / 'answers.txt'
+    answers.write_text("1. We played marbles after school.\n2. The farmhouse porch in summer had a swing, "
+                       + "the radio, my grandmother shelling peas and the smell of rain on the dust. " * 3,
+                       encoding='utf-8')
+
+    llm = FakeLLM(single=lambda q: "partial answer")
+    cache = VerdictCache(str(tmp_path / 'cache.sqlite3'))
+    seen = []
+    assessor = make_assessor(llm, cache=cache, local_tier=LocalClassifier())
+    assessor.on_verdict = lambda position, total, question, quality: seen.append(assessor.progress.source)
+    output, summary = assessor.process_assessment(str(questions), str(answers), str(tmp_path / 'out.csv'))
+
+    df = pd.read_csv(output, keep_default_na=False, dtype=str)
+    assert list(df['Answer_Quality']) == ['0', 'partial answer', 'full answer']
+    assert assessor.tier_stats == {'settled': 2, 'escalated': 1}
+    assert sorted(seen) == ['llm', 'local', 'local']
+    assert len(llm.prompts) == 1
+    # Only LLM verdicts are cached
+    assert len(cache) == 1
+
+
+def test_top_k_sends_only_matching_answers(tmp_path):
+    questions = tmp_path / 'questions.csv'
+    pd.DataFrame({
+        'Category': ['A'] * 3,
+        'Field': ['F'] * 3,
+        'Question': ['What games did you play?', 'Describe your garden.', 'Which university did you attend?']
+    }).to_csv(questions, index=False)
+    answers = tmp_path / 'answers.txt'
+    answers.write_text("1. We played marbles.\n2. The garden had lemon trees.\n3. My brother played football.\n",
+                       encoding='utf-8')
+
+    llm = FakeLLM(single=lambda q: "full answer")
+    assessor = make_assessor(llm, top_k=1)
+    output, summary = assessor.process_assessment(str(questions), str(answers), str(tmp_path / 'out.csv'))
+
+    df = pd.read_csv(output, keep_default_na=False, dtype=str)
+    assert list(df['Answer_Quality']) == ['full answer', 'full answer', '0']
+    # The question without a matching answer was never sent
+    assert len(llm.prompts) == 2
+    assert 'lemon' not in llm.prompts[0] and 'marbles' not in llm.prompts[1]
+    assert assessor.retrieval_stats['answers_sent'] == 2
+    assert assessor.retrieval_stats['questions_without_match'] == 1
+    assert assessor.retrieval_stats['input_tokens_saved'] > 0
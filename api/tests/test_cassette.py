@@ -0,0 +1,111 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import time
+
+import pytest
+
+from envelope import cassette
+from envelope.cassette import Cassette, CassetteServer, request_key
+from envelope.fake_anthropic import DEFAULT_REPLY, FakeAnthropicServer
+
+anthropic = pytest.importorskip("anthropic")
+
+KWARGS = dict(model='fake-model', max_tokens=10, messages=[{"role": "user", "content": "I grew up by the sea"}])
+
+
+def chat(base_url, **kwargs):
+    client = anthropic.Anthropic(api_key='sk-secret', base_url=base_url, max_retries=0)
+    reply = client.messages.create(**{**KWARGS, **kwargs}).content[0].text
+    with client.messages.stream(**{**KWARGS, **kwargs}) as stream:
+        streamed = "".join(stream.text_stream)
+    return reply, streamed
+
+
+@pytest.fixture(scope='module')
+def recorded(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('cassette') / 'cassette.jsonl')
+    with FakeAnthropicServer(first_token_delay=0.05, token_delay=0.01) as upstream:
+        with CassetteServer('record', path, upstream=upstream.base_url) as proxy:
+            assert chat(proxy.base_url) == (DEFAULT_REPLY, DEFAULT_REPLY)
+            assert proxy.stats()['recorded'] == 2
+        assert len(upstream.requests) == 2
+    return path
+
+
+def test_record_keeps_requests_and_timed_chunks_without_keys(recorded):
+    with open(recorded, encoding='utf-8') as f:
+        text = f.read()
+    calls = [json.loads(line) for line in text.splitlines()]
+
+    assert 'sk-secret' not in text
+    assert [call['request'].get('stream', False) for call in calls] == [False, True]
+    plain, streamed = calls
+    assert plain['status'] == 200 and plain['elapsed_ms'] >= 50
+    assert streamed['headers']['content-type'].startswith('text/event-stream')
+    assert len(streamed['chunks']) > 1
+    assert streamed['chunks'][-1][0] > streamed['chunks'][0][0]
+
+
+def test_replay_needs_no_upstream(recorded):
+    with CassetteServer('replay', recorded, upstream='http://127.0.0.1:9', speed=0) as proxy:
+        started = time.perf_counter()
+        assert chat(proxy.base_url) == (DEFAULT_REPLY, DEFAULT_REPLY)
+        # Identical calls get the recordings again
+        assert chat(proxy.base_url) == (DEFAULT_REPLY, DEFAULT_REPLY)
+        assert time.perf_counter() - started < 0.5
+
+        with pytest.raises(anthropic.NotFoundError):
+            chat(proxy.base_url, messages=[{"role": "user", "content": "Something never recorded"}])
+        assert proxy.stats() == {'requests': 5, 'recorded': 0, 'replayed': 4, 'misses': 1, 'errors': 0}
+
+
+def test_replay_keeps_the_recorded_timings(recorded):
+    with CassetteServer('replay', recorded, speed=1) as proxy:
+        client = anthropic.Anthropic(api_key='test', base_url=proxy.base_url, max_retries=0)
+        started = time.perf_counter()
+        with client.messages.stream(**KWARGS) as stream:
+            first = None
+            for _ in stream.text_stream:
+                first = first or time.perf_counter() - started
+        total = time.perf_counter() - started
+
+    assert first >= 0.04
+    assert total >= 0.1
+
+
+def test_sequence_matching_ignores_the_content(recorded):
+    other = [{"role": "user", "content": "A different session"}]
+    with CassetteServer('replay', recorded, speed=0, match='sequence') as proxy:
+        assert chat(proxy.base_url, messages=other) == (DEFAULT_REPLY, DEFAULT_REPLY)
+
+    assert request_key('POST', '/v1/messages', b'{"stream": true, "a": 1}', 'sequence') == \
+        request_key('POST', '/v1/messages', b'{"a": 2, "stream": true}', 'sequence')
+    assert len(Cassette(recorded)) == 2
+
+
+def test_passthrough_does_not_record(tmp_path):
+    path = str(tmp_path / 'cassette.jsonl')
+    with FakeAnthropicServer() as upstream, CassetteServer('passthrough', path, upstream=upstream.base_url) as proxy:
+        assert chat(proxy.base_url) == (DEFAULT_REPLY, DEFAULT_REPLY)
+    assert not os.path.exists(path)
+
+
+def test_llm_base_url_from_environment(recorded, monkeypatch):
+    cassette.llm_base_url.cache_clear()
+    monkeypatch.delenv('LLM_CASSETTE', raising=False)
+    assert cassette.llm_base_url() is None
+
+    cassette.llm_base_url.cache_clear()
+    monkeypatch.setenv('LLM_CASSETTE', 'replay')
+    monkeypatch.setenv('LLM_CASSETTE_FILE', recorded)
+    monkeypatch.setenv('LLM_CASSETTE_SPEED', '0')
+    try:
+        base_url = cassette.llm_base_url()
+        assert base_url.startswith('http://127.0.0.1:')
+        assert cassette.llm_base_url() == base_url
+        assert chat(base_url) == (DEFAULT_REPLY, DEFAULT_REPLY)
+    finally:
+        cassette.llm_base_url.cache_clear()
@@ -0,0 +1,51 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import subprocess
+
+import pandas as pd
+import pytest
+
+from benchmarks.import_profile import local_modules, module_rows, profile, reported_modules
+from envelope.questions import load_questions, render_questions
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_index_import_leaves_heavy_modules_unloaded():
+    elapsed, loaded, rows = profile('index')
+
+    assert loaded == []
+    assert any(name == 'index' for _, _, _, name in rows)
+
+
+def test_committed_import_profile_is_current():
+    _, _, rows = profile('index')
+    report = os.path.join(API_DIR, 'benchmarks', 'import_profile_index.md')
+
+    # Regenerate with: python benchmarks/import_profile.py index --output benchmarks/import_profile_index.md
+    assert reported_modules(report) == local_modules(module_rows(rows, 'index'))
+
+
+def test_csv_loader_matches_pandas():
+    path = os.path.join(API_DIR, 'biographer', 'ask_these.csv')
+    expected = "\n".join(f"Category: {q['Category']}, Field: {q['Field']}, Question: {q['Question']}"
+                         for q in pd.read_csv(path).to_dict('records'))
+
+    assert render_questions(load_questions(path)) == expected
+
+
+# server/app.py needs a local variables.py, so it is not imported here
+@pytest.mark.parametrize('module', ['index', 'biographer'])
+def test_importing_an_app_creates_no_journal_directory(module, tmp_path):
+    journals = tmp_path / 'journals'
+    env = {**os.environ, 'ANTHROPIC_API_KEY': 'test', 'JOURNAL_DIR': str(journals),
+           'JOB_DB_PATH': str(tmp_path / 'jobs.sqlite3'), 'STORY_INDEX_PATH': str(tmp_path / 'stories.sqlite3')}
+    subprocess.run([sys.executable, '-c', f"import sys; sys.path.insert(0, {API_DIR!r}); import {module}"],
+                   cwd=tmp_path, env=env, check=True, capture_output=True)
+
+    assert not journals.exists()
+    if module == 'index':
+        # The serverless entry point writes nothing at all
+        assert os.listdir(tmp_path) == []
@@ -0,0 +1,142 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import hashlib
+import json
+import runpy
+
+import pytest
+
+from envelope import conclusions
+from envelope.conclusions import ConclusionsManifest, iter_messages, process_conversations, BIOGRAPHY_SUMMARY_HEADER
+
+
+def write_conversation(path, *replies):
+    history = []
+    for reply in replies:
+        history.append({"role": "user", "content": "<response>not from the user</response>"})
+        history.append({"role": "assistant", "content": reply})
+    path.write_text(json.dumps(history), encoding='utf-8')
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_writes_numbered_conclusions(workdir):
+    write_conversation(workdir / 'conversation_a.json', "Hi <response> first </response>",
+                       "<response>second</response> and <response>third</response>")
+    write_conversation(workdir / 'conversation_b.json', "No conclusions here")
+
+    run = process_conversations(['conversation_a.json', 'conversation_b.json'])
+
+    assert run == {'results': [('conversation_a.json', 'conversation_a_conclusions.txt', 3)],
+                   'processed': 2, 'skipped': 0}
+    assert (workdir / 'conversation_a_conclusions.txt').read_text(encoding='utf-8') == \
+        "1. first\n\n2. second\n\n3. third\n\n"
+    assert not (workdir / 'conversation_b_conclusions.txt').exists()
+
+
+
+def test_progress_reports_files_without_conclusions(workdir, capsys):
+    write_conversation(workdir / 'conversation_a.json', "<response>one</response>")
+    write_conversation(workdir / 'conversation_b.json', "No conclusions here")
+
+    seen = []
+    process_conversations(['conversation_a.json', 'conversation_b.json'],
+                          progress=lambda done, total, **detail: seen.append((done, total, detail)))
+    assert seen == [
+        (1, 2, {'source': 'conversation_a.json', 'output': 'conversation_a_conclusions.txt', 'count': 1}),
+        (2, 2, {'source': 'conversation_b.json', 'output': 'conversation_b_conclusions.txt', 'count': 0}),
+    ]
+
+    # The CLI prints them as it did before the manifest and worker pool
+    cli = runpy.run_path(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                      'biographer', 'conclusions.py'))
+    cli['process_all_conversations'](force=True)
+    assert "No conclusions found in conversation_b.json" in capsys.readouterr().out
+
+
+def test_biography_summary_header(workdir):
+    write_conversation(workdir / 'biographer_story_a.json', "<response>one</response>")
+
+    process_conversations(['biographer_story_a.json'], suffix='_biography_summary.txt',
+                          header=BIOGRAPHY_SUMMARY_HEADER)
+
+    assert (workdir / 'biographer_story_a_biography_summary.txt').read_text(encoding='utf-8') == \
+        "BIOGRAPHICAL STORY SUMMARY\n" + "=" * 50 + "\n\n1. one\n\n"
+
+
+def test_manifest_skips_unchanged_files(workdir):
+    write_conversation(workdir / 'conversation_a.json', "<response>one</response>")
+    write_conversation(workdir / 'conversation_b.json', "<response>two</response>")
+
+    first = process_conversations(['conversation_a.json', 'conversation_b.json'], manifest=ConclusionsManifest())
+    assert (first['processed'], first['skipped']) == (2, 0)
+
+    write_conversation(workdir / 'conversation_b.json', "<response>two</response>", "<response>more</response>")
+    second = process_conversations(['conversation_a.json', 'conversation_b.json'], manifest=ConclusionsManifest())
+    assert (second['processed'], second['skipped']) == (1, 1)
+    assert second['results'] == [('conversation_b.json', 'conversation_b_conclusions.txt', 2)]
+
+    forced = process_conversations(['conversation_a.json', 'conversation_b.json'], manifest=ConclusionsManifest(),
+                                   force=True)
+    assert (forced['processed'], forced['skipped']) == (2, 0)
+
+
+def test_touched_file_with_same_content_is_skipped(workdir):
+    write_conversation(workdir / 'conversation_a.json', "<response>one</response>")
+    process_conversations(['conversation_a.json'], manifest=ConclusionsManifest())
+
+    os.utime(workdir / 'conversation_a.json', ns=(1, 1))
+    run = process_conversations(['conversation_a.json'], manifest=ConclusionsManifest())
+
+    assert (run['processed'], run['skipped']) == (0, 1)
+
+
+def test_missing_output_is_regenerated(workdir):
+    write_conversation(workdir / 'conversation_a.json', "<response>one</response>")
+    process_conversations(['conversation_a.json'], manifest=ConclusionsManifest())
+
+    os.remove(workdir / 'conversation_a_conclusions.txt')
+    run = process_conversations(['conversation_a.json'], manifest=ConclusionsManifest())
+
+    assert run['processed'] == 1
+    assert (workdir / 'conversation_a_conclusions.txt').exists()
+
+
+def test_iter_messages_matches_json_load(workdir, monkeypatch):
+    history = [{"role": "user", "content": "ünïcode " * 50 + str(i), "n": [1, 2, {"x": None}]} for i in range(40)]
+    path = workdir / 'conversation_big.json'
+    path.write_text(json.dumps(history, indent=2, ensure_ascii=False), encoding='utf-8')
+    monkeypatch.setattr(conclusions, 'CHUNK_SIZE', 7)
+
+    digest = hashlib.sha256()
+    assert list(iter_messages(str(path), digest)) == history
+    assert digest.hexdigest() == hashlib.sha256(path.read_bytes()).hexdigest()
+
+    (workdir / 'empty.json').write_text(' [ ] ')
+    assert list(iter_messages(str(workdir / 'empty.json'))) == []
+
+    (workdir / 'torn.json').write_text('[{"role": "user"')
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_messages(str(workdir / 'torn.json')))
+
+
+def test_process_pool_output_is_identical(workdir):
+    files = []
+    for i in range(12):
+        write_conversation(workdir / f'conversation_{i:02}.json', *[f"<response>{i}-{j}</response>" for j in range(i % 4)])
+        files.append(f'conversation_{i:02}.json')
+
+    serial = process_conversations(files, manifest=ConclusionsManifest('serial.json'))
+    serial_outputs = {f: open(f, encoding='utf-8').read() for _, f, _ in serial['results']}
+    parallel = process_conversations(files, manifest=ConclusionsManifest('parallel.json'), workers=3)
+
+    assert parallel['results'] == serial['results']
+    assert {f: open(f, encoding='utf-8').read() for _, f, _ in parallel['results']} == serial_outputs
+    with open('serial.json') as a, open('parallel.json') as b:
+        assert json.load(a) == json.load(b)
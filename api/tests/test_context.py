@@ -0,0 +1,88 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from envelope.context import SUMMARY_HEADER, RollingContext, strip_responses
+from envelope.accounting import record_turn
+
+
+def interview(turns):
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"Answer {i} " + "detail " * 50})
+        history.append({"role": "assistant", "content": f"Thanks. <response>Note {i}</response> Question {i + 1}?"})
+    history.append({"role": "user", "content": "Latest answer"})
+    return history
+
+
+def summarize(summary, messages):
+    return (summary + " " + " ".join(m['content'][:8] for m in messages if m['role'] == 'user')).strip()
+
+
+def test_strip_responses():
+    assert strip_responses("Thanks. <response>A\nnote</response>  Next?") == "Thanks. Next?"
+    assert strip_responses("No notes") == "No notes"
+
+
+def test_short_session_is_sent_verbatim_without_notes():
+    context = RollingContext(summarize, keep_turns=3, batch_turns=2)
+    conversation = {'history': interview(3)}
+
+    messages = context.messages('s1', conversation)
+
+    assert [m['role'] for m in messages] == [m['role'] for m in conversation['history']]
+    assert messages[1]['content'] == "Thanks. Question 1?"
+    assert context.pending('s1') is None
+    # A reply of nothing but notes (the final wrap-up) is left alone
+    wrap_up = {'history': [{"role": "user", "content": "Done"},
+                           {"role": "assistant", "content": "<response>All notes</response>"},
+                           {"role": "user", "content": "Bye"}]}
+    assert context.messages('s2', wrap_up)[1]['content'] == "<response>All notes</response>"
+
+
+def test_older_turns_are_folded_into_the_summary():
+    context = RollingContext(summarize, keep_turns=3, batch_turns=2)
+    conversation = {'history': interview(5)}
+    raw = [dict(m) for m in conversation['history']]
+
+    # 6 turns (5 answered plus the new one): the first 3 are summarised in the background
+    assert len(context.messages('s1', conversation)) == len(raw)
+    context.pending('s1').result(timeout=5)
+
+    conversation['history'].append({"role": "assistant", "content": "Got it."})
+    conversation['history'].append({"role": "user", "content": "One more"})
+    messages = context.messages('s1', conversation, system="Be brief")
+
+    assert conversation['history'][:len(raw)] == raw
+    assert conversation['context']['summarized'] == 6
+    assert conversation['context']['summary'] == "Answer 0 Answer 1 Answer 2"
+    assert messages[0]['role'] == 'user'
+    assert messages[0]['content'][0]['text'] == f"{SUMMARY_HEADER}\nAnswer 0 Answer 1 Answer 2"
+    assert messages[0]['content'][1]['text'] == conversation['history'][6]['content']
+    assert len(messages) == len(conversation['history']) - 6
+    assert conversation['context']['sent_tokens'] < conversation['context']['history_tokens']
+
+    record = record_turn(conversation, None, None)
+    assert record['history_tokens'] > record['sent_tokens']
+
+
+def test_failed_summary_keeps_turns_verbatim():
+    def failing(summary, messages):
+        raise RuntimeError("overloaded")
+
+    context = RollingContext(failing, keep_turns=2, batch_turns=1)
+    conversation = {'history': interview(4)}
+
+    context.messages('s1', conversation)
+    context.pending('s1').exception(timeout=5)
+    messages = context.messages('s1', conversation)
+
+    assert conversation['context']['summarized'] == 0
+    assert len(messages) == len(conversation['history'])
+
+
+def test_disabled_sends_the_history():
+    conversation = {'history': interview(20)}
+
+    assert RollingContext(summarize, enabled=False).messages('s1', conversation) is conversation['history']
+    assert 'context' not in conversation
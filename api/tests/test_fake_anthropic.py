@@ -0,0 +1,48 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import time
+import urllib.request
+
+import pytest
+
+from envelope.fake_anthropic import FakeAnthropicServer, make_reply, split_tokens
+
+
+def test_make_reply_has_the_requested_length():
+    assert len(split_tokens(make_reply(120))) == 120
+    assert make_reply(120).endswith("What happened next?")
+
+
+def test_injected_errors_and_stats():
+    anthropic = pytest.importorskip("anthropic")
+    kwargs = dict(model='fake-model', max_tokens=10, messages=[{"role": "user", "content": "Hi"}])
+
+    with FakeAnthropicServer(error_rate=0.5, error_status=529, seed=3) as server:
+        client = anthropic.Anthropic(api_key='test', base_url=server.base_url, max_retries=0)
+        outcomes = []
+        for _ in range(20):
+            try:
+                client.messages.create(**kwargs)
+                outcomes.append('ok')
+            except anthropic.APIStatusError as e:
+                assert e.status_code == 529
+                outcomes.append('error')
+
+        with urllib.request.urlopen(f"{server.base_url}/stats") as response:
+            stats = json.load(response)
+
+    assert stats == {'requests': 20, 'errors': outcomes.count('error')}
+    assert 0 < outcomes.count('error') < 20
+
+
+def test_jitter_scales_the_delays():
+    server = FakeAnthropicServer(jitter=0.5, seed=1)
+    started = time.perf_counter()
+    for _ in range(5):
+        server.delay(0.02)
+    elapsed = time.perf_counter() - started
+    assert 0.05 <= elapsed < 0.2
+    server.httpd.server_close()
@@ -0,0 +1,133 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sqlite3
+import threading
+import time
+
+from flask import Flask, request
+
+from envelope.jobs import JobQueue, serve_jobs, submit_job
+
+
+def wait_for(queue, job_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job['status'] not in ('queued', 'running'):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_jobs_run_in_the_background_and_keep_their_results(tmp_path):
+    def count(params, progress):
+        for i in range(params['n']):
+            progress(i + 1, params['n'])
+        return {'counted': params['n']}
+
+    path = str(tmp_path / 'jobs.sqlite3')
+    queue = JobQueue(path)
+    queue.register('count', count)
+    queue.register('fail', lambda params, progress: 1 / 0)
+
+    job, created = queue.submit('count', {'n': 3})
+    assert created and job['status'] in ('queued', 'running')
+    done = wait_for(queue, job['job_id'])
+    assert done['status'] == 'done' and done['progress'] == {'done': 3, 'total': 3}
+    assert queue.result(job['job_id']) == {'counted': 3}
+
+    failed = wait_for(queue, queue.submit('fail', {})[0]['job_id'])
+    assert failed['status'] == 'failed' and 'division by zero' in failed['error']
+    assert queue.result(failed['job_id']) is None
+    queue.shutdown()
+
+    # Another queue on the same table (a restart, or another worker process) reads the same jobs
+    assert JobQueue(path).result(job['job_id']) == {'counted': 3}
+
+
+def test_identical_submissions_share_a_job(tmp_path):
+    release = threading.Event()
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'))
+    queue.register('wait', lambda params, progress: release.wait(5) and params)
+
+    first, created = queue.submit('wait', {'a': 1, 'b': 2})
+    again, created_again = queue.submit('wait', {'b': 2, 'a': 1})
+    other, created_other = queue.submit('wait', {'a': 2, 'b': 2})
+    assert created and not created_again and created_other
+    assert again['job_id'] == first['job_id'] != other['job_id']
+
+    release.set()
+    wait_for(queue, other['job_id'])
+    # Once finished, the same parameters start a new job
+    assert queue.submit('wait', {'a': 1, 'b': 2})[1]
+    queue.shutdown()
+
+
+def test_shutdown_cancels_queued_and_running_jobs(tmp_path):
+    started = threading.Event()
+
+    def slow(params, progress):
+        started.set()
+        for i in range(500):
+            time.sleep(0.01)
+            progress(i + 1, 500)
+        return {}
+
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'))
+    queue.register('slow', slow)
+    running, _ = queue.submit('slow', {'n': 1})
+    queued, _ = queue.submit('slow', {'n': 2})
+    assert started.wait(5)
+
+    began = time.monotonic()
+    queue.shutdown(timeout=5)
+    assert time.monotonic() - began < 1
+
+    assert queue.get(running['job_id'])['status'] == 'cancelled'
+    assert queue.get(queued['job_id'])['status'] == 'cancelled'
+    assert queue.get(queued['job_id'])['error'] == 'Cancelled at shutdown'
+
+
+def test_jobs_of_a_dead_process_are_marked_failed(tmp_path):
+    path = str(tmp_path / 'jobs.sqlite3')
+    queue = JobQueue(path)
+    queue.register('noop', lambda params, progress: {})
+    queue.get('setup')
+    conn = sqlite3.connect(path)
+    host = queue.owner.split(':')[0]
+    conn.execute("INSERT INTO jobs (id, kind, key, params, status, owner, created_at) "
+                 "VALUES ('lost', 'noop', 'k', '{}', 'running', ?, 0)", (f"{host}:999999999",))
+    conn.commit()
+
+    job = JobQueue(path).get('lost')
+    assert job['status'] == 'failed' and job['error'].startswith('Interrupted')
+
+
+def test_job_routes(tmp_path):
+    release = threading.Event()
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'))
+    queue.register('echo', lambda params, progress: release.wait(5) and {'echo': params['value']})
+    app = Flask(__name__)
+
+    @app.route('/run', methods=['POST'])
+    def run():
+        return submit_job(queue, 'echo', request.get_json())
+
+    serve_jobs(app, queue, '/api/jobs')
+    client = app.test_client()
+
+    submitted = client.post('/run', json={'value': 'hi'})
+    assert submitted.status_code == 202
+    job = submitted.get_json()
+    assert job['status_url'] == f"/api/jobs/{job['job_id']}" and job['deduplicated'] is False
+    assert client.post('/run', json={'value': 'hi'}).get_json()['deduplicated'] is True
+    assert client.get(job['result_url']).status_code == 202
+
+    release.set()
+    wait_for(queue, job['job_id'])
+    assert client.get(job['status_url']).get_json()['status'] == 'done'
+    assert client.get(job['result_url']).get_json() == {'echo': 'hi'}
+    assert client.get('/api/jobs/unknown').status_code == 404
+    queue.shutdown()
@@ -0,0 +1,83 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import threading
+
+from envelope.journal import ConversationJournal, compact_journal, compact_journals, read_journal
+
+
+def test_append_seal_and_compact(tmp_path):
+    journal = ConversationJournal(str(tmp_path / 'journals'))
+    journal.append('conversation_a', {"role": "user", "content": "Hi"}, sync=False)
+    journal.append('conversation_a', {"role": "assistant", "content": "Héllo"})
+
+    journal.seal('conversation_a')
+    written = compact_journals(journal.directory, str(tmp_path))
+
+    assert written == [str(tmp_path / 'conversation_a.json')]
+    with open(written[0], encoding='utf-8') as f:
+        assert json.load(f) == [{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Héllo"}]
+    assert os.listdir(journal.directory) == []
+
+
+def test_compaction_skips_open_journals_unless_asked(tmp_path):
+    journal = ConversationJournal(str(tmp_path / 'journals'))
+    journal.append('conversation_open', {"role": "user", "content": "Hi"})
+
+    assert compact_journals(journal.directory, str(tmp_path)) == []
+    assert compact_journals(journal.directory, str(tmp_path), include_open=True) == [
+        str(tmp_path / 'conversation_open.json')]
+    # Open journals are kept so the session can carry on
+    assert os.path.exists(journal.path('conversation_open'))
+
+
+def test_sealing_empty_session_produces_empty_transcript(tmp_path):
+    journal = ConversationJournal(str(tmp_path / 'journals'))
+    journal.seal('biographer_story_bio_x')
+
+    written = compact_journals(journal.directory, str(tmp_path))
+
+    with open(written[0], encoding='utf-8') as f:
+        assert json.load(f) == []
+
+
+def test_torn_last_line_is_ignored(tmp_path):
+    path = tmp_path / 'x.jsonl'
+    path.write_text('{"role": "user", "content": "Hi"}\n{"role": "assis', encoding='utf-8')
+
+    assert read_journal(str(path)) == [{"role": "user", "content": "Hi"}]
+
+
+def test_concurrent_appends_are_all_durable(tmp_path):
+    journal = ConversationJournal(str(tmp_path / 'journals'))
+
+    def worker(n):
+        for i in range(50):
+            journal.append(f'conversation_{n}', {"role": "user", "content": str(i)})
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    for n in range(8):
+        history = read_journal(journal.path(f'conversation_{n}'))
+        assert [m['content'] for m in history] == [str(i) for i in range(50)]
+
+
+def test_compact_one_sealed_journal(tmp_path):
+    journal = ConversationJournal(str(tmp_path / 'journals'))
+    journal.append('conversation_a', {"role": "user", "content": "Hi"})
+    journal.append('conversation_b', {"role": "user", "content": "Bye"})
+    journal.seal('conversation_a')
+    journal.seal('conversation_b')
+
+    assert compact_journal(journal.directory, 'conversation_a', str(tmp_path)) == str(tmp_path / 'conversation_a.json')
+    with open(tmp_path / 'conversation_a.json', encoding='utf-8') as f:
+        assert json.load(f) == [{"role": "user", "content": "Hi"}]
+    # Only that session's journal is written out
+    assert os.listdir(journal.directory) == ['conversation_b.sealed.jsonl']
+    assert compact_journal(journal.directory, 'conversation_a', str(tmp_path)) is None
@@ -0,0 +1,141 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import threading
+
+import pytest
+from flask import Flask, jsonify
+
+from envelope import metrics
+from envelope.fake_anthropic import FakeAnthropicServer
+from envelope.metrics import Counter, Gauge, Histogram, Registry, instrument_app, instrument_client, llm_call
+from envelope.sessions import MemorySessionStore
+
+
+def test_text_format():
+    registry = Registry()
+    requests = Counter('requests_total', 'Requests', ['route'], registry=registry)
+    latency = Histogram('latency_seconds', 'Latency', ['route'], buckets=(0.1, 1.0), registry=registry)
+    Gauge('sessions_active', 'Sessions', function=lambda: 3, registry=registry)
+
+    requests.inc('/chat')
+    requests.inc('/chat', amount=2)
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value, '/chat')
+
+    assert registry.render().splitlines() == [
+        '# HELP requests_total Requests',
+        '# TYPE requests_total counter',
+        'requests_total{route="/chat"} 3',
+        '# HELP latency_seconds Latency',
+        '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{route="/chat",le="0.1"} 1',
+        'latency_seconds_bucket{route="/chat",le="1"} 2',
+        'latency_seconds_bucket{route="/chat",le="+Inf"} 3',
+        'latency_seconds_sum{route="/chat"} 5.55',
+        'latency_seconds_count{route="/chat"} 3',
+        '# HELP sessions_active Sessions',
+        '# TYPE sessions_active gauge',
+        'sessions_active 3',
+    ]
+
+
+def test_updates_from_many_threads_are_not_lost():
+    registry = Registry()
+    counter = Counter('c_total', 'c', registry=registry)
+    histogram = Histogram('h_seconds', 'h', registry=registry)
+
+    def work():
+        for _ in range(10000):
+            counter.inc()
+            histogram.observe(0.01)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert counter.value() == 80000
+    assert histogram.count() == 80000
+
+
+def test_instrumented_clients_time_every_call():
+    anthropic = pytest.importorskip("anthropic")
+    before = metrics.LLM_DURATION.count('fake-model')
+    errors = metrics.LLM_ERRORS.value('fake-model')
+    kwargs = dict(model='fake-model', max_tokens=10, messages=[{"role": "user", "content": "Hi"}])
+
+    with FakeAnthropicServer() as server:
+        client = instrument_client(anthropic.Anthropic(api_key='test', base_url=server.base_url))
+        client.messages.create(**kwargs)
+        with client.messages.stream(**kwargs) as stream:
+            assert "".join(stream.text_stream)
+
+        async def use_async():
+            async_client = instrument_client(anthropic.AsyncAnthropic(api_key='test', base_url=server.base_url))
+            await async_client.messages.create(**kwargs)
+            async with async_client.messages.stream(**kwargs) as stream:
+                async for _ in stream.text_stream:
+                    pass
+        asyncio.run(use_async())
+
+    broken = instrument_client(anthropic.Anthropic(api_key='test', base_url=server.base_url, max_retries=0))
+    with pytest.raises(anthropic.APIConnectionError):
+        broken.messages.create(**kwargs)
+
+    assert metrics.LLM_DURATION.count('fake-model') == before + 5
+    assert metrics.LLM_ERRORS.value('fake-model') == errors + 1
+    assert metrics.LLM_IN_FLIGHT.value() == 0
+
+
+def test_abandoned_stream_is_not_an_error():
+    errors = metrics.LLM_ERRORS.value('abandoned-model')
+    before = metrics.LLM_DURATION.count('abandoned-model')
+
+    def reply():
+        with llm_call('abandoned-model'):
+            yield "Hello"
+            yield "world"
+
+    # What happens to a streamed response when the client goes away
+    chunks = reply()
+    next(chunks)
+    chunks.close()
+
+    with pytest.raises(ValueError):
+        with llm_call('abandoned-model'):
+            raise ValueError("bad request")
+
+    assert metrics.LLM_DURATION.count('abandoned-model') == before + 2
+    assert metrics.LLM_ERRORS.value('abandoned-model') == errors + 1
+    assert metrics.LLM_IN_FLIGHT.value() == 0
+
+
+def test_instrumented_app_records_routes_and_serves_metrics():
+    app = Flask(__name__)
+    sessions = MemorySessionStore()
+    sessions['s1'] = {'history': [{"role": "user", "content": "Hi"}]}
+
+    @app.route('/items/<item_id>', methods=['GET'])
+    def item(item_id):
+        return jsonify({'id': item_id})
+
+    instrument_app(app, sessions)
+    before = metrics.HTTP_DURATION.count('/items/<item_id>', 'GET', '200')
+    client = app.test_client()
+
+    client.get('/items/1')
+    client.get('/items/2')
+    client.get('/nowhere')
+    response = client.get('/metrics')
+
+    assert metrics.HTTP_DURATION.count('/items/<item_id>', 'GET', '200') == before + 2
+    assert metrics.HTTP_DURATION.count('unmatched', 'GET', '404') >= 1
+    assert response.content_type == metrics.CONTENT_TYPE
+    text = response.get_data(as_text=True)
+    assert 'sessions_active 1' in text
+    assert f"sessions_bytes {sessions.nbytes()}" in text
+    assert 'http_request_duration_seconds_bucket{route="/items/<item_id>",method="GET",status="200",le="+Inf"}' in text
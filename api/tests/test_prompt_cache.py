@@ -0,0 +1,78 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+
+import pytest
+
+from envelope.fake_anthropic import FakeAnthropicServer, DEFAULT_REPLY
+from envelope.accounting import record_turn
+from envelope.prompt_cache import EPHEMERAL, PromptCache, create_prompt_cache
+from envelope.streaming import stream_chat
+
+SYSTEM = "You are an interviewer. " * 200
+
+
+def test_request_marks_system_and_last_message():
+    history = [{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hello"},
+               {"role": "user", "content": "I grew up by the sea"}]
+
+    request = PromptCache().request(SYSTEM, history)
+
+    assert request['system'] == [{'type': 'text', 'text': SYSTEM, 'cache_control': EPHEMERAL}]
+    assert request['messages'][:2] == history[:2]
+    assert request['messages'][-1] == {"role": "user", "content": [
+        {'type': 'text', 'text': "I grew up by the sea", 'cache_control': EPHEMERAL}]}
+    # The stored history is left as plain strings
+    assert history[-1]['content'] == "I grew up by the sea"
+
+
+def test_request_options(monkeypatch):
+    history = [{"role": "user", "content": "Hi"}]
+
+    assert PromptCache(enabled=False).request(SYSTEM, history) == {'system': SYSTEM, 'messages': history}
+    assert PromptCache(cache_history=False).request(SYSTEM, history)['messages'] == history
+    monkeypatch.setenv('PROMPT_CACHE', '0')
+    assert not create_prompt_cache().enabled
+
+
+def test_second_turn_reads_the_cache():
+    anthropic = pytest.importorskip("anthropic")
+    prompt_cache = PromptCache()
+    conversation = {'history': []}
+
+    with FakeAnthropicServer() as server:
+        client = anthropic.Anthropic(api_key="test", base_url=server.base_url)
+        for text in ["Hi", "Tell me about school"]:
+            conversation['history'].append({"role": "user", "content": text})
+            message = client.messages.create(model='m', max_tokens=10,
+                                             **prompt_cache.request(SYSTEM, conversation['history']))
+            conversation['history'].append({"role": "assistant", "content": message.content[0].text})
+            record_turn(conversation, message, None)
+
+    sent = server.requests[1]
+    assert sent['system'][0]['cache_control'] == {'type': 'ephemeral'}
+    assert sent['messages'][-1]['content'][-1]['cache_control'] == {'type': 'ephemeral'}
+    assert [m['content'] for m in sent['messages'][:2]] == ["Hi", DEFAULT_REPLY]
+
+    first, second = conversation['usage']
+    assert first['cache_read_input_tokens'] == 0 and first['cache_creation_input_tokens'] > len(SYSTEM) // 4
+    # Everything up to the first turn's message is read back; only the new turn is written
+    assert second['cache_read_input_tokens'] == first['cache_creation_input_tokens']
+    assert 0 < second['cache_creation_input_tokens'] < first['cache_creation_input_tokens']
+
+
+def test_stream_reports_usage():
+    anthropic = pytest.importorskip("anthropic")
+    conversation = {'history': [{"role": "user", "content": "Hi"}]}
+
+    with FakeAnthropicServer() as server:
+        client = anthropic.Anthropic(api_key="test", base_url=server.base_url)
+        chunks = list(stream_chat(client, conversation, 'abc', model='m', max_tokens=10,
+                                  **PromptCache().request(SYSTEM, conversation['history'])))
+
+    done = json.loads(chunks[-1].split('data: ', 1)[1])
+    assert done['usage'] == conversation['usage'][0]
+    assert done['usage']['cache_creation_input_tokens'] > 0
+    assert server.requests[0]['messages'][0]['content'][0]['cache_control'] == {'type': 'ephemeral'}
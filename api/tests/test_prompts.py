@@ -0,0 +1,110 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+import pytest
+
+from envelope import prompts
+from envelope.questions import load_questions
+
+
+@pytest.fixture
+def sources(tmp_path, monkeypatch):
+    (tmp_path / 'template.txt').write_text("Ask these:\n{{QUESTIONS_LIST}}\nThanks", encoding='utf-8')
+    (tmp_path / 'questions.csv').write_text("Category,Field,Question\nLife,Home,Where did you live?\n",
+                                            encoding='utf-8')
+    monkeypatch.setattr(prompts, 'API_DIR', str(tmp_path))
+    monkeypatch.setattr(prompts, 'VARIANTS', {'test': ('template.txt', 'questions.csv')})
+    return tmp_path
+
+
+def render_calls(monkeypatch):
+    calls = []
+    render = prompts.render_prompt
+    monkeypatch.setattr(prompts, 'render_prompt', lambda name: calls.append(name) or render(name))
+    return calls
+
+
+def test_built_artifact_is_served(sources, monkeypatch):
+    artifacts = str(sources / 'prompts')
+    manifest = prompts.build_prompts(artifacts)
+    entry = manifest['variants']['test']
+    expected = "Ask these:\nCategory: Life, Field: Home, Question: Where did you live?\nThanks"
+
+    assert entry['file'] == f"test.{entry['sha256'][:16]}.txt"
+    assert set(entry['sources']) == {'template.txt', 'questions.csv'}
+
+    calls = render_calls(monkeypatch)
+    assert prompts.load_prompt('test', artifacts) == expected
+    # A newer mtime alone (e.g. a fresh checkout) does not make the artifact stale
+    os.utime(sources / 'questions.csv', (2 ** 31, 2 ** 31))
+    assert prompts.load_prompt('test', artifacts) == expected
+    assert calls == []
+
+
+def test_changed_source_falls_back_to_live_rendering(sources, monkeypatch):
+    artifacts = str(sources / 'prompts')
+    prompts.build_prompts(artifacts)
+    with open(sources / 'questions.csv', 'a', encoding='utf-8') as f:
+        f.write("Life,Work,What was your first job?\n")
+    os.utime(sources / 'questions.csv', (2 ** 31, 2 ** 31))
+
+    calls = render_calls(monkeypatch)
+    assert "first job" in prompts.load_prompt('test', artifacts)
+    assert calls == ['test']
+
+    # Rebuilding replaces the artifact and removes the old one
+    old = set(os.listdir(artifacts))
+    prompts.build_prompts(artifacts)
+    assert len(os.listdir(artifacts)) == 2 and set(os.listdir(artifacts)) != old
+
+
+def test_corrupt_or_missing_artifact_falls_back(sources, monkeypatch):
+    artifacts = sources / 'prompts'
+    assert prompts.load_artifact('test', str(artifacts)) is None
+
+    entry = prompts.build_prompts(str(artifacts))['variants']['test']
+    (artifacts / entry['file']).write_text("tampered", encoding='utf-8')
+
+    assert prompts.load_artifact('test', str(artifacts)) is None
+    assert prompts.load_prompt('test', str(artifacts)).startswith("Ask these:")
+
+
+def test_small_bank_is_served_from_the_artifact_alone(sources, monkeypatch):
+    artifacts = str(sources / 'prompts')
+    entry = prompts.build_prompts(artifacts)['variants']['test']
+    assert entry['groups'] == {'Category': 1, 'Field': 1}
+
+    def unexpected(*args):
+        raise AssertionError("sources read for a bank too small to slice")
+
+    monkeypatch.setattr(prompts, 'load_bank', unexpected)
+    monkeypatch.setattr(prompts, 'load_template', unexpected)
+    sliced = prompts.SlicedPrompt('test', directory=artifacts)
+    assert sliced.bank is None and not sliced.slicing
+    assert sliced.for_history([]) == sliced.full
+
+
+def test_large_bank_is_sliced(sources):
+    with open(sources / 'questions.csv', 'a', encoding='utf-8') as f:
+        f.write("Work,Job,What was your first job?\nLove,Partner,How did you meet?\n")
+    artifacts = str(sources / 'prompts')
+    assert prompts.build_prompts(artifacts)['variants']['test']['groups']['Category'] == 3
+
+    sliced = prompts.SlicedPrompt('test', directory=artifacts)
+    assert sliced.slicing and len(sliced.bank) == 3
+
+
+def test_committed_artifacts_are_current():
+    for name in prompts.VARIANTS:
+        assert prompts.load_artifact(name) == prompts.render_prompt(name), "run: python -m envelope.prompts build"
+
+
+def test_load_questions_rejoins_unquoted_commas(tmp_path):
+    path = tmp_path / 'questions.csv'
+    path.write_text("Category,Field,Question\nLife,Home,What smells, sounds, or tastes remind you of home?\n",
+                    encoding='utf-8')
+
+    assert load_questions(str(path)) == [{'Category': 'Life', 'Field': 'Home',
+                                         'Question': 'What smells, sounds, or tastes remind you of home?'}]
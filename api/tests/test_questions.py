@@ -0,0 +1,73 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from envelope import prompts
+from envelope.prompts import CONTINUATION_NOTE, SlicedPrompt
+from envelope.questions import QuestionBank
+
+QUESTIONS = [{'Category': category, 'Field': f'{category} {field}', 'Question': f'{category} question {i}'}
+             for category in 'ABC' for field in (1, 2) for i in range(2)]
+
+
+def answered(count):
+    history = []
+    for i in range(count):
+        history.append({'role': 'user', 'content': f'answer {i}'})
+        history.append({'role': 'assistant', 'content': f'Thanks <response>answer {i}</response> Next?'})
+    return history
+
+
+def test_groups_keep_csv_order_and_index_fields():
+    bank = QuestionBank(QUESTIONS)
+
+    assert [name for name, _ in bank.groups] == ['A', 'B', 'C']
+    assert len(bank.by_field[('B', 'B 2')]) == 2
+    assert len(QuestionBank(QUESTIONS, group_by='Field')) == 6
+
+
+def test_position_advances_as_groups_are_covered():
+    bank = QuestionBank(QUESTIONS)
+
+    # Half of a 4-question category has to be answered before moving on
+    assert [bank.position(answered(n)) for n in range(8)] == [0, 0, 1, 1, 2, 2, 2, 2]
+    assert bank.position(answered(1) + [{'role': 'user', 'content': '<response>typed by the user</response>'}]) == 0
+    assert bank.position(answered(4), coverage=1.0) == 1
+
+
+def test_slice_has_active_group_and_lookahead():
+    bank = QuestionBank(QUESTIONS)
+
+    assert {q['Category'] for q in bank.slice(0)} == {'A', 'B'}
+    assert {q['Category'] for q in bank.slice(2)} == {'C'}
+    assert bank.has_more(0) and not bank.has_more(1)
+
+
+@pytest.fixture
+def sources(tmp_path, monkeypatch):
+    (tmp_path / 'template.txt').write_text("<q>\n{{QUESTIONS_LIST}}\n</q>", encoding='utf-8')
+    lines = ["Category,Field,Question"] + [f"{q['Category']},{q['Field']},{q['Question']}" for q in QUESTIONS]
+    (tmp_path / 'questions.csv').write_text("\n".join(lines) + "\n", encoding='utf-8')
+    monkeypatch.setattr(prompts, 'API_DIR', str(tmp_path))
+    monkeypatch.setattr(prompts, 'ARTIFACT_DIR', str(tmp_path / 'prompts'))
+    monkeypatch.setattr(prompts, 'VARIANTS', {'test': ('template.txt', 'questions.csv')})
+
+
+def test_sliced_prompt_follows_the_session(sources):
+    sliced = SlicedPrompt('test')
+
+    first = sliced.for_history(answered(0))
+    assert 'A question 0' in first and 'B question 0' in first and 'C question' not in first
+    assert CONTINUATION_NOTE in first
+
+    last = sliced.for_history(answered(4))
+    assert 'A question' not in last and 'C question 1' in last
+    assert CONTINUATION_NOTE not in last
+    assert len(first) < len(sliced.full)
+
+
+def test_disabled_or_small_bank_sends_the_full_prompt(sources):
+    assert SlicedPrompt('test', enabled=False).for_history(answered(4)) == prompts.load_prompt('test')
+    assert SlicedPrompt('test', lookahead=2).for_history([]) == prompts.load_prompt('test')
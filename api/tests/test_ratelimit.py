@@ -0,0 +1,66 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from envelope import ratelimit
+from envelope.ratelimit import TokenBucket, call_with_retries, is_retryable
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+class ResponseError(Exception):
+    def __init__(self, response):
+        super().__init__("response error")
+        self.response = response
+
+
+class APIConnectionError(Exception):
+    pass
+
+
+def test_token_bucket_paces_calls():
+    bucket = TokenBucket(rate=50, capacity=1)
+    start = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    # The first call is free, the next five wait 1/50s each
+    assert time.monotonic() - start >= 0.09
+
+
+def test_retryable_errors():
+    assert is_retryable(StatusError(429))
+    assert is_retryable(StatusError(529))
+    assert is_retryable(ResponseError(SimpleNamespace(status_code=503)))
+    assert is_retryable(APIConnectionError())
+    assert not is_retryable(StatusError(400))
+    assert not is_retryable(ValueError())
+
+
+def test_call_with_retries(monkeypatch):
+    monkeypatch.setattr(ratelimit.time, 'sleep', lambda seconds: None)
+    failures = [StatusError(429), StatusError(500)]
+
+    def flaky():
+        if failures:
+            raise failures.pop(0)
+        return "ok"
+
+    assert call_with_retries(flaky, max_retries=2) == "ok"
+
+    failures[:] = [StatusError(429)] * 3
+    with pytest.raises(StatusError):
+        call_with_retries(flaky, max_retries=2)
+
+    failures[:] = [StatusError(400)]
+    with pytest.raises(StatusError):
+        call_with_retries(flaky, max_retries=5)
+    assert failures == []
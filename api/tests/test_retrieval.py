@@ -0,0 +1,36 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from envelope.retrieval import BM25Index, tokenize
+
+ANSWERS = [
+    "1. My earliest memory is the smell of oranges in my grandmother's kitchen.",
+    "2. We played marbles and hide and seek in the yard.",
+    "3. The house had a red roof and a small garden with oranges.",
+]
+
+
+def test_tokenize_drops_numbering_stopwords_and_suffixes():
+    assert tokenize("12. What games did you play as a child?") == ['game', 'play', 'child']
+
+
+def test_top_ranks_matching_answers():
+    index = BM25Index(ANSWERS)
+
+    assert [idx for idx, _ in index.top("What games did you play as a child?", k=2)] == [1]
+    assert [idx for idx, _ in index.top("Describe the garden and the oranges", k=3)][0] == 2
+    assert len(index.top("Describe the garden and the oranges", k=1)) == 1
+    assert index.top("Which university did you attend?", k=3) == []
+
+
+def test_min_score_filters_weak_matches():
+    index = BM25Index(ANSWERS)
+    scores = dict(index.top("oranges", k=3))
+
+    assert set(scores) == {0, 2}
+    assert index.top("oranges", k=3, min_score=max(scores.values())) == []
+
+
+def test_empty_index():
+    assert BM25Index([]).top("anything", k=3) == []
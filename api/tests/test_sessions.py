@@ -0,0 +1,164 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from envelope.journal import ConversationJournal
+from envelope.sessions import MemorySessionStore, SQLiteSessionStore, create_session_store
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def make_store(request, tmp_path):
+    def make(**kwargs):
+        if request.param == 'sqlite':
+            return SQLiteSessionStore(path=str(tmp_path / 'sessions.sqlite3'), sweep_interval=0, **kwargs)
+        return MemorySessionStore(**kwargs)
+    return make
+
+
+def conversation(text='hi'):
+    return {'history': [{"role": "user", "content": text}], 'started_at': 'now'}
+
+
+def test_put_get_pop(make_store):
+    store = make_store()
+    store['a'] = conversation()
+
+    assert 'a' in store
+    assert store.get('a') == conversation()
+    assert len(store) == 1
+    assert store.nbytes() > 0
+    assert store.pop('a') == conversation()
+    assert store.get('a') is None
+    assert len(store) == 0
+
+
+def test_lru_eviction_persists_sessions(make_store):
+    evicted = {}
+    store = make_store(max_entries=2, on_evict=lambda sid, conv: evicted.update({sid: conv}))
+
+    store['a'] = conversation('a')
+    time.sleep(0.01)
+    store['b'] = conversation('b')
+    time.sleep(0.01)
+    store.get('a')  # 'b' is now least recently used
+    time.sleep(0.01)
+    store['c'] = conversation('c')
+
+    assert set(evicted) == {'b'}
+    assert evicted['b'] == conversation('b')
+    assert store.get('a') is not None
+    assert store.get('c') is not None
+
+
+def test_byte_cap_evicts_oldest(make_store):
+    evicted = []
+    size = len('{"history": [{"role": "user", "content": "xxxxxxxxxx"}], "started_at": "now"}')
+    store = make_store(max_bytes=size * 2, on_evict=lambda sid, conv: evicted.append(sid))
+
+    for sid in ['a', 'b', 'c']:
+        store[sid] = conversation('x' * 10)
+        time.sleep(0.01)
+
+    assert evicted == ['a']
+    assert len(store) == 2
+
+
+def test_idle_sessions_expire(make_store):
+    evicted = []
+    store = make_store(idle_ttl=0.05, on_evict=lambda sid, conv: evicted.append(sid))
+    store['a'] = conversation()
+
+    time.sleep(0.1)
+
+    assert store.get('a') is None
+    assert evicted == ['a']
+
+
+def test_sweep_evicts_idle_sessions(make_store):
+    evicted = []
+    store = make_store(idle_ttl=0.05, on_evict=lambda sid, conv: evicted.append(sid))
+    store['a'] = conversation()
+    store['b'] = conversation()
+
+    time.sleep(0.1)
+    store.sweep()
+
+    assert sorted(evicted) == ['a', 'b']
+    assert len(store) == 0
+
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / 'sessions.sqlite3')
+    SQLiteSessionStore(path=path)['a'] = conversation()
+
+    assert SQLiteSessionStore(path=path).get('a') == conversation()
+
+
+def test_create_session_store_from_env(monkeypatch, tmp_path):
+    monkeypatch.setenv('SESSION_STORE', 'sqlite')
+    monkeypatch.setenv('SESSION_DB_PATH', str(tmp_path / 'sessions.sqlite3'))
+    monkeypatch.setenv('SESSION_MAX_ENTRIES', '5')
+
+    store = create_session_store()
+
+    assert isinstance(store, SQLiteSessionStore)
+    assert store.max_entries == 5
+
+
+def test_replace_if_present_does_not_revive_ended_sessions(make_store):
+    store = make_store()
+    store['a'] = conversation()
+
+    assert store.replace_if_present('a', conversation('again'))
+    assert store.get('a') == conversation('again')
+    store.pop('a')
+    assert not store.replace_if_present('a', conversation('late'))
+    assert store.get('a') is None and len(store) == 0
+
+
+def test_reply_arriving_after_end_is_dropped(monkeypatch, tmp_path):
+    monkeypatch.setenv('ANTHROPIC_API_KEY', 'test')
+    monkeypatch.setenv('JOURNAL_DIR', str(tmp_path / 'journals'))
+    monkeypatch.setenv('JOB_DB_PATH', str(tmp_path / 'jobs.sqlite3'))
+    monkeypatch.delenv('SESSION_STORE', raising=False)
+    # /end writes the transcript to the working directory
+    monkeypatch.chdir(tmp_path)
+    import index
+
+    in_flight = threading.Event()
+    release = threading.Event()
+
+    def create(**kwargs):
+        in_flight.set()
+        assert release.wait(5)
+        return SimpleNamespace(content=[SimpleNamespace(text="A late reply")], model='fake-model',
+                               stop_reason='end_turn', usage=None)
+
+    monkeypatch.setattr(index, 'journal', ConversationJournal(str(tmp_path / 'journals')))
+    monkeypatch.setattr(index, 'active_conversations', MemorySessionStore())
+    monkeypatch.setattr(index, 'get_client', lambda: SimpleNamespace(messages=SimpleNamespace(create=create)))
+    client = index.app.test_client()
+
+    session_id = client.post('/interviewer/start').get_json()['session_id']
+    replies = []
+    chat = threading.Thread(target=lambda: replies.append(
+        client.post('/interviewer/chat', json={'session_id': session_id, 'message': 'hi'})))
+    chat.start()
+    assert in_flight.wait(5)
+    assert client.post('/interviewer/end', json={'session_id': session_id}).status_code == 200
+    release.set()
+    chat.join(5)
+
+    assert replies[0].status_code == 200
+    assert session_id not in index.active_conversations
+    # No journal is left behind, and the transcript /end wrote has only the user's message
+    assert os.listdir(tmp_path / 'journals') == []
+    with open(tmp_path / f"conversation_{session_id}.json", encoding='utf-8') as f:
+        assert [message['role'] for message in json.load(f)] == ['user']
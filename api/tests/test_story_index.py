@@ -0,0 +1,137 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gc
+import json
+import time
+
+import pytest
+
+from envelope import story_index
+from envelope.story_index import MTIME_SETTLE_NS, StoryIndex
+
+
+def write_story(directory, name, messages):
+    path = directory / f"biographer_story_bio_{name}.json"
+    path.write_text(json.dumps([{"role": "user", "content": str(i)} for i in range(messages)]), encoding='utf-8')
+    return path
+
+
+@pytest.fixture
+def stories_dir(tmp_path):
+    directory = tmp_path / 'stories'
+    directory.mkdir()
+    return directory
+
+
+def test_lists_stories_with_message_counts(stories_dir):
+    write_story(stories_dir, '0101_1200_0001', 2)
+    write_story(stories_dir, '0101_1200_0002', 5)
+    (stories_dir / 'conversation_x.json').write_text('[]')
+
+    index = StoryIndex(str(stories_dir))
+    stories, total = index.query(sort='filename', order='asc')
+
+    assert total == 2
+    assert stories == [
+        {'filename': 'biographer_story_bio_0101_1200_0001.json', 'message_count': 2, 'session_info': ['bio', '0101']},
+        {'filename': 'biographer_story_bio_0101_1200_0002.json', 'message_count': 5, 'session_info': ['bio', '0101']},
+    ]
+
+
+def test_pagination_sort_and_filter(stories_dir):
+    for i in range(7):
+        write_story(stories_dir, f'0101_1200_000{i}', i)
+    index = StoryIndex(str(stories_dir))
+
+    page, total = index.query(page=2, page_size=3, sort='message_count', order='desc')
+    assert total == 7
+    assert [s['message_count'] for s in page] == [3, 2, 1]
+
+    page, total = index.query(min_messages=5)
+    assert total == 2
+
+    page, total = index.query(search='0003')
+    assert [s['message_count'] for s in page] == [3]
+
+    with pytest.raises(ValueError):
+        index.query(sort='bogus')
+
+
+def test_unchanged_stories_are_not_reparsed(stories_dir, monkeypatch):
+    write_story(stories_dir, '0101_1200_0001', 2)
+    index = StoryIndex(str(stories_dir))
+    index.query()
+
+    calls = []
+    original = index.record
+    monkeypatch.setattr(index, 'record', lambda *a, **k: calls.append(a) or original(*a, **k))
+    index.refresh(force=True)
+    index.query()
+
+    assert calls == []
+
+
+def test_detects_edits_and_deletions(stories_dir):
+    path = write_story(stories_dir, '0101_1200_0001', 2)
+    index = StoryIndex(str(stories_dir))
+    index.query()
+
+    write_story(stories_dir, '0101_1200_0001', 9)
+    stories, _ = index.query()
+    assert stories[0]['message_count'] == 9
+
+    path.unlink()
+    stories, total = index.query()
+    assert (stories, total) == ([], 0)
+
+
+def test_record_adds_newly_saved_story(stories_dir):
+    index = StoryIndex(str(stories_dir))
+    index.query()
+
+    path = write_story(stories_dir, '0101_1200_0001', 4)
+    index.record(str(path))
+
+    stories, total = index.query()
+    assert total == 1
+    assert stories[0]['message_count'] == 4
+
+
+def test_unchanged_directory_is_not_rescanned(stories_dir, monkeypatch):
+    write_story(stories_dir, '0101_1200_0001', 2)
+    index = StoryIndex(str(stories_dir))
+    # Old enough for the directory mtime to be trusted
+    os.utime(stories_dir, ns=(time.time_ns() - 10 * MTIME_SETTLE_NS,) * 2)
+
+    scans = []
+    scandir = os.scandir
+    monkeypatch.setattr(story_index.os, 'scandir', lambda path: scans.append(path) or scandir(path))
+    assert index.refresh() == 1
+    # The index's own database files (a connection closing and another one opening) do not count as changes
+    del index
+    gc.collect()
+    index = StoryIndex(str(stories_dir))
+    assert index.refresh() == 0
+    assert index.query()[1] == 1
+    assert len(scans) == 1
+
+
+def test_stories_route_pages_only_when_asked(stories_dir, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for name, path in (('JOURNAL_DIR', 'journals'), ('JOB_DB_PATH', 'jobs.sqlite3'),
+                       ('STORY_INDEX_PATH', 'stories.sqlite3')):
+        monkeypatch.setenv(name, str(tmp_path / path))
+    biographer = pytest.importorskip("biographer")
+    monkeypatch.setattr(biographer, 'story_index', StoryIndex(str(stories_dir), str(tmp_path / 'index.sqlite3')))
+    for i in range(3):
+        write_story(stories_dir, f'0101_1200_000{i}', i)
+    client = biographer.app.test_client()
+
+    # The frontend fetches the list without parameters and never pages
+    listing = client.get('/api/biographer/stories').get_json()
+    assert listing['total_count'] == 3 and len(listing['stories']) == 3 and 'page' not in listing
+
+    page = client.get('/api/biographer/stories?page_size=2').get_json()
+    assert len(page['stories']) == 2 and page['has_more']
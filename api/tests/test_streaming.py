@@ -0,0 +1,136 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from envelope.streaming import stream_chat, stream_progress
+from envelope.fake_anthropic import FakeAnthropicServer, DEFAULT_REPLY
+
+
+def parse_events(chunks):
+    events = []
+    for chunk in chunks:
+        event, data = chunk.strip().split('\n', 1)
+        events.append((event[len('event: '):], json.loads(data[len('data: '):])))
+    return events
+
+
+class StubStream:
+    def __init__(self, tokens, fail_after=None):
+        self.tokens = tokens
+        self.fail_after = fail_after
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @property
+    def text_stream(self):
+        for i, token in enumerate(self.tokens):
+            if self.fail_after is not None and i == self.fail_after:
+                raise RuntimeError("connection reset")
+            yield token
+
+    def get_final_message(self):
+        return SimpleNamespace(usage=SimpleNamespace(input_tokens=5, output_tokens=len(self.tokens)))
+
+
+class StubClient:
+    def __init__(self, tokens, fail_after=None):
+        self.calls = []
+        self.messages = self
+        self._stream = StubStream(tokens, fail_after)
+
+    def stream(self, **kwargs):
+        self.calls.append(kwargs)
+        return self._stream
+
+
+def test_stream_chat_relays_tokens_and_appends_reply():
+    conversation = {'history': [{"role": "user", "content": "Hi"}]}
+    client = StubClient(["Hello ", "there", "!"])
+
+    events = parse_events(stream_chat(client, conversation, 'abc', model='m', max_tokens=10))
+
+    assert [e for e, _ in events] == ['token', 'token', 'token', 'done']
+    assert "".join(d['text'] for e, d in events if e == 'token') == "Hello there!"
+    done = events[-1][1]
+    assert done['response'] == "Hello there!"
+    assert done['session_id'] == 'abc'
+    assert done['time_to_first_token_ms'] is not None
+    assert conversation['history'][-1] == {"role": "assistant", "content": "Hello there!"}
+    assert client.calls[0]['model'] == 'm'
+
+
+def test_stream_chat_error_leaves_history_untouched():
+    conversation = {'history': [{"role": "user", "content": "Hi"}]}
+    client = StubClient(["Hello ", "there"], fail_after=1)
+
+    events = parse_events(stream_chat(client, conversation, 'abc', model='m', max_tokens=10))
+
+    assert [e for e, _ in events] == ['token', 'error']
+    assert len(conversation['history']) == 1
+
+
+def test_stream_chat_against_fake_server():
+    anthropic = pytest.importorskip("anthropic")
+
+    with FakeAnthropicServer(first_token_delay=0.05) as server:
+        client = anthropic.Anthropic(api_key="test", base_url=server.base_url)
+        conversation = {'history': [{"role": "user", "content": "Hi"}]}
+
+        events = parse_events(stream_chat(client, conversation, 'abc', model='m', max_tokens=10, system='s'))
+
+    assert events[-1][0] == 'done'
+    assert events[-1][1]['response'] == DEFAULT_REPLY
+    assert events[-1][1]['time_to_first_token_ms'] >= 50
+    assert server.requests[0]['stream'] is True
+    assert conversation['history'][-1]['content'] == DEFAULT_REPLY
+
+
+def test_stream_progress_relays_reports_and_the_result():
+    def run(params, progress):
+        for i in range(params['n']):
+            progress(i + 1, params['n'], row=i)
+        return {'message': 'ok'}
+
+    events = parse_events(stream_progress(run, {'n': 3}, 'verdict'))
+    assert events == [('verdict', {'done': 1, 'total': 3, 'row': 0}),
+                      ('verdict', {'done': 2, 'total': 3, 'row': 1}),
+                      ('verdict', {'done': 3, 'total': 3, 'row': 2}),
+                      ('done', {'message': 'ok'})]
+
+    def fail(params, progress):
+        raise ValueError('no answers')
+
+    assert parse_events(stream_progress(fail, {}, error_prefix='Error during assessment')) == \
+        [('error', {'error': 'Error during assessment: no answers'})]
+
+
+def test_stream_progress_stops_the_work_when_the_client_goes():
+    reports = []
+    stopped = threading.Event()
+
+    def run(params, progress):
+        try:
+            for i in range(1000):
+                progress(i + 1, 1000)
+                reports.append(i)
+                time.sleep(0.001)
+        finally:
+            stopped.set()
+        return {}
+
+    events = stream_progress(run, {})
+    next(events)
+    events.close()
+    assert stopped.wait(5)
+    assert len(reports) < 1000
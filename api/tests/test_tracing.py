@@ -0,0 +1,130 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import pstats
+import time
+
+import pytest
+from flask import Flask, Response, jsonify, stream_with_context
+
+from envelope import tracing
+from envelope.tracing import NULL_SPAN, Profiling, Tracer, span, summarize_trace, trace_app
+
+
+def read_trace(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.fixture
+def tracer(tmp_path, monkeypatch):
+    tracer = Tracer(str(tmp_path / 'trace.jsonl'))
+    monkeypatch.setattr(tracing, 'TRACER', tracer)
+    return tracer
+
+
+def test_spans_nest_and_are_written_per_trace(tracer):
+    with span('request', route='/chat'):
+        with span('session_load'):
+            pass
+        with pytest.raises(KeyError):
+            with span('llm') as llm:
+                llm.set(model='m')
+                raise KeyError('boom')
+        assert not os.path.exists(tracer.path)
+    with span('request', route='/end'):
+        pass
+
+    records = read_trace(tracer.path)
+    assert [r['name'] for r in records] == ['request', 'llm', 'session_load', 'request']
+    root, llm, load, other = records
+    assert root['parent'] is None and root['route'] == '/chat'
+    assert llm['parent'] == load['parent'] == root['span']
+    assert llm['trace'] == load['trace'] == root['trace'] != other['trace']
+    assert llm['model'] == 'm' and llm['error'] == 'KeyError'
+    assert root['ms'] >= llm['ms'] + load['ms']
+    assert tracing.current_span() is NULL_SPAN
+
+    summary = summarize_trace(records)
+    assert set(summary) == {'/chat', '/end'}
+    assert summary['/chat']['llm']['count'] == 1
+    assert summary['/chat']['request']['max_ms'] == root['ms']
+
+
+def test_disabled_and_fast_traces_are_not_written(tmp_path, monkeypatch):
+    monkeypatch.setattr(tracing, 'TRACER', Tracer(None))
+    assert span('request') is NULL_SPAN
+
+    slow_only = Tracer(str(tmp_path / 'slow.jsonl'), min_ms=20)
+    monkeypatch.setattr(tracing, 'TRACER', slow_only)
+    with span('fast'):
+        pass
+    with span('slow'):
+        time.sleep(0.03)
+    assert [r['name'] for r in read_trace(slow_only.path)] == ['slow']
+
+
+def make_app(tmp_path, **profiling):
+    app = Flask(__name__)
+
+    @app.route('/chat', methods=['POST'])
+    def chat():
+        with span('llm'):
+            time.sleep(0.05)
+        return jsonify({'response': 'ok'})
+
+    @app.route('/stream', methods=['GET'])
+    def stream():
+        def events():
+            with span('llm'):
+                yield 'event: token\n\n'
+        return Response(stream_with_context(events()), mimetype='text/event-stream')
+
+    trace_app(app, Profiling(str(tmp_path / 'profiles'), **profiling))
+    return app
+
+
+def test_requests_are_traced_and_profiled_on_request(tracer, tmp_path):
+    client = make_app(tmp_path, token='secret', interval=0.001).test_client()
+
+    plain = client.post('/chat')
+    wrong_token = client.post('/chat', headers={'X-Profile': 'guess'})
+    profiled = client.post('/chat', headers={'X-Profile': 'secret'})
+    sampled = client.post('/chat', headers={'X-Profile': 'secret', 'X-Profile-Mode': 'sample'})
+
+    assert 'X-Profile-File' not in plain.headers and 'X-Profile-File' not in wrong_token.headers
+    profiles = tmp_path / 'profiles'
+    assert sorted(os.listdir(profiles)) == sorted([profiled.headers['X-Profile-File'],
+                                                   sampled.headers['X-Profile-File']])
+
+    prof = profiles / profiled.headers['X-Profile-File']
+    assert prof.name.endswith('_chat_' + profiled.headers['X-Trace-Id'] + '.prof')
+    assert any(name == 'chat' for _, _, name in pstats.Stats(str(prof)).stats)
+
+    with open(profiles / sampled.headers['X-Profile-File'], encoding='utf-8') as f:
+        stacks = [line.rsplit(' ', 1) for line in f]
+    assert stacks and all(int(count) > 0 for _, count in stacks)
+    assert any('chat (test_tracing.py' in stack for stack, _ in stacks)
+
+    records = read_trace(tracer.path)
+    roots = [r for r in records if r['name'] == 'request']
+    assert len(roots) == 4
+    assert {r['trace'] for r in roots} == {response.headers['X-Trace-Id']
+                                           for response in (plain, wrong_token, profiled, sampled)}
+    assert all(r['route'] == '/chat' and r['status'] == 200 for r in roots)
+    assert all(r['ms'] >= 50 for r in records if r['name'] == 'llm')
+
+
+def test_streamed_responses_are_traced_to_the_end_of_the_stream(tracer, tmp_path):
+    client = make_app(tmp_path, every_request=True).test_client()
+
+    response = client.get('/stream')
+    assert response.get_data(as_text=True) == 'event: token\n\n'
+    response.close()
+
+    root, llm = read_trace(tracer.path)
+    assert root['name'] == 'request' and llm['name'] == 'llm'
+    assert llm['parent'] == root['span'] and llm['trace'] == root['trace']
+    assert os.path.exists(tmp_path / 'profiles' / response.headers['X-Profile-File'])
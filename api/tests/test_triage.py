@@ -0,0 +1,37 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from envelope.triage import LocalClassifier, question_terms
+
+ANSWERS = [
+    "1. My earliest memory is sitting on the porch of the farmhouse with my grandmother while she shelled peas, "
+    "the smell of rain on the dust, the creak of the swing and the radio playing in the kitchen behind us on "
+    "summer evenings, with the dog asleep at our feet and my brother reading comics on the steps below.",
+    "2. We played marbles, but I don't remember the other games we played.",
+    "3. Our neighborhood was a row of brick houses near the mill.",
+]
+
+
+def test_question_boilerplate_is_not_content():
+    assert question_terms("Can you describe your earliest memory in detail?") == {"earliest"}
+    assert question_terms("What do you remember?") == set()
+
+
+def test_obvious_cases_are_settled_and_the_rest_escalated():
+    questions = [
+        "What is your earliest memory from childhood?",  # "earliest" + "childhood": half covered
+        "What is your earliest memory of the farmhouse porch?",  # fully covered by a long answer
+        "Did you have any pets as a child?",  # nothing in common with any answer
+        "What games did you play?",  # covered, but short and hedged
+        "What was your neighborhood like?",  # covered by a short answer
+        "What do you remember?",  # no content words at all
+    ]
+    verdicts = LocalClassifier().classify(questions, ANSWERS)
+    assert [verdict for verdict, _ in verdicts] == [None, "full answer", "0", None, None, None]
+    assert verdicts[1][1] == 1.0 and verdicts[2][1] == 1.0
+
+    # Lower thresholds settle more, and 0 turns a verdict off
+    assert LocalClassifier(zero_confidence=0.5).classify(questions[:1], ANSWERS) == [("0", 0.5)]
+    assert LocalClassifier(full_confidence=0.2).classify(questions[4:5], ANSWERS)[0][0] == "full answer"
+    assert [verdict for verdict, _ in LocalClassifier(0, 0).classify(questions, ANSWERS)] == [None] * 6
@@ -0,0 +1,35 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from envelope.verdict_cache import VerdictCache, verdict_key
+
+
+def test_key_covers_model_prompt_question_and_answers():
+    base = verdict_key('model', '1', 'Where were you born?', ['1. In Haifa', '2. In 1950'])
+
+    assert verdict_key('model', '1', ' Where were  you born?', ['1.  In Haifa ', '2. In\n1950']) == base
+    assert verdict_key('other', '1', 'Where were you born?', ['1. In Haifa', '2. In 1950']) != base
+    assert verdict_key('model', '2', 'Where were you born?', ['1. In Haifa', '2. In 1950']) != base
+    assert verdict_key('model', '1', 'When were you born?', ['1. In Haifa', '2. In 1950']) != base
+    assert verdict_key('model', '1', 'Where were you born?', ['1. In Haifa']) != base
+
+
+def test_get_and_put(tmp_path):
+    cache = VerdictCache(str(tmp_path / 'cache.sqlite3'))
+    cache.put_many([('a', 'full answer'), ('b', '0')])
+
+    assert cache.get_many(['a', 'b', 'c']) == {'a': 'full answer', 'b': '0'}
+    assert VerdictCache(str(tmp_path / 'cache.sqlite3')).get_many(['b']) == {'b': '0'}
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = VerdictCache(str(tmp_path / 'cache.sqlite3'), max_entries=3)
+    for key in 'abc':
+        cache.put_many([(key, '0')])
+    cache.get_many(['a'])
+
+    cache.put_many([('d', '0'), ('e', '0')])
+
+    assert len(cache) == 3
+    assert set(cache.get_many('abcde')) == {'a', 'd', 'e'}